@@ -0,0 +1,74 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+"""
+Benchmark masking of registrations and visits on the sample data
+(BALB_VPA_data_cohort_1): mask the data in consecutive bins (as
+get_registration_stats and get_ecohab_data_with_margin do) using binary
+search (DataBase._find_mask_indices) and a linear scan of the whole
+column (np.where, used before).
+
+Usage:
+   python benchmarks/mask_data.py [binsize in seconds]
+"""
+from __future__ import print_function, division, absolute_import
+import sys
+import time
+
+import numpy as np
+
+from pyEcoHAB import Loader, sample_data
+
+
+def linear_mask_indices(data_base, mask, column_name):
+    """Mask indices found by scanning the whole column"""
+    arr = np.array(data_base.columns[column_name])
+    starttime = data_base._raw_time(mask[0])
+    endtime = data_base._raw_time(mask[-1])
+    idcs = np.where((arr >= starttime) & (arr < endtime))[0]
+    if len(idcs):
+        return (idcs[0], idcs[-1] + 1)
+    return (0, 0)
+
+
+def bins(data, binsize):
+    return [(t, t + binsize) for t in np.arange(data.session_start,
+                                                data.session_end, binsize)]
+
+
+def benchmark(function, masks, repeat=3):
+    best = np.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        for mask in masks:
+            function(mask)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(binsize=600.):
+    data = Loader(sample_data, diagnostics=False)
+    masks = bins(data, binsize)
+    print("%d registrations, %d visits, %d bins of %g s" % (
+        len(data.registrations), len(data.visits), len(masks), binsize))
+    for name, data_base, column in [
+            ("registrations", data.registrations, "Time"),
+            ("visits", data.visits, "AbsStartTimecode")]:
+        for mask in masks:
+            assert linear_mask_indices(data_base, mask, column) ==\
+                data_base._find_mask_indices(mask, column)
+        linear = benchmark(lambda mask: linear_mask_indices(data_base,
+                                                            mask, column),
+                           masks)
+        binary = benchmark(lambda mask: data_base._find_mask_indices(
+            mask, column), masks)
+        print("%s: linear scan %.4f s, binary search %.4f s (%.1fx)" % (
+            name, linear, binary, linear/binary))
+    total = benchmark(lambda mask: data.mask_data(*mask), masks)
+    print("EcoHabDataBase.mask_data: %.4f s (%.1f us per call)" % (
+        total, 1e6*total/len(masks)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(float(sys.argv[1]))
+    else:
+        main()
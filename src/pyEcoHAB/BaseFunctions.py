@@ -1,128 +1,817 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
+import os
 import sys
+import copy
+import sqlite3
+from collections import OrderedDict
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
 import numpy as np
 
 
 class DataBase(object):
+    """
+    Base class for registrations and visits. Columns of data are stored
+    separately in columns. Text columns (e.g. animal tags, antennas and
+    addresses) are dictionary encoded: columns contain small integer codes
+    and categories contain sorted labels, so that
+    categories[column_name][columns[column_name]] are the original labels.
 
-    def __init__(self, data, mask):
+    Times (time_columns) are stored either as float seconds or
+    as int64 milliseconds (time_scale is then 1000). Accessors
+    (getproperty) and masks always use seconds.
+
+    Columns can be saved as .npy files (save) and opened as memory-mapped
+    arrays (load), so that the data is not read in up front and processes
+    opening the same files share one copy of the data in the page cache.
+
+    Queries by animal tag use an index of rows grouped by tag
+    (tag_index), built on the first query: rows of every tag are
+    a slice of the index (in storage order, i.e. sorted by time), and
+    the mask is applied to the slice with searchsorted.
+
+    Queries (getproperty, getraw) can be limited to rows with
+    time_column between t_start and t_end instead of the mask. Such
+    queries do not change the mask, so one dataset can be queried
+    from many threads.
+
+    view returns a DataBase restricted to a time window and a subset
+    of animal tags, which shares columns with the original DataBase
+    (rows of the tags are read through the tag index).
+
+    share copies columns to shared memory blocks and returns a picklable
+    handle (SharedColumns), which other processes attach to.
+    """
+    time_columns = ()
+    time_column = None
+    DTYPE_FNAME = "dtype.npy"
+
+    def __init__(self, data, mask, column_name=None):
         self.mask = None
         self._mask_slice = None
         self.data = data
         if mask:
-            self._cut_out_data(mask)
+            self._cut_out_data(mask, column_name)
+
+    @property
+    def data(self):
+        """Decoded data (a 2D structured array)"""
+        out = np.empty(len(self), dtype=self._dtype)
+        for key in self._dtype.names:
+            out[key] = self.get_column(key)
+        return out
+
+    @data.setter
+    def data(self, data):
+        columns = OrderedDict()
+        categories = {}
+        for key in data.dtype.names:
+            if data.dtype[key].kind == "U":
+                categories[key], codes = np.unique(data[key],
+                                                   return_inverse=True)
+                code_type = np.min_scalar_type(max(len(categories[key]) - 1,
+                                                   0))
+                columns[key] = codes.astype(code_type)
+            else:
+                columns[key] = np.ascontiguousarray(data[key])
+        self._set_columns(data.dtype, columns, categories)
+
+    def _set_columns(self, dtype, columns, categories):
+        self._dtype = dtype
+        self.columns = columns
+        self.categories = categories
+        self._category_codes = {}
+        for key in categories:
+            self._category_codes[key] = dict(
+                (label, code) for code, label
+                in enumerate(categories[key].tolist()))
+        self.time_scale = 1
+        for key in self.time_columns:
+            if key in columns and columns[key].dtype.kind in "iu":
+                self.time_scale = 1000
+        self._tag_index = None
+        self._tag_codes = None
+
+    def save(self, path):
+        """Save columns (and categories of text columns) as .npy files
+        in directory path"""
+        if not os.path.exists(path):
+            os.makedirs(path)
+        np.save(os.path.join(path, self.DTYPE_FNAME),
+                np.zeros(0, dtype=self._dtype))
+        for key in self.columns:
+            np.save(os.path.join(path, "%s.npy" % key), self._stored(key))
+        for key in self.categories:
+            np.save(os.path.join(path, "%s_categories.npy" % key),
+                    self.categories[key])
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Open data saved with save in directory path. Columns are
+        memory-mapped (see numpy.load), unless mmap_mode is None.
+        Categories of text columns are read in.
+        """
+        new = cls.__new__(cls)
+        new.mask = None
+        new._mask_slice = None
+        dtype = np.load(os.path.join(path, cls.DTYPE_FNAME)).dtype
+        columns = OrderedDict()
+        categories = {}
+        for key in dtype.names:
+            columns[key] = np.load(os.path.join(path, "%s.npy" % key),
+                                   mmap_mode=mmap_mode)
+            if dtype[key].kind == "U":
+                categories[key] = np.load(os.path.join(
+                    path, "%s_categories.npy" % key))
+        new._set_columns(dtype, columns, categories)
+        return new
+
+    def __len__(self):
+        if self._tag_codes is None:
+            return len(self.columns[self._dtype.names[0]])
+        return len(self.tag_index()[0])
+
+    def _stored(self, column_name):
+        """Return stored column column_name. Rows of a view restricted
+        to animal tags are copied (gathered with the tag index)."""
+        column = self.columns[column_name]
+        if self._tag_codes is None:
+            return column
+        return column[np.sort(self.tag_index()[0])]
+
+    @property
+    def msec(self):
+        """True, if times are stored as integer milliseconds"""
+        return self.time_scale == 1000
+
+    def _raw_time(self, seconds):
+        """Convert seconds to units of stored times. Integer times
+        are clipped to the int64 range (e.g. -inf and inf, which are
+        used as open bounds, are converted to the int64 minimum and
+        maximum)."""
+        if self.time_scale == 1:
+            return seconds
+        info = np.iinfo(np.int64)
+        if not np.isfinite(seconds):
+            return info.max if seconds > 0 else info.min
+        return int(min(max(np.round(seconds*self.time_scale), info.min),
+                       info.max))
+
+    def get_column(self, column_name):
+        """Return decoded column column_name"""
+        if column_name in self.categories:
+            return self.categories[column_name][self._stored(column_name)]
+        return self._stored(column_name)
+
+    def encode(self, column_name, labels):
+        """Return codes of labels of column column_name. Labels missing
+        in the data are skipped."""
+        codes = self._category_codes[column_name]
+        return np.array([codes[label] for label in labels
+                         if label in codes], dtype=int)
+
+    def category_codes(self, column_name):
+        """Return a dictionary mapping labels of column column_name
+        to codes"""
+        return self._category_codes[column_name]
+
+    def labels(self, column_name):
+        """Return sorted labels present in column column_name (columns
+        other than Tag of a view restricted to animal tags are copied,
+        see _stored)"""
+        if column_name == 'Tag' and self._tag_codes is not None:
+            offsets = self.tag_index()[1]
+            return self.categories['Tag'][np.nonzero(np.diff(offsets))[0]]
+        return self.categories[column_name][
+            np.unique(self._stored(column_name))]
 
     def _find_mask_indices(self, mask, column_name):
-        arr = np.array(self.data[column_name])
+        """Return the slice of rows with column_name (sorted) between
+        mask[0] (inclusive) and mask[-1] (exclusive)"""
+        arr = self.columns[column_name]
 
         if len(mask) >= 2:
-            starttime = mask[0]
-            endtime = mask[-1]
-        elif len(args) == 1:
-            starttime = min(self.data[column_name])
-            endtime = mask[0]
+            starttime = self._raw_time(mask[0])
+            endtime = self._raw_time(mask[-1])
+        elif len(mask) == 1:
+            starttime = arr[0] if len(arr) else 0
+            endtime = self._raw_time(mask[0])
         else:
             return (0, len(arr) - 1)
-        idcs = np.where((arr >= starttime) & (arr < endtime))[0]
-        if len(idcs) >= 2:
-            return (idcs[0], idcs[-1] + 1)
-        if len(idcs) == 1:
-            return (idcs[0], idcs[0] + 1)
-        return (0, 0)
+        start, end = np.searchsorted(arr, [starttime, endtime])
+        if start >= end:
+            return (0, 0)
+        return (int(start), int(end))
 
     def mask_data(self, args, column_name):
         """mask_data(endtime) or mask_data(starttime, endtime)
         All future queries will be clipped to the visits starting between
         starttime and endtime."""
-        arr = np.array(self.data[column_name])
+        arr = self.columns[column_name]
         if isinstance(args, int) or isinstance(args, float):
-            start = min(arr)
-            end = args[0]
+            start = arr[0]/self.time_scale
+            end = args
         elif len(args) >= 2:
             start = args[0]
             end = args[-1]
         elif len(args) == 1:
-            start = min(arr)
+            start = arr[0]/self.time_scale
             end = args[0]
         else:
-            start = min(arr)
-            end = max(arr)
+            start = arr[0]/self.time_scale
+            end = arr[-1]/self.time_scale
 
         self.mask = (start, end)
-        self._mask_slice = self. _find_mask_indices(self.mask,
-                                                    column_name)
+        self._mask_slice = self._find_mask_indices(self.mask,
+                                                   column_name)
 
     def unmask_data(self):
         """Remove the mask - future queries will not be clipped"""
         self.mask = None
         self._mask_slice = None
 
-    def _cut_out_data(self, new_mask):
-        mask = self._find_mask_indices(new_mask)
-        for key in self.data.keys():
-            self.data[key] = self.data[key][mask[0]: mask[1]]
+    def _cut_out_data(self, new_mask, column_name):
+        """Permanently remove data outside new_mask"""
+        mask = self._find_mask_indices(new_mask, column_name)
+        for key in self.columns:
+            self.columns[key] = self.columns[key][mask[0]:mask[1]]
+        self._tag_index = None
+
+    def tag_index(self):
+        """
+        Return an index of rows grouped by animal tag (in compressed
+        sparse row format): rows of the tag with code c are
+        rows[offsets[c]:offsets[c + 1]], in storage order.
+
+        Returns:
+           rows, offsets (arrays)
+        """
+        if self._tag_index is None:
+            self._tag_index = _make_tag_index(self.columns['Tag'],
+                                              len(self.categories['Tag']))
+        return self._tag_index
+
+    def _window_index(self, start, end, codes):
+        """Return the tag index (see tag_index) of rows start:end of tags
+        with codes (sorted), with rows counted from start. Only rows
+        of the tags are read."""
+        rows, offsets = self.tag_index()
+        counts = np.zeros(len(offsets) - 1, dtype=int)
+        selected = [np.zeros(0, dtype=rows.dtype)]
+        for code in codes:
+            tag_rows = rows[offsets[code]:offsets[code + 1]]
+            first, last = np.searchsorted(tag_rows, [start, end])
+            selected.append(tag_rows[first:last] - start)
+            counts[code] = last - first
+        return (np.concatenate(selected),
+                np.concatenate([[0], np.cumsum(counts)]))
+
+    def _window_slice(self, t_start, t_end):
+        """Return the slice of rows with time_column between t_start
+        and t_end (a missing bound is not checked) or the slice
+        of the mask, if both are None"""
+        if t_start is None and t_end is None and self.mask is not None:
+            return self._mask_slice
+        arr = self.columns[self.time_column]
+        start, end = 0, len(arr)
+        if t_start is not None:
+            start = int(np.searchsorted(arr, self._raw_time(t_start)))
+        if t_end is not None:
+            end = int(np.searchsorted(arr, self._raw_time(t_end)))
+        return start, max(start, end)
 
-    def getproperty(self, mice, propname, astype=None):
+    def _select(self, mice, propname, t_start=None, t_end=None):
+        """Return stored values of propname of mice within the mask
+        (or between t_start and t_end)"""
         if sys.version_info < (3, 0):
             if isinstance(mice, (str, unicode)):
                 mice = [mice]
         else:
             if isinstance(mice, str):
                 mice = [mice]
-
-        if self.mask is None:
-            if astype is None:
-                return [x[0] for x in zip(self.data[propname],
-                        self.data['Tag']) if x[1] in mice]
-            elif astype == 'float':
-                return [float(x[0]) for x in zip(self.data[propname],
-                        self.data['Tag']) if x[1] in mice]
+        mask_0, mask_1 = self._window_slice(t_start, t_end)
+        rows, offsets = self.tag_index()
+        selected = []
+        codes = np.unique(self.encode('Tag', mice))
+        if self._tag_codes is not None:
+            codes = np.intersect1d(codes, self._tag_codes)
+        for code in codes:
+            tag_rows = rows[offsets[code]:offsets[code + 1]]
+            start, end = np.searchsorted(tag_rows, [mask_0, mask_1])
+            selected.append(tag_rows[start:end])
+        if len(selected) == 1:
+            selected = selected[0]
         else:
-            mask_0, mask_1 = self._mask_slice[0], self._mask_slice[1]
-            if astype is None:
-                return [x[0] for x in zip(self.data[propname][mask_0:mask_1],
-                                          self.data['Tag'][mask_0:mask_1])
-                        if x[1] in mice]
-            elif astype == 'float':
-                return [float(x[0]) for x in zip(
-                    self.data[propname][mask_0:mask_1],
-                    self.data['Tag'][mask_0:mask_1])
-                        if x[1] in mice]
+            selected = np.sort(np.concatenate([np.zeros(0, dtype=int)]
+                                              + selected))
+        return self.columns[propname][selected]
+
+    def getraw(self, mice, propname, t_start=None, t_end=None):
+        """Return stored values of propname for mice (an array): codes
+        of text columns (e.g. Antenna) and times in stored units"""
+        return self._select(mice, propname, t_start, t_end)
+
+    def share(self):
+        """Copy columns to shared memory blocks (see SharedColumns)"""
+        return SharedColumns(self)
+
+    def view(self, t_start=None, t_end=None, mice=None):
+        """
+        Return a DataBase with rows with time_column between t_start
+        and t_end (a missing bound is not checked) of animal tags mice
+        (all tags by default). Columns of the view are slices of columns,
+        so no data is copied. A view restricted to mice reads rows of
+        the mice through its tag index, which is taken from the tag index
+        of the DataBase (only data and methods returning whole columns,
+        e.g. get_column and save, copy rows of the mice). The view
+        is not masked.
+        """
+        start, end = 0, len(self.columns[self.time_column])
+        if t_start is not None or t_end is not None:
+            start, end = self._window_slice(t_start, t_end)
+        new = copy.copy(self)
+        new.columns = OrderedDict((key, column[start:end])
+                                  for key, column in self.columns.items())
+        new.mask = None
+        new._mask_slice = None
+        codes = self._tag_codes
+        if mice is not None:
+            if isinstance(mice, str):
+                mice = [mice]
+            codes = np.unique(self.encode('Tag', mice))
+            if self._tag_codes is not None:
+                codes = np.intersect1d(codes, self._tag_codes)
+        new._tag_codes = codes
+        new._tag_index = None
+        if codes is not None:
+            new._tag_index = self._window_index(start, end, codes)
+        elif self._tag_index is not None:
+            new._tag_index = self._window_index(
+                start, end, np.arange(len(self._tag_index[1]) - 1))
+        return new
+
+    def getarray(self, mice, propname, t_start=None, t_end=None):
+        """Return values of propname for mice (an array) within the mask
+        or between t_start and t_end (see getproperty): labels of text
+        columns, times as float64 seconds and other columns with their
+        stored dtype"""
+        values = self._select(mice, propname, t_start, t_end)
+        if propname in self.categories:
+            return self.categories[propname][values]
+        if propname in self.time_columns:
+            if self.time_scale != 1:
+                return values/self.time_scale
+            return values.astype(np.float64, copy=False)
+        return values
+
+    def getproperty(self, mice, propname, astype=None, t_start=None,
+                    t_end=None):
+        """Return values of propname for mice (a list) within the mask
+        or, if t_start or t_end is given, with time_column between
+        t_start and t_end (the mask is then ignored and not changed)"""
+        values = self.getarray(mice, propname, t_start, t_end)
+        if astype is None:
+            return values.tolist()
+        elif astype == 'float':
+            return values.astype(float).tolist()
 
 
 class Data(DataBase):
+    time_columns = ("Time",)
+    time_column = "Time"
+
     def __init__(self, data, mask):
-        super(Data, self).__init__(data, mask)
+        super(Data, self).__init__(data, mask, column_name="Time")
+
+    def get_antennas(self, mice, t_start=None, t_end=None):
+        return self.getproperty(mice, 'Antenna', t_start=t_start,
+                                t_end=t_end)
+
+    def get_antenna_codes(self, mice, t_start=None, t_end=None):
+        return self.getraw(mice, 'Antenna', t_start, t_end)
+
+    def get_times(self, mice, t_start=None, t_end=None):
+        return self.getproperty(mice, 'Time', 'float', t_start, t_end)
+
+    def get_durations(self, mice, t_start=None, t_end=None):
+        return self.getproperty(mice, 'Duration', t_start=t_start,
+                                t_end=t_end)
 
-    def get_antennas(self, mice):
-        return self.getproperty(mice, 'Antenna')
+    def get_antennas_array(self, mice, t_start=None, t_end=None):
+        return self.getarray(mice, 'Antenna', t_start, t_end)
 
-    def get_times(self, mice):
-        return self.getproperty(mice, 'Time', 'float')
+    def get_times_array(self, mice, t_start=None, t_end=None):
+        return self.getarray(mice, 'Time', t_start, t_end)
 
-    def get_durations(self, mice):
-        return self.getproperty(mice, 'Duration')
+    def get_durations_array(self, mice, t_start=None, t_end=None):
+        return self.getarray(mice, 'Duration', t_start, t_end)
 
     def mask_data(self, mask):
         super(Data, self).mask_data(mask, column_name="Time")
 
 
 class Visits(DataBase):
+    time_columns = ("AbsStartTimecode", "AbsEndTimecode", "VisitDuration")
+    time_column = "AbsStartTimecode"
+
     def __init__(self, data, mask):
-        super(Visits, self).__init__(data, mask)
+        super(Visits, self).__init__(data, mask,
+                                     column_name="AbsStartTimecode")
+
+    def get_starttimes(self, mice, t_start=None, t_end=None):
+        return self.getproperty(mice, 'AbsStartTimecode', 'float',
+                                t_start, t_end)
+
+    def get_endtimes(self, mice, t_start=None, t_end=None):
+        return self.getproperty(mice, 'AbsEndTimecode', 'float',
+                                t_start, t_end)
+
+    def get_durations(self, mice, t_start=None, t_end=None):
+        return self.getproperty(mice, 'VisitDuration', 'float',
+                                t_start, t_end)
 
-    def get_starttimes(self, mice):
-        return self.getproperty(mice, 'AbsStartTimecode', 'float')
+    def get_visit_addresses(self, mice, t_start=None, t_end=None):
+        return self.getproperty(mice, 'Address', t_start=t_start,
+                                t_end=t_end)
 
-    def get_endtimes(self, mice):
-        return self.getproperty(mice, 'AbsEndTimecode', 'float')
+    def get_starttimes_array(self, mice, t_start=None, t_end=None):
+        return self.getarray(mice, 'AbsStartTimecode', t_start, t_end)
 
-    def get_durations(self, mice):
-        return self.getproperty(mice, 'VisitDuration', 'float')
+    def get_endtimes_array(self, mice, t_start=None, t_end=None):
+        return self.getarray(mice, 'AbsEndTimecode', t_start, t_end)
 
-    def get_visit_addresses(self, mice):
-        return self.getproperty(mice, 'Address')
+    def get_durations_array(self, mice, t_start=None, t_end=None):
+        return self.getarray(mice, 'VisitDuration', t_start, t_end)
+
+    def get_visit_addresses_array(self, mice, t_start=None, t_end=None):
+        return self.getarray(mice, 'Address', t_start, t_end)
 
     def mask_data(self, mask):
         super(Visits, self).mask_data(mask, column_name="AbsStartTimecode")
+
+
+def _make_tag_index(codes, n_tags):
+    """Return the tag index (see DataBase.tag_index) of tag codes"""
+    rows = np.argsort(codes, kind="stable")
+    offsets = np.searchsorted(codes[rows], np.arange(n_tags + 1))
+    return rows, offsets
+
+
+def _attach_block(name):
+    """Attach to an existing shared memory block. Blocks are removed
+    by the process, which created them, so they are not tracked
+    by attaching processes, if Python allows it."""
+    from multiprocessing import shared_memory
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _attach_array(blocks, name, dtype, length):
+    """Return a read-only array stored in shared block name
+    (the block is appended to blocks)"""
+    block = _attach_block(name)
+    blocks.append(block)
+    array = np.ndarray((length,), dtype=dtype, buffer=block.buf)
+    array.flags.writeable = False
+    return array
+
+
+class SharedColumns(object):
+    """
+    Columns of a DataBase copied to shared memory blocks
+    (multiprocessing.shared_memory, Python 3.8+).
+
+    SharedColumns is a small picklable handle (names of the blocks,
+    dtypes and categories), which can be passed to worker processes.
+    attach() returns a read-only DataBase, whose columns are arrays
+    stored in the shared blocks, so workers neither copy nor unpickle
+    the data. The tag index (see DataBase.tag_index) is shared as well,
+    so workers do not sort the data again. The process, which created
+    the handle, has to release the blocks with close(), when the workers
+    have finished.
+    """
+    def __init__(self, data_base):
+        self.cls = type(data_base)
+        self.dtype = data_base._dtype
+        self.categories = data_base.categories
+        self.columns = OrderedDict()
+        self._blocks = []
+        for key in data_base.columns:
+            self.columns[key] = self._share(data_base._stored(key))
+        if data_base._tag_codes is None:
+            rows, offsets = data_base.tag_index()
+        else:
+            # rows of the tags of a view are gathered (see _stored),
+            # so they are indexed again
+            rows, offsets = _make_tag_index(data_base._stored('Tag'),
+                                            len(self.categories['Tag']))
+        self.tag_index = (self._share(rows), self._share(offsets))
+
+    def _share(self, array):
+        """Copy array to a new shared block and return the name
+        of the block, dtype and length of the array"""
+        from multiprocessing import shared_memory
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True,
+                                           size=max(array.nbytes, 1))
+        self._blocks.append(block)
+        np.ndarray(array.shape, dtype=array.dtype,
+                   buffer=block.buf)[:] = array
+        return block.name, array.dtype.str, len(array)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_blocks"] = []
+        return state
+
+    def attach(self):
+        """Return a read-only DataBase using the shared blocks"""
+        new = self.cls.__new__(self.cls)
+        new.mask = None
+        new._mask_slice = None
+        blocks = []
+        columns = OrderedDict((key, _attach_array(blocks, *spec))
+                              for key, spec in self.columns.items())
+        new._set_columns(self.dtype, columns, self.categories)
+        new._tag_index = tuple(_attach_array(blocks, *spec)
+                               for spec in self.tag_index)
+        # blocks have to outlive the columns
+        new._shared_blocks = blocks
+        return new
+
+    def close(self):
+        """Release and remove the shared blocks (only in the process,
+        which created them)"""
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+class SQLiteDataBase(DataBase):
+    """
+    Registrations or visits stored in a table of an SQLite database.
+    SQLiteDataBase provides the same queries as DataBase, but the data
+    is not read in. Every query (getproperty) is an indexed range query
+    (by animal tag and, if the data is masked, by time), so only
+    the requested rows are read from the database file.
+
+    The database is opened read-only, so many processes can query
+    the same file at the same time. SQLiteDataBase can be pickled
+    (e.g. passed to worker processes), the database is then reopened.
+    Views (see view) add conditions to the queries of the table.
+
+    Tables are written by write. Column names and dtypes of the data
+    are stored in table COLUMNS_TABLE.
+    """
+    table = None
+    indexes = ()
+    COLUMNS_TABLE = "pyecohab_columns"
+    # (t_start, t_end, mice) of a view, None is not checked
+    _view = (None, None, None)
+    SQL_TYPES = {"U": "TEXT", "f": "REAL", "i": "INTEGER", "u": "INTEGER",
+                 "b": "INTEGER"}
+
+    def __init__(self, path):
+        self.path = path
+        self.mask = None
+        self._connect()
+        rows = self._connection.execute(
+            "SELECT name, dtype FROM %s WHERE table_name = ? "
+            "ORDER BY position" % self.COLUMNS_TABLE, (self.table,))
+        self._dtype = np.dtype([(str(name), dtype) for name, dtype in rows])
+        self.categories = {}
+        self._category_codes = {}
+        self.time_scale = 1
+        if self._dtype[self.time_column].kind in "iu":
+            self.time_scale = 1000
+
+    def _connect(self):
+        uri = "file:%s?mode=ro" % pathname2url(os.path.abspath(self.path))
+        self._connection = sqlite3.connect(uri, uri=True,
+                                           check_same_thread=False)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_connection"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._connect()
+
+    def close(self):
+        self._connection.close()
+
+    def view(self, t_start=None, t_end=None, mice=None):
+        """
+        Return an SQLiteDataBase with rows with time_column between
+        t_start and t_end (a missing bound is not checked) of animal tags
+        mice (all tags by default). The view shares the database
+        connection, its queries are queries of the table restricted
+        to the rows of the view. The view is not masked.
+        """
+        view_start, view_end, view_mice = self._view
+        if t_start is None or (view_start is not None and
+                               view_start > t_start):
+            t_start = view_start
+        if t_end is None or (view_end is not None and view_end < t_end):
+            t_end = view_end
+        if mice is not None:
+            if isinstance(mice, str):
+                mice = [mice]
+            mice = [mouse for mouse in mice
+                    if view_mice is None or mouse in view_mice]
+        else:
+            mice = view_mice
+        new = copy.copy(self)
+        new._view = (t_start, t_end, mice)
+        new.mask = None
+        return new
+
+    def _where(self, conditions=(), args=()):
+        """Return the WHERE clause of conditions (and of the view)
+        and its arguments"""
+        conditions, args = list(conditions), list(args)
+        t_start, t_end, mice = self._view
+        if mice is not None:
+            conditions.append("Tag IN (%s)" % ", ".join("?"*len(mice)))
+            args += mice
+        if t_start is not None:
+            conditions.append("%s >= ?" % self.time_column)
+            args.append(self._raw_time(t_start))
+        if t_end is not None:
+            conditions.append("%s < ?" % self.time_column)
+            args.append(self._raw_time(t_end))
+        if not conditions:
+            return "", args
+        return "WHERE " + " AND ".join(conditions), args
+
+    @classmethod
+    def write(cls, data_base, connection):
+        """Write data of data_base (a DataBase) to table cls.table
+        of an open SQLite connection and create indexes"""
+        dtype = data_base.data.dtype
+        connection.execute("CREATE TABLE IF NOT EXISTS %s (table_name TEXT, "
+                           "position INTEGER, name TEXT, dtype TEXT)"
+                           % cls.COLUMNS_TABLE)
+        connection.execute("DELETE FROM %s WHERE table_name = ?"
+                           % cls.COLUMNS_TABLE, (cls.table,))
+        connection.executemany("INSERT INTO %s VALUES (?, ?, ?, ?)"
+                               % cls.COLUMNS_TABLE,
+                               [(cls.table, i, key, dtype[key].str)
+                                for i, key in enumerate(dtype.names)])
+        connection.execute("DROP TABLE IF EXISTS %s" % cls.table)
+        connection.execute("CREATE TABLE %s (%s)" % (
+            cls.table, ", ".join("%s %s" % (key, cls.SQL_TYPES[
+                dtype[key].kind]) for key in dtype.names)))
+        connection.executemany("INSERT INTO %s VALUES (%s)" % (
+            cls.table, ", ".join("?"*len(dtype.names))),
+                               data_base.data.tolist())
+        for columns in cls.indexes:
+            connection.execute("CREATE INDEX %s_%s ON %s (%s)" % (
+                cls.table, "_".join(columns), cls.table, ", ".join(columns)))
+        connection.commit()
+
+    def _query(self, column_name, where="", args=()):
+        return [row[0] for row in self._connection.execute(
+            "SELECT %s FROM %s %s ORDER BY %s, rowid" % (
+                column_name, self.table, where, self.time_column), args)]
+
+    @property
+    def data(self):
+        """Decoded data (a 2D structured array)"""
+        where, args = self._where()
+        rows = self._connection.execute(
+            "SELECT %s FROM %s %s ORDER BY %s, rowid" % (
+                ", ".join(self._dtype.names), self.table, where,
+                self.time_column), args)
+        return np.array(rows.fetchall(), dtype=self._dtype)
+
+    def __len__(self):
+        where, args = self._where()
+        return self._connection.execute("SELECT COUNT(*) FROM %s %s"
+                                        % (self.table, where),
+                                        args).fetchone()[0]
+
+    def get_column(self, column_name):
+        """Return decoded column column_name"""
+        return np.array(self._query(column_name, *self._where()),
+                        dtype=self._dtype[column_name])
+
+    def _categories(self, column_name):
+        if column_name not in self.categories:
+            rows = self._connection.execute(
+                "SELECT DISTINCT %s FROM %s ORDER BY %s" % (
+                    column_name, self.table, column_name))
+            self.categories[column_name] = np.array(
+                [row[0] for row in rows], dtype=self._dtype[column_name])
+            self._category_codes[column_name] = dict(
+                (label, code) for code, label
+                in enumerate(self.categories[column_name].tolist()))
+        return self.categories[column_name]
+
+    def encode(self, column_name, labels):
+        """Return codes of labels of column column_name. Labels missing
+        in the data are skipped."""
+        self._categories(column_name)
+        return super(SQLiteDataBase, self).encode(column_name, labels)
+
+    def category_codes(self, column_name):
+        """Return a dictionary mapping labels of column column_name
+        to codes"""
+        self._categories(column_name)
+        return self._category_codes[column_name]
+
+    def labels(self, column_name):
+        """Return sorted labels present in column column_name"""
+        return self._categories(column_name)
+
+    def _time_bound(self, function):
+        where, args = self._where()
+        return self._connection.execute("SELECT %s(%s) FROM %s %s" % (
+            function, self.time_column, self.table, where),
+                                        args).fetchone()[0]
+
+    def mask_data(self, args, column_name=None):
+        """mask_data(endtime) or mask_data(starttime, endtime)
+        All future queries will be clipped to the rows with times
+        between starttime and endtime."""
+        if isinstance(args, (int, float)):
+            args = [args]
+        if len(args) >= 2:
+            start = args[0]
+            end = args[-1]
+        elif len(args) == 1:
+            start = self._time_bound("MIN")/self.time_scale
+            end = args[0]
+        else:
+            start = self._time_bound("MIN")/self.time_scale
+            end = self._time_bound("MAX")/self.time_scale
+        self.mask = (start, end)
+
+    def unmask_data(self):
+        """Remove the mask - future queries will not be clipped"""
+        self.mask = None
+
+    def _select(self, mice, propname, t_start=None, t_end=None):
+        """Return stored values of propname of mice within the mask
+        (or between t_start and t_end)"""
+        if isinstance(mice, str):
+            mice = [mice]
+        mice = list(mice)
+        conditions = ["Tag IN (%s)" % ", ".join("?"*len(mice))]
+        args = mice
+        if t_start is None and t_end is None and self.mask is not None:
+            t_start, t_end = self.mask
+        if t_start is not None:
+            conditions.append("%s >= ?" % self.time_column)
+            args = args + [self._raw_time(t_start)]
+        if t_end is not None:
+            conditions.append("%s < ?" % self.time_column)
+            args = args + [self._raw_time(t_end)]
+        return np.array(self._query(propname,
+                                    *self._where(conditions, args)),
+                        dtype=self._dtype[propname])
+
+    def getraw(self, mice, propname, t_start=None, t_end=None):
+        """Return stored values of propname for mice (an array): codes
+        of text columns (e.g. Antenna) and times in stored units"""
+        values = self._select(mice, propname, t_start, t_end)
+        if self._dtype[propname].kind == "U":
+            codes = self.category_codes(propname)
+            return np.array([codes[value] for value in values.tolist()],
+                            dtype=int)
+        return values
+
+    def getarray(self, mice, propname, t_start=None, t_end=None):
+        values = self._select(mice, propname, t_start, t_end)
+        if propname in self.time_columns:
+            if self.time_scale != 1:
+                return values/self.time_scale
+            return values.astype(np.float64, copy=False)
+        return values
+
+
+class SQLiteData(Data, SQLiteDataBase):
+    """Registrations stored in an SQLite database (see SQLiteDataBase)"""
+    table = "registrations"
+    indexes = (("Tag", "Time"),)
+
+    def __init__(self, path):
+        SQLiteDataBase.__init__(self, path)
+
+
+class SQLiteVisits(Visits, SQLiteDataBase):
+    """Visits stored in an SQLite database (see SQLiteDataBase)"""
+    table = "visits"
+    indexes = (("Tag", "AbsStartTimecode"), ("Address", "AbsStartTimecode"))
+
+    def __init__(self, path):
+        SQLiteDataBase.__init__(self, path)
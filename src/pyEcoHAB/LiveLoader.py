@@ -0,0 +1,222 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division, absolute_import
+import os
+import asyncio
+import inspect
+
+import numpy as np
+
+from pyEcoHAB.SetupConfig import SetupConfig
+from . import utility_functions as utils
+from .utils import for_loading as ufl
+
+
+class LiveLoader(object):
+    """Follow Eco-HAB data files located in path, while the experiment
+    is running.
+
+    LiveLoader polls the data directory, reads lines appended to the data
+    file that is currently being written (and any new data files) and
+    parses them the same way as read_single_file does. New registrations
+    and completed visits to Eco-HAB compartments are passed to subscribers.
+
+    Visits are calculated incrementally. For every mouse LiveLoader keeps
+    only registrations starting with the last visit of the mouse, which
+    can still change when new registrations appear. All the other visits
+    are final and they are never recalculated.
+
+    Offsets of data files already read and the registrations of the last
+    visit of every mouse are kept in memory only. A new LiveLoader
+    (e.g. after a restart) reads all the data files from the beginning,
+    so registrations and visits already passed to subscribers of
+    a previous LiveLoader are passed again.
+
+    Usage:
+       live = LiveLoader(path)
+       live.subscribe(callback)
+       asyncio.get_event_loop().run_until_complete(live.watch())
+
+    callback is called with two structured arrays: new registrations
+    (the same format as Loader.registrations.data) and new completed
+    visits (the same format as Loader.visits.data). If callback is
+    a coroutine function, it is awaited. Registrations of different
+    mice are not stored in data files in chronological order, so
+    registrations passed in consecutive calls might overlap in time.
+    Registrations of every single mouse are chronological.
+
+    Args:
+        path: string
+           directory containing Eco-HAB data
+
+    Keyword Args:
+        setup_config: str or an instance of SetupConfig
+           see Loader.
+        visit_threshold: float
+           visits shorter than visit_threshold will be rejected
+           Default value is 2 s.
+        remove_antennas: list
+           Registrations by antenna ids in remove_antennas will be
+           skipped.
+        legal_tags: list
+           Animal tag registrations to be kept (all other tag
+           registrations will be skipped). By default all registrations
+           are kept.
+        poll_interval: float
+           time (in sec) between consecutive checks of the data
+           directory. Default value is 1 s.
+    """
+    def __init__(self, path, **kwargs):
+        self.path = path
+        setup_config = kwargs.pop('setup_config', None)
+        if isinstance(setup_config, SetupConfig):
+            self.setup_config = setup_config
+        elif isinstance(setup_config, str):
+            self.setup_config = SetupConfig(path=setup_config)
+        else:
+            self.setup_config = SetupConfig(path=self.path)
+        self.threshold = kwargs.pop('visit_threshold', 2.)
+        self.poll_interval = kwargs.pop('poll_interval', 1.)
+        self._remove_antennas = kwargs.pop('remove_antennas', [])
+        self._legal_tags = kwargs.pop('legal_tags', "ALL")
+        self.mice = []
+        self._offsets = {}
+        self._positions = {}
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        """Call callback(registrations, visits) every time new
+        registrations or completed visits are found."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def _read_new_lines(self, fname, last):
+        """Read lines appended to fname since the last poll. An incomplete
+        last line is left for later, unless fname is not the newest
+        data file."""
+        offset = self._offsets.get(fname, 0)
+        with open(os.path.join(self.path, fname), 'rb') as f:
+            f.seek(offset)
+            text = f.read()
+        if last:
+            text = text[:text.rfind(b"\n") + 1]
+        self._offsets[fname] = offset + len(text)
+        return text.decode()
+
+    def _read_new_registrations(self):
+        fnames = sorted(ufl.get_filenames(self.path))
+        arrays = [np.zeros(0, dtype=ufl.REGISTRATION_DTYPE)]
+        for i, fname in enumerate(fnames):
+            text = self._read_new_lines(fname, i == len(fnames) - 1)
+            if not len(text):
+                continue
+            hour, date, datenext = ufl.parse_fname(fname)
+            raw_data = []
+            for line in text.splitlines():
+                if not len(line.split()):
+                    continue
+                raw_data.append(ufl.process_line(line, hour, date,
+                                                 datenext, fname))
+            arrays.append(ufl.filter_rows(ufl.from_raw_data(raw_data),
+                                          self._legal_tags,
+                                          self._remove_antennas))
+        return ufl.merge_sorted(arrays)
+
+    def _animal_position(self, times, antennas, mouse):
+        config = self.setup_config
+        return utils.get_animal_position(times, antennas, mouse,
+                                         self.threshold,
+                                         config.same_tunnel,
+                                         config.same_address,
+                                         config.opposite_tunnel,
+                                         config.address,
+                                         config.address_surrounding,
+                                         config.address_non_adjacent,
+                                         config.internal_antennas)
+
+    def _update_position(self, mouse, times, antennas):
+        """Add new registrations of mouse and return its completed visits.
+
+        The last visit of the mouse might still be extended by future
+        registrations, so registrations starting with the last visit are
+        kept for the next update."""
+        old_times, old_antennas = self._positions.get(mouse, ([], []))
+        times = old_times + times
+        antennas = old_antennas + antennas
+        out = self._animal_position(times, antennas, mouse)
+        if len(out):
+            idx = int(np.searchsorted(times, out[-1][2]))
+            completed = out[:-1]
+        else:
+            idx = max(len(times) - 1, 0)
+            completed = []
+        self._positions[mouse] = (times[idx:], antennas[idx:])
+        return completed
+
+    def _sorted_visits(self, visits):
+        visits.sort(key=lambda x: x[2])
+        return ufl.transform_visits(visits)
+
+    def poll(self):
+        """Read in new registrations and update visits.
+
+        Returns:
+           new registrations and new completed visits
+           (2D structured arrays)
+        """
+        data = self._read_new_registrations()
+        visits = []
+        for mouse in data["Tag"][np.sort(np.unique(data["Tag"],
+                                                   return_index=True)[1])]:
+            if mouse not in self.mice:
+                self.mice.append(mouse)
+            idx = data["Tag"] == mouse
+            visits.extend(self._update_position(
+                mouse, data["Time"][idx].tolist(),
+                data["Antenna"][idx].tolist()))
+        return data, self._sorted_visits(visits)
+
+    def flush(self):
+        """Return the last visit of every mouse (e.g. after the
+        experiment has finished) and clear the position state."""
+        visits = []
+        for mouse in self.mice:
+            times, antennas = self._positions.pop(mouse, ([], []))
+            visits.extend(self._animal_position(times, antennas, mouse))
+        return self._sorted_visits(visits)
+
+    async def _notify(self, registrations, visits):
+        for callback in self._subscribers:
+            result = callback(registrations, visits)
+            if inspect.isawaitable(result):
+                await result
+
+    async def watch(self, stop_event=None):
+        """Poll the data directory every poll_interval seconds and pass
+        new registrations and completed visits to subscribers, until
+        stop_event (an asyncio.Event) is set. Visits remaining after
+        stopping are flushed to subscribers.
+
+        Polls (scanning the directory and reading the files) run
+        in the default executor of the event loop, so they do not block
+        other tasks. poll should not be called by other tasks, while
+        watch is running."""
+        loop = asyncio.get_event_loop()
+        while stop_event is None or not stop_event.is_set():
+            registrations, visits = await loop.run_in_executor(None,
+                                                               self.poll)
+            if len(registrations) or len(visits):
+                await self._notify(registrations, visits)
+            if stop_event is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            try:
+                await asyncio.wait_for(stop_event.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        registrations, visits = await loop.run_in_executor(None, self.poll)
+        visits = np.concatenate([visits, self.flush()])
+        if len(registrations) or len(visits):
+            await self._notify(registrations, visits)
@@ -4,6 +4,9 @@
 from __future__ import print_function, division, absolute_import
 import os
 import sys
+import copy
+import pickle
+import sqlite3
 from datetime import date
 from collections import OrderedDict
 
@@ -21,6 +24,11 @@ from .utils import for_loading as ufl
 
 
 class EcoHabDataBase(object):
+    # incremented, whenever registrations or visits change (e.g. refresh)
+    # or are masked, so that results derived from the data
+    # (e.g. BinPlan.index) are not reused
+    data_version = 0
+
     def __init__(self, data, mask, visit_threshold, setup_config):
         """
         Base class for Loader and Merger providing data structure and
@@ -47,8 +55,11 @@ class EcoHabDataBase(object):
         self.threshold = visit_threshold
         self.mice = self.get_mice()
         self.visits = self._calculate_visits(setup_config)
-        self.session_start = sorted(self.get_times(self.mice))[0]
-        self.session_end = sorted(self.get_times(self.mice))[-1]
+        # session bounds are None, if there are no registrations
+        # (e.g. within a chunk of ChunkedLoader)
+        times = sorted(self.get_times(self.mice))
+        self.session_start = times[0] if len(times) else None
+        self.session_end = times[-1] if len(times) else None
 
     def _calculate_animal_positions(self, setup_config):
         """Calculate timings of animal visits to Eco-HAB compartments, using
@@ -63,24 +74,81 @@ class EcoHabDataBase(object):
            list
         """
         tempdata = []
+        config = self._encode_setup(setup_config)
         for mouse in self.mice:
-            times, antennas = utils.get_times_antennas(self.registrations,
-                                                       mouse,
-                                                       0, -1)
-            out = utils.get_animal_position(times, antennas,
-                                            mouse,
-                                            self.threshold,
-                                            setup_config.same_tunnel,
-                                            setup_config.same_address,
-                                            setup_config.opposite_tunnel,
-                                            setup_config.address,
-                                            setup_config.address_surrounding,
-                                            setup_config.address_non_adjacent,
-                                            setup_config.internal_antennas)
+            times, antennas = self._times_antenna_codes(mouse)
+            out = self._animal_position(times, antennas, mouse, config)
             tempdata.extend(out)
         tempdata.sort(key=lambda x: x[2])
         return tempdata
 
+    def _times_antenna_codes(self, mouse):
+        """Registration times (in stored units) and antenna codes of mouse
+        (the mask is ignored and not changed)"""
+        return (self.registrations.getraw(mouse, "Time", -np.inf,
+                                          np.inf).tolist(),
+                self.registrations.get_antenna_codes(mouse, -np.inf,
+                                                     np.inf).tolist())
+
+    def _encode_setup(self, setup_config):
+        """Setup config dictionaries used by get_animal_position
+        translated to antenna codes of registrations"""
+        return utils.encode_antennas(
+            self.registrations.category_codes("Antenna"),
+            setup_config.same_tunnel,
+            setup_config.same_address,
+            setup_config.opposite_tunnel,
+            setup_config.address,
+            setup_config.address_surrounding,
+            setup_config.address_non_adjacent,
+            setup_config.internal_antennas)
+
+    def _animal_position(self, times, antennas, mouse, config):
+        threshold = self.threshold*self.registrations.time_scale
+        return utils.get_animal_position(times, antennas, mouse,
+                                         threshold, *config)
+
+    def _update_visits(self, new_data, setup_config):
+        """Recalculate visits of mice registered in new_data. For every
+        mouse visits are recalculated starting from the last visit
+        preceding the first new registration of the mouse.
+
+        Args:
+           new_data: 2D structured array
+              registrations appended to self.registrations
+           setup_config: ExperimentSetupConfig or SetupConfig
+        Returns:
+           visits to Eco-HAB cages: Visits
+        """
+        visits = self.visits.data
+        keep = np.ones(len(visits), dtype=bool)
+        new_visits = []
+        config = self._encode_setup(setup_config)
+        for mouse in sorted(set(new_data["Tag"])):
+            t_new = new_data["Time"][new_data["Tag"] == mouse][0]
+            mouse_visits = visits["Tag"] == mouse
+            starts = visits["AbsStartTimecode"][mouse_visits]
+            before = starts[starts < t_new]
+            if len(before):
+                t_resume = before[-1]
+            else:
+                t_resume = -np.inf
+            keep &= ~(mouse_visits & (visits["AbsStartTimecode"] >= t_resume))
+            times, antennas = self._times_antenna_codes(mouse)
+            idx = np.searchsorted(times, t_resume)
+            new_visits.extend(self._animal_position(times[idx:],
+                                                    antennas[idx:],
+                                                    mouse, config))
+        data = np.concatenate([visits[keep],
+                               ufl.transform_visits(
+                                   new_visits,
+                                   msec=self.registrations.msec)])
+        rank = dict((mouse, i) for i, mouse in enumerate(self.mice))
+        mouse_rank = [rank[mouse] for mouse in data["Tag"]]
+        order = np.lexsort((np.arange(len(data)), mouse_rank,
+                            data["AbsStartTimecode"]))
+        return BaseFunctions.Visits(data[order], None)
+
     def _calculate_visits(self, setup_config):
         """Calculate EcoHabBase.visits. Calculate timings of animal visits to
         Eco-HAB compartments, using a modified algorithm by Alicja
@@ -95,9 +163,210 @@ class EcoHabDataBase(object):
 
         """
         temp_data = self._calculate_animal_positions(setup_config)
-        data = ufl.transform_visits(temp_data)
+        data = ufl.transform_visits(temp_data, msec=self.registrations.msec)
         return BaseFunctions.Visits(data, None)
 
+    def save_snapshot(self, path, compressed=True):
+        """
+        Save the whole dataset (registrations, visits, setup config,
+        mice, session bounds, visit threshold, prefix and all the other
+        attributes) to a single binary file, which can be restored
+        by from_snapshot without reading in data files and recalculating
+        visits. Numpy adds .npz extension to path if it is missing.
+
+        Args:
+           path: str
+             snapshot filename
+           compressed: True or False
+             compress the snapshot. True by default.
+        """
+        attributes = dict((key, value) for key, value in self.__dict__.items()
+                          if key not in ["registrations", "visits"])
+        attributes = pickle.dumps(attributes,
+                                  protocol=pickle.HIGHEST_PROTOCOL)
+        if compressed:
+            save = np.savez_compressed
+        else:
+            save = np.savez
+        save(path, registrations=self.registrations.data,
+             visits=self.visits.data,
+             attributes=np.frombuffer(attributes, dtype=np.uint8))
+
+    @classmethod
+    def from_snapshot(cls, path):
+        """
+        Restore a dataset saved by save_snapshot.
+
+        Snapshots contain pickled attributes of the dataset, only load
+        snapshots from trusted sources.
+
+        Args:
+           path: str
+             snapshot filename
+        """
+        with np.load(path) as snapshot:
+            registrations = snapshot["registrations"]
+            visits = snapshot["visits"]
+            attributes = pickle.loads(snapshot["attributes"].tobytes())
+        new = cls.__new__(cls)
+        new.__dict__.update(attributes)
+        new.registrations = BaseFunctions.Data(registrations, None)
+        new.visits = BaseFunctions.Visits(visits, None)
+        return new
+
+    def save_store(self, path):
+        """
+        Save the whole dataset to directory path: columns of registrations
+        and visits as .npy files (see BaseFunctions.DataBase.save) in
+        path/registrations and path/visits and all the other attributes
+        in path/attributes.pkl. The dataset can be opened by open_store.
+
+        Args:
+           path: str
+             directory name
+        """
+        self.registrations.save(os.path.join(path, "registrations"))
+        self.visits.save(os.path.join(path, "visits"))
+        attributes = dict((key, value) for key, value in self.__dict__.items()
+                          if key not in ["registrations", "visits"])
+        with open(os.path.join(path, "attributes.pkl"), "wb") as f:
+            pickle.dump(attributes, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def open_store(cls, path, mmap_mode="r"):
+        """
+        Open a dataset saved by save_store. Registrations and visits are
+        memory-mapped (with mmap_mode, see numpy.load), so they are read
+        in from disk only when they are accessed and analyses run
+        in separate processes share one copy of the data in memory.
+
+        Stores contain pickled attributes of the dataset, only open
+        stores from trusted sources.
+
+        Args:
+           path: str
+             directory name
+           mmap_mode: str or None
+             "r" by default. If None, the data is read in.
+        """
+        with open(os.path.join(path, "attributes.pkl"), "rb") as f:
+            attributes = pickle.load(f)
+        new = cls.__new__(cls)
+        new.__dict__.update(attributes)
+        new.registrations = BaseFunctions.Data.load(
+            os.path.join(path, "registrations"), mmap_mode=mmap_mode)
+        new.visits = BaseFunctions.Visits.load(
+            os.path.join(path, "visits"), mmap_mode=mmap_mode)
+        return new
+
+    def save_sqlite(self, path):
+        """
+        Save the whole dataset to an SQLite database file path:
+        registrations and visits in tables indexed by animal tag and time
+        (and visits additionally by address and time, see
+        BaseFunctions.SQLiteData and BaseFunctions.SQLiteVisits) and all
+        the other attributes (pickled) in table attributes. Existing
+        tables are replaced. The dataset can be opened by open_sqlite.
+
+        Args:
+           path: str
+             database filename
+        """
+        attributes = dict((key, value) for key, value in self.__dict__.items()
+                          if key not in ["registrations", "visits"])
+        connection = sqlite3.connect(path)
+        try:
+            BaseFunctions.SQLiteData.write(self.registrations, connection)
+            BaseFunctions.SQLiteVisits.write(self.visits, connection)
+            connection.execute("DROP TABLE IF EXISTS attributes")
+            connection.execute("CREATE TABLE attributes (name TEXT, "
+                               "value BLOB)")
+            connection.executemany(
+                "INSERT INTO attributes VALUES (?, ?)",
+                [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+                 for key, value in attributes.items()])
+            connection.commit()
+        finally:
+            connection.close()
+
+    @classmethod
+    def open_sqlite(cls, path):
+        """
+        Open a dataset saved by save_sqlite. The database is opened
+        read-only and registrations and visits are not read in: queries
+        (e.g. get_times, get_visits, get_registration_stats) are indexed
+        range queries reading only the requested rows, so many processes
+        can analyse the same database at the same time. The dataset
+        is passed to worker processes as it is (it is pickled and the
+        database is reopened), it is not shared with share.
+
+        Databases contain pickled attributes of the dataset, only open
+        databases from trusted sources.
+
+        Args:
+           path: str
+             database filename
+        """
+        new = cls.__new__(cls)
+        new.registrations = BaseFunctions.SQLiteData(path)
+        new.visits = BaseFunctions.SQLiteVisits(path)
+        for key, value in new.registrations._connection.execute(
+                "SELECT name, value FROM attributes"):
+            setattr(new, key, pickle.loads(value))
+        return new
+
+    def share(self):
+        """
+        Copy registrations and visits to shared memory blocks and return
+        a picklable handle (SharedDataset), which can be passed to worker
+        processes (e.g. of a ProcessPoolExecutor) instead of the dataset.
+        Workers call handle.attach() to get a read-only dataset using
+        the shared blocks, so registrations and visits are stored in
+        memory once, whatever the number of workers. Close the handle
+        (or use it as a context manager) to remove the blocks, when
+        the workers have finished.
+
+        Usage:
+           with data.share() as handle:
+              results = list(pool.map(analysis, [handle]*n_tasks))
+        """
+        return SharedDataset(self)
+
+    def view(self, mice=None, t_start=None, t_end=None):
+        """
+        Return a view of the dataset restricted to animal tags mice and
+        to registrations and visits (starting) between t_start and t_end.
+        The view is an object of the same class with all the attributes
+        of the dataset (setup_config, cages, ...), so it can be passed
+        to analysis functions instead of the dataset. Registrations and
+        visits of the view are slices of registrations and visits of
+        the dataset (see BaseFunctions.DataBase.view), no data is copied.
+        Visits are not clipped to t_start and t_end. session_start
+        and session_end of the view are the first and the last
+        registration of the view (None, if the view is empty).
+
+        Args:
+           mice: list of str
+             animal tags. By default all the animals are kept.
+           t_start: float
+             beginning of the time window (seconds from the epoch).
+             By default registrations are not clipped.
+           t_end: float
+             end of the time window
+        """
+        new = copy.copy(self)
+        new.registrations = self.registrations.view(t_start, t_end, mice)
+        new.visits = self.visits.view(t_start, t_end, mice)
+        new.mask = None
+        if mice is not None:
+            if isinstance(mice, str):
+                mice = [mice]
+            new.mice = [mouse for mouse in self.mice if mouse in mice]
+        times = new.get_times(new.mice)
+        new.session_start = times[0] if len(times) else None
+        new.session_end = times[-1] if len(times) else None
+        return new
+
     def mask_data(self, start_time, end_time):
         """
         Hide registrations and visits in ranges (self.session_start, start_time)
@@ -110,6 +379,7 @@ class EcoHabDataBase(object):
         self.mask = (start_time, end_time)
         self.registrations.mask_data(self.mask)
         self.visits.mask_data(self.mask)
+        self.data_version += 1
 
     def unmask_data(self):
         """Remove the mask - future registrations and visits queries will not be
@@ -117,48 +387,78 @@ class EcoHabDataBase(object):
         self.mask = None
         self.registrations.unmask_data()
         self.visits.unmask_data()
+        self.data_version += 1
 
-    def get_antennas(self, mice):
-        return self.registrations.getproperty(mice,
-                                         'Antenna')
+    def get_antennas(self, mice, t_start=None, t_end=None):
+        """Return antennas registering specified animals. If t_start or
+        t_end is given, registrations between t_start and t_end
+        are returned (the mask is ignored and not changed, so queries
+        with t_start and t_end can be run from many threads)."""
+        return self.registrations.get_antennas(mice, t_start, t_end)
 
-    def get_times(self, mice):
-        return self.registrations.getproperty(mice,
-                                         'Time',
-                                         'float')
+    def get_times(self, mice, t_start=None, t_end=None):
+        return self.registrations.get_times(mice, t_start, t_end)
 
-    def get_durations(self, mice):
+    def get_durations(self, mice, t_start=None, t_end=None):
         """Return duration of registration by antenna for specified animals.
         """
-        return self.registrations.getproperty(mice,
-                                         'Duration',
-                                         'float')
+        return self.registrations.getproperty(mice, 'Duration', 'float',
+                                              t_start, t_end)
+
+    def get_visit_addresses(self, mice, t_start=None, t_end=None):
+        """Return addresses of visits of specified animals. If t_start
+        or t_end is given, visits starting between t_start and t_end
+        are returned (the mask is ignored and not changed)."""
+        return self.visits.get_visit_addresses(mice, t_start, t_end)
+
+    def get_starttimes(self, mice, t_start=None, t_end=None):
+        return self.visits.get_starttimes(mice, t_start, t_end)
+
+    def get_endtimes(self, mice, t_start=None, t_end=None):
+        return self.visits.get_endtimes(mice, t_start, t_end)
+
+    def get_visit_durations(self, mice, t_start=None, t_end=None):
+        return self.visits.get_durations(mice, t_start, t_end)
+
+    def get_antennas_array(self, mice, t_start=None, t_end=None):
+        """Return antennas registering specified animals as an array
+        (see get_antennas). The *_array getters return NumPy arrays
+        instead of lists: times as float64 seconds, antennas and
+        addresses as labels and registration durations as integers."""
+        return self.registrations.get_antennas_array(mice, t_start, t_end)
+
+    def get_antenna_codes(self, mice, t_start=None, t_end=None):
+        """Return codes of antennas registering specified animals
+        (see registrations.category_codes("Antenna"))"""
+        return self.registrations.get_antenna_codes(mice, t_start, t_end)
+
+    def get_times_array(self, mice, t_start=None, t_end=None):
+        return self.registrations.get_times_array(mice, t_start, t_end)
+
+    def get_durations_array(self, mice, t_start=None, t_end=None):
+        return self.registrations.get_durations_array(mice, t_start, t_end)
 
-    def get_visit_addresses(self, mice):
-        return self.visits.getproperty(mice,
-                                       'Address')
+    def get_visit_addresses_array(self, mice, t_start=None, t_end=None):
+        return self.visits.get_visit_addresses_array(mice, t_start, t_end)
 
-    def get_starttimes(self, mice):
-        return self.visits.getproperty(mice,
-                                       'AbsStartTimecode',
-                                       'float')
+    def get_starttimes_array(self, mice, t_start=None, t_end=None):
+        return self.visits.get_starttimes_array(mice, t_start, t_end)
 
-    def get_endtimes(self, mice):
-        return self.visits.getproperty(mice,
-                                       'AbsEndTimecode',
-                                       'float')
+    def get_endtimes_array(self, mice, t_start=None, t_end=None):
+        return self.visits.get_endtimes_array(mice, t_start, t_end)
 
-    def get_visit_durations(self, mice):
-        return self.visits.getproperty(mice,
-                                       'VisitDuration',
-                                       'float')
+    def get_visit_durations_array(self, mice, t_start=None, t_end=None):
+        return self.visits.get_durations_array(mice, t_start, t_end)
 
     def how_many_antennas(self):
         all_antennas = set(self.get_antennas(self.mice))
         return len(all_antennas)
 
     def get_mice(self):
-        mouse_list = list(set(self.registrations.data["Tag"]))
+        return self.sort_mice(self.registrations.labels("Tag").tolist())
+
+    @staticmethod
+    def sort_mice(mouse_list):
         # new Eco-HAB has a different mouse tag naming convention
         # last five digits are the same whereas in previous version
         # there was a prefix and first digits where the same
@@ -192,13 +492,12 @@ class EcoHabDataBase(object):
                 return []
             cage = [cage]
 
-        self.visits.mask_data([t_start, t_end])
         out = []
         for mouse in mice:
-            addresses = self.get_visit_addresses(mouse)
-            start_times = self.get_starttimes(mouse)
-            end_times = self.get_endtimes(mouse)
-            durations = self.get_visit_durations(mouse)
+            addresses = self.get_visit_addresses(mouse, t_start, t_end)
+            start_times = self.get_starttimes(mouse, t_start, t_end)
+            end_times = self.get_endtimes(mouse, t_start, t_end)
+            durations = self.get_visit_durations(mouse, t_start, t_end)
             for i, a in enumerate(addresses):
                 if a in cage:
                     visit = ufl.NamedDict("Visit_%s_%d" % (mouse, i),
@@ -238,20 +537,59 @@ class EcoHabDataBase(object):
         t_s = t_start
         while t_s < t_end:
             t_e = t_s + binsize
-            self.mask_data(t_s, t_e)
-            antennas = self.get_antennas(mouse)
+            antennas = self.get_antennas(mouse, t_s, t_e)
             indices = np.where(np.array(antennas) == antenna)[0]
             count_in_bins.append(len(indices))
-            durations = self.get_durations(mouse)
+            durations = self.get_durations(mouse, t_s, t_e)
             sum_time = 0
             for ind in indices:
                 sum_time += durations[ind]
             durations_in_bins.append(sum_time/1000)
-            self.unmask_data()
             t_s = t_e
         return count_in_bins, durations_in_bins
 
 
+class SharedDataset(object):
+    """
+    Picklable handle of a dataset (Loader, Merger, ...), whose
+    registrations and visits are stored in shared memory blocks
+    (see EcoHabDataBase.share and BaseFunctions.SharedColumns).
+    All the other attributes (setup config, mice, ...) are pickled
+    with the handle.
+    """
+    def __init__(self, dataset):
+        self.cls = type(dataset)
+        self.attributes = dict((key, value) for key, value
+                               in dataset.__dict__.items()
+                               if key not in ["registrations", "visits"])
+        self.registrations = dataset.registrations.share()
+        try:
+            self.visits = dataset.visits.share()
+        except Exception:
+            self.registrations.close()
+            raise
+
+    def attach(self):
+        """Return a read-only dataset using the shared blocks"""
+        new = self.cls.__new__(self.cls)
+        new.__dict__.update(self.attributes)
+        new.registrations = self.registrations.attach()
+        new.visits = self.visits.attach()
+        return new
+
+    def close(self):
+        """Remove the shared blocks (only in the process, which
+        created the handle)"""
+        self.registrations.close()
+        self.visits.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
 class Loader(EcoHabDataBase):
     """Read in Eco-HAB data files that are located in path.
 
@@ -273,7 +611,12 @@ class Loader(EcoHabDataBase):
 
     Args:
         path: string
-           directory containing Eco-HAB data
+           directory containing Eco-HAB data or a zip/tar archive (also
+           compressed with gzip, bzip2 or xz) with Eco-HAB data. Data files
+           can be compressed individually (*.txt.gz, *.txt.bz2, *.txt.xz).
+           Setup config file, info.txt and results of an archive are
+           looked for (and saved) in the directory containing
+           the archive.
 
     Keyword Args:
         setup_config: str or an instance of SetupConfig
@@ -287,7 +630,9 @@ class Loader(EcoHabDataBase):
            Loader will read in data registed between mask[0] and mask[1].
            mask[0] and mask[1] need to be expressed seconds from the epoch,
            since Loader converts animal tag registration times to seconds
-           since the epoch. By default the whole data is saved by Loader.
+           since the epoch. Only data files, which can contain registrations
+           between mask[0] and mask[1] (judging by their filenames) are
+           read in. By default the whole data is saved by Loader.
         visit_threshold: float
            visits shorter than visit_threshold will be rejected
            Default value is 2 s (parameter based on mouse behavior)
@@ -312,42 +657,99 @@ class Loader(EcoHabDataBase):
         add_date: True or False
            Add analysis date to results directory filename.
            As a default current date will be added.
+        n_jobs: int or None
+           number of worker processes parsing data files in parallel.
+           If n_jobs is None or smaller than 1, one worker per CPU
+           is started. By default data files are read in one by one.
+        executor: concurrent.futures.Executor
+           an executor, which will be used for parsing data files
+           (overrides n_jobs).
+        prefetch: int
+           number of threads reading data files ahead of parsing, so
+           that reading (e.g. from network storage) overlaps with parsing
+           and filtering (see utils.for_loading.stream_files). Used,
+           if data files are parsed in one process and not cached.
+           By default files are read in and parsed one after another.
+        cache_dir: str or True
+           directory for caching parsed data files. Files, which have not
+           changed since they were cached (same size and modification
+           time), are loaded from the cache instead of being parsed.
+           If cache_dir is True, parsed files are cached in
+           path/.pyEcoHAB_cache. By default parsed files are not cached.
+        msec_timestamps: True or False
+           store registration and visit times as int64 milliseconds
+           since the epoch instead of float seconds. Comparisons of times
+           are then exact. Accessors (get_times, get_starttimes, ...),
+           masks and session_start/session_end still use seconds.
+           False by default.
+        manifest: str or True
+           filename of a manifest of data files (see
+           utils.for_loading.build_manifest). The manifest is used for
+           selecting data files within mask and for summary(), and it is
+           updated with every data file read in without a mask. If
+           manifest is True, path/pyEcoHAB_manifest.json is used.
+           By default no manifest is used.
+        diagnostics: True or False
+           run diagnostics of antenna registrations (see
+           utils.for_loading.run_diagnostics) and save them in res_dir.
+           True by default.
     """
+    CACHE_DIR = ".pyEcoHAB_cache"
     MAX_BREAK = 3*3600
     internal_antennas = []
 
     def __init__(self, path, **kwargs):
         # Read in parameters
         self.path = path
+        data_dir = ufl.data_directory(self.path)
         setup_config = kwargs.pop('setup_config', None)
         if isinstance(setup_config, SetupConfig):
             antennas = setup_config
         elif isinstance(setup_config, str):
             antennas = SetupConfig(path=setup_config)
         else:
-            antennas = SetupConfig(path=self.path)
+            antennas = SetupConfig(path=data_dir)
 
-        self.mask = kwargs.pop('mask', None)
+        # the mask of data read in is kept apart from self.mask, which
+        # is changed by mask_data and unmask_data
+        self._load_mask = kwargs.pop('mask', None)
+        self.mask = self._load_mask
         self.visit_threshold = kwargs.pop('visit_threshold', 2.)
         add_date = kwargs.pop('add_date', True)
         res_dir = kwargs.pop("res_dir", "Results")
-        self.prefix = kwargs.pop("prefix", ufl.make_prefix(self.path))
+        self.prefix = kwargs.pop("prefix", ufl.make_prefix(data_dir))
         self.max_break = kwargs.pop("max_break", self.MAX_BREAK)
 
-        remove_antennas = kwargs.pop('remove_antennas', [])
-        tags = kwargs.pop('legal_tags', "ALL")
+        self._remove_antennas = kwargs.pop('remove_antennas', [])
+        self._legal_tags = kwargs.pop('legal_tags', "ALL")
+        self._n_jobs = kwargs.pop('n_jobs', 1)
+        self._prefetch = kwargs.pop('prefetch', 0)
+        self.msec_timestamps = kwargs.pop('msec_timestamps', False)
+        diagnostics = kwargs.pop('diagnostics', True)
+        executor = kwargs.pop('executor', None)
+        self.cache_dir = kwargs.pop('cache_dir', None)
+        if self.cache_dir is True:
+            self.cache_dir = os.path.join(data_dir, self.CACHE_DIR)
+        self.manifest_path = kwargs.pop('manifest', None)
+        if self.manifest_path is True:
+            self.manifest_path = ufl.default_manifest_path(self.path)
+        self._manifest = {}
+        if self.manifest_path:
+            self._manifest = ufl.load_manifest(self.manifest_path)
         if add_date:
             today = date.today().strftime("%d.%m.%y")
             res_dir = "%s_%s" % (res_dir, today)
-        self.res_dir = ufl.results_path(self.path, res_dir)
+        self.res_dir = ufl.results_path(data_dir, res_dir)
         # Read in data
-        rawdata = self._read_in_raw_data(tags)
-        data = ufl.from_raw_data(rawdata)
-        data = ufl.remove_antennas(data, remove_antennas)
+        data = self._read_in_raw_data(self._legal_tags, self._n_jobs,
+                                      executor)
         # As in antenna registrations
-        ufl.run_diagnostics(data, self.max_break, self.res_dir,
-                            antennas)
-        super(Loader, self).__init__(data, self.mask,
+        if diagnostics:
+            ufl.run_diagnostics(data, self.max_break, self.res_dir,
+                                antennas)
+        if self.msec_timestamps:
+            data = ufl.convert_times(data, msec=True)
+        super(Loader, self).__init__(data, self._load_mask,
                                      self.visit_threshold, antennas)
         self.cages = antennas.cages
         self.directions = antennas.directions
@@ -359,29 +761,417 @@ class Loader(EcoHabDataBase):
         self.home_internal_antennas = antennas.homecage_internal_antennas
         self.stimulus_internal_antennas = antennas.stimCage_internal_antennas
 
-    def _read_in_raw_data(self, tags):
+    def _read_in_raw_data(self, tags, n_jobs=1, executor=None):
         """Reads in data from files in self.path.
         Removes ghost tags from data"""
-        raw_data = []
-        days = set()
-        self._fnames = ufl.get_filenames(self.path)
-        if not len(self._fnames):
+        fnames = ufl.get_filenames(self.path)
+        if not len(fnames):
             raise Exception("empty directory %s" % self.path)
-        for f_name in self._fnames:
-            raw_data += ufl.read_single_file(self.path, f_name)
-            days.add(f_name.split('_')[0])
-        data = ufl.remove_ghost_tags(raw_data,
-                                     legal_tags=tags)
-        data.sort(key=lambda x: ufl.time_to_sec(x[1]))
-        return data
+        self._fnames = ufl.select_fnames(fnames, self._load_mask,
+                                         manifest=self._manifest_entries(
+                                             fnames))
+        if not len(self._fnames):
+            raise Exception("no data files in %s within mask %s"
+                            % (self.path, self._load_mask))
+        self._signatures = {}
+        self._file_rows = {}
+        return ufl.merge_sorted(self._read_files(self._fnames, tags, n_jobs,
+                                                 executor))
+
+    def _read_files(self, fnames, tags, n_jobs=1, executor=None):
+        """Reads in data from files fnames in self.path into a list
+        of arrays. Ghost tags, registrations by removed antennas
+        and registrations outside the mask given to Loader are skipped
+        while files are parsed. Signatures (size and modification time)
+        of files and numbers of rows read in are stored for refresh"""
+        signatures = [ufl.file_signature(self.path, fname)
+                      for fname in fnames]
+        arrays = ufl.read_files(self.path, fnames, n_jobs=n_jobs,
+                                executor=executor, cache_dir=self.cache_dir,
+                                mask=self._load_mask, legal_tags=tags,
+                                removed_antennas=self._remove_antennas,
+                                prefetch=self._prefetch)
+        for fname, signature, array in zip(fnames, signatures, arrays):
+            self._signatures[fname] = signature
+            self._file_rows[fname] = len(array)
+        # manifest describes whole data files
+        if self.manifest_path and self._load_mask is None\
+           and tags == "ALL" and not self._remove_antennas:
+            ufl.update_manifest(self._manifest, self.path, fnames, arrays)
+            ufl.save_manifest(self._manifest, self.manifest_path)
+        return arrays
+
+    def refresh(self):
+        """Read in data files, which appeared in self.path after the data
+        was loaded (e.g. hourly files of a running experiment), and rows
+        appended to data files read in before (e.g. the file of the current
+        hour). Data files, which changed since they were read in (different
+        size or modification time), are parsed again and rows following
+        the rows read in before are added, so data files are expected
+        to only grow. Files are selected and clipped with the mask given
+        to Loader, not with the mask set by mask_data.
+
+        New registrations are appended to registrations. Visits are
+        recalculated only for mice registered in the new rows and only
+        starting from the last visit of each mouse preceding the new
+        registrations. Session start and end are updated. The mask set
+        by mask_data is kept. Diagnostics are not rerun.
+
+        Returns:
+           list of new and changed data files
+        """
+        fnames = ufl.get_filenames(self.path)
+        old_fnames = set(self._fnames)
+        changed = [f_name for f_name in self._fnames if f_name in fnames and
+                   ufl.file_signature(self.path, f_name)
+                   != self._signatures[f_name]]
+        new_fnames = [f_name for f_name in fnames
+                      if f_name not in old_fnames]
+        new_fnames = ufl.select_fnames(new_fnames, self._load_mask,
+                                       manifest=self._manifest_entries(
+                                           new_fnames))
+        if not len(changed) and not len(new_fnames):
+            return []
+        rows_read = dict((f_name, self._file_rows[f_name])
+                         for f_name in changed)
+        arrays = self._read_files(changed + new_fnames, self._legal_tags,
+                                  self._n_jobs)
+        for i, f_name in enumerate(changed):
+            arrays[i] = arrays[i][rows_read[f_name]:]
+        new_data = ufl.merge_sorted(arrays)
+        if self.registrations.msec:
+            new_data = ufl.convert_times(new_data, msec=True)
+        self._fnames = self._fnames + new_fnames
+        if not len(new_data):
+            return changed + new_fnames
+        old_data = self.registrations.data
+        data = ufl.merge_sorted([old_data, new_data])
+        self.registrations = BaseFunctions.Data(data, None)
+        self.mice = self.get_mice()
+        self.visits = self._update_visits(new_data, self.setup_config)
+        self.data_version += 1
+        times = self.get_times(self.mice)
+        self.session_start = min(times)
+        self.session_end = max(times)
+        if self.mask is not None:
+            self.registrations.mask_data(self.mask)
+            self.visits.mask_data(self.mask)
+        return changed + new_fnames
+
+    def _manifest_entries(self, fnames):
+        """Manifest entries of fnames, which are up to date"""
+        if not self._manifest:
+            return {}
+        return ufl.valid_manifest_entries(self.path, fnames, self._manifest)
+
+    def summary(self):
+        """Summary of data files read in (see
+        utils.for_loading.manifest_summary). Files missing in the manifest
+        are not included."""
+        return ufl.manifest_summary(self._manifest_entries(self._fnames),
+                                    max_break=self.max_break)
 
     def __repr__(self):
         """Nice string representation for printing this class."""
         mystring = 'Eco-HAB data loaded from:\n%s\nin the folder%s\n' % (
                    self._fnames.__str__(), self.path)
+        entries = self._manifest_entries(self._fnames)
+        if len(entries) == len(self._fnames):
+            summary = ufl.manifest_summary(entries, max_break=self.max_break)
+            if summary["rows"]:
+                mystring += '%d registrations of %d tags from %s to %s\n' % (
+                    summary["rows"], len(summary["tags"]),
+                    ufl.print_human_time(summary["start"]),
+                    ufl.print_human_time(summary["end"]))
         return mystring
 
 
+class ChunkedLoader(object):
+    """Read in Eco-HAB data located in path in chunks, e.g. for experiments
+    too long to be loaded by Loader at once.
+
+    ChunkedLoader can be used as a Loader by analyses, but only one chunk
+    of the experiment is kept in memory. Every chunk is a Loader with
+    a mask covering chunk_size seconds of the experiment (the core of
+    the chunk) and registrations 2*margin seconds before and after
+    the core. mask_data(start, end) makes the chunk covering start and
+    end the current chunk (reading it in, if necessary) and all the other
+    queries are passed to the current chunk. Analyses processing data
+    phase by phase (and masking data with a margin as
+    utility_functions.get_ecohab_data_with_margin does), e.g. get_activity
+    and get_incohort_sociability, read in one chunk after another, if
+    phases fit into chunks. Time windows longer than chunk_size (e.g.
+    binsize "ALL") are read in as a single longer chunk.
+
+    Visits are calculated separately for every chunk. Visits starting
+    up to margin before and after the core are the same as visits
+    calculated for the whole experiment, if no visit lasts longer than
+    margin (the same assumption is made by
+    utility_functions.get_ecohab_data_with_margin).
+
+    Mice, session_start, session_end and the first and the last
+    registration within every minute of the experiment are established
+    by reading in data files one by one, when ChunkedLoader is created.
+    Chunks without registrations are not read in (queries return
+    no data). Use a cache
+    (cache_dir) to avoid parsing data files again, when chunks are read
+    in. Diagnostics are not run in chunked mode.
+
+    Args:
+        path: string
+           directory containing Eco-HAB data or a zip archive with
+           Eco-HAB data (see Loader)
+
+    Core of the current chunk is stored in its chunk_start and chunk_end
+    attributes.
+
+    Keyword Args:
+        chunk_size: float
+           length (in sec) of the core of every chunk. Default 24 h.
+        margin: float
+           Default 12 h.
+        start: float
+           beginning of the first chunk (seconds from the epoch). Align
+           chunks with phases of the experiment, e.g.
+           start=timeline.get_time_from_epoch(first_phase)[0].
+           By default chunks start at session_start.
+
+        All the other keyword arguments are passed to Loader (see Loader).
+    """
+    # chunks are read in from the same data files, so the data
+    # does not change (see EcoHabDataBase.data_version)
+    data_version = 0
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.chunk_size = kwargs.pop("chunk_size", 24*3600)
+        self.margin = kwargs.pop("margin", 12*3600)
+        start = kwargs.pop("start", None)
+        self._data_mask = kwargs.pop("mask", None)
+        kwargs["diagnostics"] = False
+        self._kwargs = kwargs
+        self._chunk = None
+        self._window = None
+        self.mask = None
+        self._scan()
+        if start is None:
+            start = self.session_start
+        self.start = start
+        self._select(self.session_start, self.session_start)
+
+    def _scan(self):
+        """Establish mice, session bounds and minutes with registrations
+        (with the first and the last registration within every minute)
+        by reading in data files one by one"""
+        cache_dir = self._kwargs.get("cache_dir", None)
+        if cache_dir is True:
+            cache_dir = os.path.join(ufl.data_directory(self.path),
+                                     Loader.CACHE_DIR)
+        fnames = ufl.select_fnames(ufl.get_filenames(self.path),
+                                   self._data_mask)
+        if not len(fnames):
+            raise Exception("no data files in %s within mask %s"
+                            % (self.path, self._data_mask))
+        tags = set()
+        minutes = []
+        start = np.inf
+        end = -np.inf
+        for fname in fnames:
+            data = ufl.read_files(self.path, [fname], cache_dir=cache_dir,
+                                  mask=self._data_mask,
+                                  legal_tags=self._kwargs.get("legal_tags",
+                                                              "ALL"),
+                                  removed_antennas=self._kwargs.get(
+                                      "remove_antennas", []))[0]
+            if not len(data):
+                continue
+            tags.update(np.unique(data["Tag"]).tolist())
+            times = np.sort(data["Time"])
+            minute, idx = np.unique(np.floor(times/60), return_index=True)
+            minutes.append((minute, times[idx],
+                            times[np.append(idx[1:], len(times)) - 1]))
+            start = min(start, data["Time"].min())
+            end = max(end, data["Time"].max())
+        if not len(tags):
+            raise Exception("no registrations in %s" % self.path)
+        # minutes spanning two data files are merged
+        minute, first, last = [np.concatenate(x) for x in zip(*minutes)]
+        order = np.lexsort((first, minute))
+        minute, first, last = minute[order], first[order], last[order]
+        self._minutes, idx = np.unique(minute, return_index=True)
+        self._first = np.minimum.reduceat(first, idx)
+        self._last = np.maximum.reduceat(last, idx)
+        self.mice = EcoHabDataBase.sort_mice(list(tags))
+        self.session_start = float(start)
+        self.session_end = float(end)
+
+    def _has_data(self, start, end):
+        """False, if there are no registrations between start and end.
+        Registrations are checked with the first and the last registration
+        within every minute, so the answer is exact, unless start and end
+        are within the same minute (True is then returned, if there are
+        any registrations within that minute)."""
+        first_minute, last_minute = np.floor(start/60), np.floor(end/60)
+        idx = np.searchsorted(self._minutes, first_minute)
+        end_idx = np.searchsorted(self._minutes, last_minute, side="right")
+        if idx == end_idx:
+            return False
+        if first_minute == last_minute:
+            return bool(self._last[idx] >= start and
+                        self._first[idx] < end)
+        if self._minutes[idx] == first_minute:
+            if self._last[idx] >= start:
+                return True
+            idx += 1
+        if self._minutes[end_idx - 1] == last_minute:
+            if self._first[end_idx - 1] < end:
+                return True
+            end_idx -= 1
+        # registrations within whole minutes between start and end
+        return bool(end_idx > idx)
+
+    def _select(self, start, end):
+        """Make the chunk covering start and end the current chunk"""
+        # open bounds (see utility_functions.get_session_window)
+        # select the chunk covering the whole session
+        start = max(start, self.session_start)
+        end = min(end, self.session_end)
+        if self._window is not None and\
+           self._window[0] <= start and end <= self._window[1]:
+            return
+        idx = np.floor((start + self.margin - self.start)/self.chunk_size)
+        core = (self.start + idx*self.chunk_size,
+                self.start + (idx + 1)*self.chunk_size)
+        if end > core[1] + self.margin:
+            core = (start + self.margin, end - self.margin)
+        self._read_chunk(core)
+
+    def _read_chunk(self, core):
+        """Make the chunk with core the current chunk. Returns False,
+        if there are no registrations within the chunk. The chunk is then
+        an empty view of the previous chunk (data files are not read)."""
+        if self._chunk is not None and\
+           (self._chunk.chunk_start, self._chunk.chunk_end) == core:
+            return not self._chunk.chunk_empty
+        mask = (core[0] - 2*self.margin, core[1] + 2*self.margin)
+        if self._data_mask is not None:
+            data_start, data_end = ufl.mask_bounds(self._data_mask)
+            mask = (max(mask[0], data_start), min(mask[1], data_end))
+        empty = self._chunk is not None and not self._has_data(*mask)
+        if empty:
+            # no registrations (and visits) within mask, so a view
+            # of the previous chunk restricted to mask is empty
+            self._chunk = self._chunk.view(t_start=mask[0], t_end=mask[1])
+        else:
+            self._chunk = None
+            self._chunk = Loader(self.path, mask=mask, **self._kwargs)
+            empty = not len(self._chunk.registrations)
+        self._chunk.chunk_start, self._chunk.chunk_end = core
+        self._chunk.chunk_empty = empty
+        self._window = (core[0] - self.margin, core[1] + self.margin)
+        return not empty
+
+    def mask_data(self, start_time, end_time):
+        """
+        Select the chunk covering start_time and end_time and hide its
+        registrations and visits in ranges outside (start_time, end_time).
+
+        Args:
+           start_time: float
+           end_time: float
+        """
+        self._select(start_time, end_time)
+        self.mask = (start_time, end_time)
+        self._chunk.mask_data(start_time, end_time)
+
+    def unmask_data(self):
+        """Remove the mask of the current chunk"""
+        self.mask = None
+        self._chunk.unmask_data()
+
+    def get_visits(self, mice=None, cage=None, t_start=None, t_end=None):
+        """See EcoHabDataBase.get_visits. Visits are returned from
+        the chunk covering t_start and t_end."""
+        if t_start is None:
+            t_start = self.session_start
+        if t_end is None:
+            t_end = self.session_end
+        self._select(t_start, t_end)
+        if mice is None:
+            mice = self.mice
+        return self._chunk.get_visits(mice, cage, t_start, t_end)
+
+    def _query(self, name, mice, t_start, t_end):
+        """Call getter name of the chunk covering t_start and t_end
+        (or of the current chunk, if no bounds are given)"""
+        if t_start is not None and t_end is not None:
+            self._select(t_start, t_end)
+        return getattr(self._chunk, name)(mice, t_start, t_end)
+
+    def get_antennas(self, mice, t_start=None, t_end=None):
+        return self._query("get_antennas", mice, t_start, t_end)
+
+    def get_times(self, mice, t_start=None, t_end=None):
+        return self._query("get_times", mice, t_start, t_end)
+
+    def get_durations(self, mice, t_start=None, t_end=None):
+        return self._query("get_durations", mice, t_start, t_end)
+
+    def get_visit_addresses(self, mice, t_start=None, t_end=None):
+        return self._query("get_visit_addresses", mice, t_start, t_end)
+
+    def get_starttimes(self, mice, t_start=None, t_end=None):
+        return self._query("get_starttimes", mice, t_start, t_end)
+
+    def get_endtimes(self, mice, t_start=None, t_end=None):
+        return self._query("get_endtimes", mice, t_start, t_end)
+
+    def get_visit_durations(self, mice, t_start=None, t_end=None):
+        return self._query("get_visit_durations", mice, t_start, t_end)
+
+    def get_antennas_array(self, mice, t_start=None, t_end=None):
+        return self._query("get_antennas_array", mice, t_start, t_end)
+
+    def get_antenna_codes(self, mice, t_start=None, t_end=None):
+        return self._query("get_antenna_codes", mice, t_start, t_end)
+
+    def get_times_array(self, mice, t_start=None, t_end=None):
+        return self._query("get_times_array", mice, t_start, t_end)
+
+    def get_durations_array(self, mice, t_start=None, t_end=None):
+        return self._query("get_durations_array", mice, t_start, t_end)
+
+    def get_visit_addresses_array(self, mice, t_start=None, t_end=None):
+        return self._query("get_visit_addresses_array", mice, t_start,
+                           t_end)
+
+    def get_starttimes_array(self, mice, t_start=None, t_end=None):
+        return self._query("get_starttimes_array", mice, t_start, t_end)
+
+    def get_endtimes_array(self, mice, t_start=None, t_end=None):
+        return self._query("get_endtimes_array", mice, t_start, t_end)
+
+    def get_visit_durations_array(self, mice, t_start=None, t_end=None):
+        return self._query("get_visit_durations_array", mice, t_start,
+                           t_end)
+
+    def __iter__(self):
+        """Iterate over consecutive chunks (Loaders) of the experiment.
+        chunk_start and chunk_end attributes of every chunk specify its
+        core. Chunks without registrations are skipped."""
+        core_start = self.start
+        while core_start <= self.session_end:
+            core = (core_start, core_start + self.chunk_size)
+            if self._read_chunk(core):
+                yield self._chunk
+            core_start = core[1]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._chunk, name)
+
+
 class Merger(EcoHabDataBase):
     """Merge datasets from one modular Eco-HAB experiment. This means datasets
     obtained from different parts of the same experimental setup. Merger will
@@ -435,11 +1225,15 @@ class Merger(EcoHabDataBase):
         for loader in loaders:
             setup_name = loader.setup_name
             configs[setup_name] = loader.setup_config
-            datasets.append(ufl.rename_antennas(setup_name,
-                                                loader.registrations.data))
+            registrations = loader.registrations.data
+            if loader.registrations.msec:
+                registrations = ufl.convert_times(registrations, msec=False)
+            datasets.append(ufl.rename_antennas(setup_name, registrations))
             max_breaks.append(loader.max_break)
 
         data = ufl.append_data_sources(datasets)
+        # merged times are stored in milliseconds, if all loaders do so
+        msec = all([loader.registrations.msec for loader in loaders])
         mask = None
         self.visit_threshold = max([d.visit_threshold for d in loaders])
         if isinstance(prefix, str):
@@ -449,7 +1243,11 @@ class Merger(EcoHabDataBase):
         today = date.today().strftime("%d.%m.%y")
         self.res_dir = "%s_%s" % (res_dir, today)
         antennas = ExperimentSetupConfig(experiment_config, **configs)
-        super(Merger, self).__init__(data, mask,
+        if msec:
+            merged = ufl.convert_times(data, msec=True)
+        else:
+            merged = data
+        super(Merger, self).__init__(merged, mask,
                                      self.visit_threshold, antennas)
         self.cages = antennas.cages
         self.directions = antennas.directions
@@ -4,7 +4,8 @@ ecohab_loc = os.path.dirname(os.path.abspath(__file__))
 data_path = os.path.join(ecohab_loc, 'data')
 sample_data = os.path.join(data_path, "BALB_VPA_data_cohort_1")
 
-from .Loader import Loader, Merger
+from .Loader import Loader, Merger, ChunkedLoader
+from .LiveLoader import LiveLoader
 from .Timeline import Timeline
 from .SetupConfig import SetupConfig, ExperimentSetupConfig, IdentityConfig
 from .incohort_sociability import get_incohort_sociability
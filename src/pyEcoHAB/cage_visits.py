@@ -8,7 +8,7 @@ from .plotting_functions import make_visit_duration_histogram
 
 
 def get_visits(intervals, t_start, t_stop):
-    interval_array = np.array(intervals)
+    interval_array = np.asarray(intervals)
     visit_list = []
     added_interval = False
 
@@ -42,25 +42,53 @@ def get_visits(intervals, t_start, t_stop):
 
 def get_visits_in_bins(intervals, time_start,
                        time_stop, binsize):
+    """Split visits (intervals sorted by start) into consecutive bins
+    (see get_visits). Visits starting in every bin are found with a single
+    binary search instead of scanning intervals for every bin."""
     length = utils.get_length(time_start, time_stop, binsize)
+    intervals = np.array(intervals)
+    edges = [time_start + i*binsize for i in range(length + 1)]
+    if length:
+        edges[-1] = min(edges[-1], time_stop)
+    idx = None
+    if len(intervals):
+        idx = np.searchsorted(intervals[:, 0], edges)
+    return split_visits(intervals, edges, idx)
+
+
+def split_visits(intervals, edges, idx):
+    """Split visits (an array of intervals sorted by start) into bins
+    between consecutive edges (see get_visits). idx[i] is the index
+    of the first visit starting at or after edges[i]."""
     visits = []
     added_visit = []
-    for i in range(length):
-        t_start = time_start + i*binsize
-        t_end = time_start + (i+1)*binsize
-        if t_end > time_stop:
-            t_end = time_stop
-        last_visits, outs = get_visits(intervals, t_start, t_end)
-        visits.append(last_visits)
-        added_visit.append(outs)
+    for i in range(len(edges) - 1):
+        t_start, t_end = edges[i], edges[i + 1]
+        visit_list = []
+        added_interval = False
+        if len(intervals):
+            first, last = idx[i], idx[i + 1]
+            if first > 0 and intervals[first - 1, 1] > t_start:
+                added_interval = True
+                visit_list.append(min(t_end,
+                                      intervals[first - 1, 1]) - t_start)
+            for i_start, i_stop in intervals[first:last].tolist():
+                visit_list.append(min(t_end, i_stop) - i_start)
+        visits.append(visit_list)
+        added_visit.append(added_interval)
     return visits, added_visit
 
 
-def calc_visit_per_mouse(intervals, t_start, t_end, binsize):
-    visits_in_bins, added_visit = get_visits_in_bins(intervals,
-                                                     t_start,
-                                                     t_end,
-                                                     binsize)
+def calc_visit_per_mouse(intervals, t_start, t_end, binsize,
+                         edges=None, idx=None):
+    if edges is None:
+        visits_in_bins, added_visit = get_visits_in_bins(intervals,
+                                                         t_start,
+                                                         t_end,
+                                                         binsize)
+    else:
+        visits_in_bins, added_visit = split_visits(np.array(intervals),
+                                                   edges, idx)
     visits = []
     for i, o in enumerate(visits_in_bins):
         visits.append(len(o) - added_visit[i])
@@ -68,24 +96,47 @@ def calc_visit_per_mouse(intervals, t_start, t_end, binsize):
     return visits, durations, visits_in_bins
 
 
+def address_index(data, address, ranges):
+    """Translate ranges of visits in bins (see BinPlan.index with
+    visits=True) to indices of the first visits to address starting
+    in every bin (see split_visits). data are visits (address, start,
+    end) overlapping the bins, so visits starting before the first bin
+    precede visits indexed by ranges."""
+    starts, stops = ranges
+    offset = len(data) - stops[-1] + starts[0]
+    to_address = np.array([a == address for a, s, e in data], dtype=int)
+    counts = np.concatenate([[0], np.cumsum(to_address)])
+    return counts[offset + np.append(starts, stops[-1])]
+
+
 def calculate_visits_and_durations(data, mice, address, t_start, t_end,
-                                   binsize):
+                                   binsize, edges=None, index=None):
+    """Count visits of mice to address and their durations in bins
+    of binsize seconds between t_start and t_end. If edges of bins
+    and per-mouse ranges of visits in bins (see BinPlan.edges and
+    BinPlan.index with visits=True) are given, bins are taken from edges
+    and visits are not searched for."""
     visits = OrderedDict()
     durations = OrderedDict()
     all_visits = OrderedDict()
     for m in mice:
         ints = utils.get_intervals(data[m], address)
+        idx = None
+        if edges is not None:
+            idx = address_index(data[m], address, index[m])
         visits[m], durations[m], all_visits[m] = calc_visit_per_mouse(ints,
                                                                       t_start,
                                                                       t_end,
-                                                                      binsize)
+                                                                      binsize,
+                                                                      edges,
+                                                                      idx)
     return visits, durations, all_visits
 
 
 def get_activity(ecohab_data, timeline, binsize, res_dir="", prefix="",
                  remove_mouse="", save_histogram=False, delimiter=";",
                  headers=['Number of visits to',
-                          'Total time (sec) in']):
+                          'Total time (sec) in'], plan=None):
     """Calculate activity of each mouse in time bins across the phases
     of the experiment.
 
@@ -137,6 +188,10 @@ def get_activity(ecohab_data, timeline, binsize, res_dir="", prefix="",
         headers : list of strings
            strings that will be written above activity parameters for each
            compartment.
+        plan : BinPlan
+           bins of timeline and binsize, which can be shared with other
+           analyses using the same bins (see utility_functions.get_bin_plan).
+           Bins longer than 12 h span the experiment.
 
     Returns: data: a dictionary of visits and times spent in cages.
        first key: address, second key: 0 -- visits, 1 -- durations,
@@ -147,8 +202,6 @@ def get_activity(ecohab_data, timeline, binsize, res_dir="", prefix="",
         prefix = ecohab_data.prefix
     if res_dir == "":
         res_dir = ecohab_data.res_dir
-    phases = utils.filter_dark_light(timeline.sections())
-
     mice = utils.get_mice(ecohab_data.mice, remove_mouse)
     add_info_mice = utils.add_info_mice_filename(remove_mouse)
     if isinstance(binsize, int) or isinstance(binsize, float):
@@ -156,42 +209,25 @@ def get_activity(ecohab_data, timeline, binsize, res_dir="", prefix="",
         fname = '%sactivity_bin_%3.2f_h.csv' % (prefix,
                                                 binsize/3600)
         histogram_fname = 'activity_histograms_bin_%3.1f_h' % (binsize/3600)
-
-        if binlen > 12*3600:
-            t_start = timeline.get_time_from_epoch(phases[0])[0]
-            t_end = timeline.get_time_from_epoch(phases[-1])[-1]
-            phases = []
-            times = []
-            i = 1
-            while t_start < t_end:
-                times.append((t_start, t_start + binlen))
-                phases.append("%d_x" % i)
-                i += 1
-                t_start += binsize
-        else:
-            times = [timeline.get_time_from_epoch(phase) for phase in phases]
     elif isinstance(binsize, str):
-        if binsize.lower() == "all":
-            if "ALL" in timeline.sections():
-                times = [timeline.get_time_from_epoch("ALL")]
-            elif "All" in timeline.sections():
-                times = [timeline.get_time_from_epoch("All")]
-            elif "all" in timeline.sections():
-                times = [timeline.get_time_from_epoch("all")]
-            phases = ["ALL"]
-        else:
-            times = [timeline.get_time_from_epoch(phase) for phase in phases]
-
         fname = '%sactivity_bin_%s.csv' % (prefix,
                                            binsize)
         histogram_fname = 'activity_histograms_bin_%s' % binsize
+    plan = utils.get_bin_plan(timeline, binsize, plan, threshold=12*3600)
+    phases = plan.phases
+    times = [plan.window(phase) for phase in phases]
 
     phase_len = max([t2-t1 for (t1, t2) in times])
     data = {c: {0: {}, 1: {}} for c in ecohab_data.cages}
-    ecohab_data_data = utils.prepare_data(ecohab_data, mice)
     bin_labels = {}
     for idx_phase, phase in enumerate(phases):
         t_start, t_end = times[idx_phase]
+        # visits are prepared phase by phase (e.g. one chunk
+        # of a ChunkedLoader at a time)
+        ecohab_data_data = utils.prepare_data(ecohab_data, mice,
+                                              (t_start, t_end), clip=False)
+        edges = plan.edges(phase).tolist()
+        index = plan.index(ecohab_data, mice, phase, visits=True)
         visits_in_cages = {}
         if isinstance(binsize, str):
             binlen = t_end-t_start
@@ -204,7 +240,9 @@ def get_activity(ecohab_data, timeline, binsize, res_dir="", prefix="",
                                                         address,
                                                         t_start,
                                                         t_end,
-                                                        binlen)
+                                                        binlen,
+                                                        edges,
+                                                        index)
             data[address][0][phase] = visit_data[0]
             data[address][1][phase] = visit_data[1]
             visits_in_cages[address] = visit_data[2]
@@ -142,10 +142,11 @@ def tube_dominance_2_mice_single_phase(ecohab_data, mouse1, mouse2,
     """We're checking here, how many times mouse1 dominates over mouse2
     between t_start and t_end.
     """
-    m1_times, m1_antennas = utils.get_times_antennas(ecohab_data, mouse1,
-                                                     t_start, t_end)
-    m2_times, m2_antennas = utils.get_times_antennas(ecohab_data, mouse2,
-                                                     t_start, t_end)
+    registrations = utils.get_times_arrays_antennas(ecohab_data,
+                                                    [mouse1, mouse2],
+                                                    t_start, t_end)
+    m1_times, m1_antennas = registrations[mouse1]
+    m2_times, m2_antennas = registrations[mouse2]
     domination_counter = check_mouse1_defending(m1_antennas, m1_times,
                                                 m2_antennas, m2_times,
                                                 ecohab_data.homecage_antenna,
@@ -158,15 +159,18 @@ def tube_dominance_2_cages(data, timeline, phase, hc_a):
     mice = data.mice
     st, en = timeline.get_time_from_epoch(phase)
     dominance = np.zeros((len(mice), len(mice)))
+    registrations = utils.get_times_arrays_antennas(data, mice, st, en)
     for i, mouse1 in enumerate(mice):
+        m1_times, m1_antennas = registrations[mouse1]
         for j, mouse2 in enumerate(mice):
             if i != j:
-                dominance[i, j] = tube_dominance_2_mice_single_phase(data,
-                                                                     mouse1,
-                                                                     mouse2,
-                                                                     st,
-                                                                     en,
-                                                                     hc_a)
+                m2_times, m2_antennas = registrations[mouse2]
+                dominance[i, j] = check_mouse1_defending(m1_antennas,
+                                                         m1_times,
+                                                         m2_antennas,
+                                                         m2_times,
+                                                         data.homecage_antenna,
+                                                         data.setup_config)
     return dominance
 
 
@@ -239,6 +239,7 @@ def following_matrices(directions_dict, mice, t_start, t_stop, keys):
 def following_single_direction(intervals_m1, intervals_m2):
     t_starts_m1, t_ends_m1 = intervals_m1
     t_starts_m2, t_ends_m2 = intervals_m2
+    t_starts_m2 = np.asarray(t_starts_m2)
     counter = 0
     time_together = 0
     intervals = []
@@ -265,7 +266,7 @@ def get_dynamic_interactions(ecohab_data, timeline, N, binsize="whole_phase",
                              save_distributions=True, save_figures=False,
                              return_median=False, delimiter=";",
                              save_times_following=False, seed=None,
-                             full_dir_tree=True):
+                             full_dir_tree=True, plan=None):
     if res_dir == "":
         res_dir = ecohab_data.res_dir
     if prefix == "":
@@ -275,7 +276,8 @@ def get_dynamic_interactions(ecohab_data, timeline, N, binsize="whole_phase",
     phases, times, data, data_keys = utils.get_registrations_bins(ecohab_data,
                                                                   timeline,
                                                                   binsize,
-                                                                  mice)
+                                                                  mice,
+                                                                  plan=plan)
     if isinstance(seed, int):
         random.seed(seed)
     all_phases, bin_labels = data_keys
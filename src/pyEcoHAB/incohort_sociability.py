@@ -5,6 +5,7 @@ import os
 from collections import OrderedDict
 import numpy as np
 from . import utility_functions as utils
+from .Loader import ChunkedLoader
 from .plotting_functions import single_in_cohort_soc_plot
 from .plotting_functions import make_RasterPlot
 from .write_to_file import write_binned_data
@@ -176,7 +177,7 @@ def single_phase_results(data, mice, addresses, total_time):
 
 def get_incohort_sociability(ecohab_data, timeline, binsize, res_dir="",
                              prefix="", remove_mouse="", delimiter=";",
-                             full_dir_tree=True):
+                             full_dir_tree=True, plan=None):
 
     """
     Calculate in-cohort sociability for each pair of mice in time bins across
@@ -225,6 +226,9 @@ def get_incohort_sociability(ecohab_data, timeline, binsize, res_dir="",
            in ecohab_data.
         delimiter : str, optional
            String or character separating columns.
+        plan : BinPlan
+           bins of timeline and binsize, which can be shared with other
+           analyses using the same bins (see utility_functions.get_bin_plan).
     """
     if prefix == "":
         prefix = ecohab_data.prefix
@@ -238,9 +242,11 @@ def get_incohort_sociability(ecohab_data, timeline, binsize, res_dir="",
                                                                add_info_mice)
     excess_prefix = "incohort_sociability_excess_time_%s_%s" % (prefix,
                                                                 add_info_mice)
-    phases, time, data, keys = utils.prepare_binned_data(ecohab_data,
-                                                         timeline, binsize,
-                                                         mice)
+    # a ChunkedLoader reads in one chunk after another, if phases are
+    # prepared one at a time
+    phases, time, data, keys = utils.prepare_binned_data(
+        ecohab_data, timeline, binsize, mice, plan=plan,
+        lazy=isinstance(ecohab_data, ChunkedLoader))
 
     if isinstance(binsize, int) or isinstance(binsize, float):
         binsize_name = "%3.2f_h" % (binsize/3600)
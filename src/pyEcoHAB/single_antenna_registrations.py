@@ -12,7 +12,7 @@ from .plotting_functions import single_timeline_heat_map
 
 def get_single_antenna_stats(ecohab_data, timeline, binsize, antennas="ALL",
                              res_dir="", prefix="", remove_mouse="",
-                             delimiter=";"):
+                             delimiter=";", plan=None):
     """
     Count number and combined durations of registrations of each mouse tag
     by specified antennas in bins of size binsize for tags
@@ -43,6 +43,10 @@ def get_single_antenna_stats(ecohab_data, timeline, binsize, antennas="ALL",
            in ecohab_data.
         delimiter : str, optional
            String or character separating columns.
+        plan : BinPlan
+           bins of timeline and binsize, which can be shared with other
+           analyses using the same bins (see utility_functions.get_bin_plan).
+           Bins of every section of timeline are not clipped to sections.
     """
     if prefix == "":
         prefix = ecohab_data.prefix
@@ -54,20 +58,14 @@ def get_single_antenna_stats(ecohab_data, timeline, binsize, antennas="ALL",
     bin_ = binsize/3600
     fname_durations = "registration_duration_%4.2fh" % bin_
     fname_count = "registration_count_%4.2fh" % bin_
-    shortest_phase = utils.get_shortest_phase_duration(timeline)
-    if binsize <= shortest_phase:
-        phases = timeline.sections()
-        times = [timeline.get_time_from_epoch(phase) for phase in phases]
+    # bins are not clipped to phases (as in get_registration_stats)
+    plan = utils.get_bin_plan(timeline, binsize, plan,
+                              phases=timeline.sections(), clip=False)
+    if binsize > utils.get_shortest_phase_duration(timeline):
+        phases = ["%dxbin_%5.2fh" % (i, bin_)
+                  for i in range(len(plan.phases))]
     else:
-        t_start, t_end = timeline.get_time_from_epoch("ALL")
-        phases = []
-        times = []
-        i = 0
-        while t_start < t_end:
-            phases.append("%dxbin_%5.2fh" % (i, bin_))
-            times.append((t_start, t_start+binsize))
-            t_start += binsize
-            i += 1
+        phases = plan.phases
     if antennas == "ALL":
         antennas = sorted(set(ecohab_data.get_antennas(ecohab_data.mice)))
     if antennas in ecohab_data.all_antennas:
@@ -77,19 +75,31 @@ def get_single_antenna_stats(ecohab_data, timeline, binsize, antennas="ALL",
         You should either provide a list of ints, an int or 'ALL'""")
 
     for i, phase in enumerate(phases):
-        t_start, t_end = times[i]
+        plan_phase = plan.phases[i]
+        t_start, t_end = plan.window(plan_phase)
+        index = plan.index(ecohab_data, mice, plan_phase)
+        registrations = {}
+        for mouse in mice:
+            registrations[mouse] = (
+                np.array(ecohab_data.get_antennas(mouse, t_start, t_end)),
+                ecohab_data.get_durations(mouse, t_start, t_end))
         count = OrderedDict()
         durations = OrderedDict()
         for antenna in antennas:
             count[antenna] = OrderedDict()
             durations[antenna] = OrderedDict()
             for mouse in mice:
-                results = ecohab_data.get_registration_stats(mouse,
-                                                             t_start,
-                                                             t_end,
-                                                             antenna,
-                                                             binsize)
-                count[antenna][mouse], durations[antenna][mouse] = results
+                mouse_antennas, mouse_durations = registrations[mouse]
+                count[antenna][mouse] = []
+                durations[antenna][mouse] = []
+                for start, stop in zip(*index[mouse]):
+                    indices = np.where(mouse_antennas[start:stop] ==
+                                       antenna)[0]
+                    count[antenna][mouse].append(len(indices))
+                    sum_time = 0
+                    for ind in indices:
+                        sum_time += mouse_durations[start + ind]
+                    durations[antenna][mouse].append(sum_time/1000)
 
             single_timeline_heat_map(durations[antenna],
                                      res_dir,
@@ -114,7 +114,7 @@ def get_cage_tunnel_transitions(t_dict, setup_config):
 
 def get_antenna_transition_durations(ecohab_data, timeline, binsize=12*3600,
                                      res_dir="", prefix="", remove_mouse="",
-                                     delimiter=";"):
+                                     delimiter=";", plan=None):
     """Save and plot histograms of durations between consecutive tag
     registrations by antenna pairs.
 
@@ -141,6 +141,9 @@ def get_antenna_transition_durations(ecohab_data, timeline, binsize=12*3600,
            in ecohab_data.
         delimiter : str, optional
            String or character separating columns
+        plan : BinPlan
+           bins of timeline and binsize, which can be shared with other
+           analyses using the same bins (see utility_functions.get_bin_plan).
 
 
     Returns:
@@ -158,7 +161,8 @@ def get_antenna_transition_durations(ecohab_data, timeline, binsize=12*3600,
                                                              timeline,
                                                              binsize,
                                                              mice,
-                                                             function)
+                                                             function,
+                                                             plan=plan)
     transitions = antenna_transtions_in_phases(data, times, phases,
                                                keys, ecohab_data.setup_config,
                                                res_dir, prefix, delimiter=";")
@@ -109,16 +109,13 @@ def tube_dominance_single_phase(ecohab_data, timeline, phase, normalization):
     t_start, t_end = timeline.get_time_from_epoch(phase)
     dominance = np.zeros((len(mice), len(mice)))
     setup_config = ecohab_data.setup_config
+    registrations = utils.get_times_arrays_antennas(ecohab_data, mice,
+                                                    t_start, t_end)
     for i, mouse1 in enumerate(mice):
-        m1_times, m1_antennas = utils.get_times_antennas(ecohab_data, mouse1,
-                                                         t_start, t_end)
+        m1_times, m1_antennas = registrations[mouse1]
         for j, mouse2 in enumerate(mice):
             if i != j:
-                m2_times, m2_antennas = utils.get_times_antennas(ecohab_data,
-                                                                 mouse2,
-                                                                 t_start,
-                                                                 t_end)
-
+                m2_times, m2_antennas = registrations[mouse2]
                 dominance[i, j] = check_mouse1_pushing(m1_antennas,
                                                        m1_times,
                                                        m2_antennas,
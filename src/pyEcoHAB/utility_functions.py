@@ -5,6 +5,7 @@ import os
 import time
 import sys
 from collections import OrderedDict
+from collections.abc import Mapping
 import numpy as np
 
 
@@ -154,18 +155,19 @@ def add_info_mice_filename(remove_mouse):
 
 
 def get_idx_pre(t0, times):
-    idxs = np.where(np.array(times) < t0)[0]
+    idxs = np.where(np.asarray(times) < t0)[0]
     if len(idxs):
         return idxs[-1]
     return None
 
 
 def get_idx_between(t0, t1, times):
-    return np.where((np.array(times) >= t0) & (np.array(times) < t1))[0]
+    times = np.asarray(times)
+    return np.where((times >= t0) & (times < t1))[0]
 
 
 def get_idx_post(t1, times):
-    idxs = np.where(np.array(times) > t1)[0]
+    idxs = np.where(np.asarray(times) > t1)[0]
     if len(idxs):
         return idxs[0]
     return None
@@ -179,14 +181,30 @@ def change_state(antennas):
     return indx
 
 
+def get_session_window(ecohab_data):
+    """Return open bounds (t_start, t_end) of queries returning all
+    the registrations and visits of ecohab_data, also if its session
+    bounds are None (e.g. of an empty view). The mask is neither used
+    nor changed."""
+    return -np.inf, np.inf
+
+
 def get_times_antennas(e_data, mouse, t_1, t_2):
     if t_1 == 0 and t_2 == -1:
-        e_data.unmask_data()
-        return e_data.get_times(mouse), e_data.get_antennas(mouse)
-    e_data.mask_data(t_1, t_2)
-    antennas, times = e_data.get_antennas(mouse), e_data.get_times(mouse)
-    e_data.unmask_data()
-    return times, antennas
+        t_1, t_2 = get_session_window(e_data)
+    return (e_data.get_times(mouse, t_1, t_2),
+            e_data.get_antennas(mouse, t_1, t_2))
+
+
+def get_times_arrays_antennas(ecohab_data, mice, t_1, t_2):
+    """Registration times (float64 arrays) and antennas (lists) of every
+    mouse between t_1 and t_2, read in once for repeated pairwise
+    comparisons"""
+    out = {}
+    for mouse in mice:
+        out[mouse] = (ecohab_data.get_times_array(mouse, t_1, t_2),
+                      ecohab_data.get_antennas(mouse, t_1, t_2))
+    return out
 
 
 def get_times_antennas_list_of_mice(ecohab_data, mice, t_1, t_2):
@@ -308,31 +326,37 @@ def get_indices(t_start, t_end, starts, ends):
 def get_ecohab_data_with_margin(ecohab_data, mouse, t_start, t_end,
                                 margin=12*3600):
     if t_start == 0 and t_end == -1:
-        return ecohab_data.get_visit_addresses(mouse),\
-            ecohab_data.get_starttimes(mouse),\
-            ecohab_data.get_endtimes(mouse)
-    ecohab_data.mask_data(t_start - margin, t_end + margin)
-    adresses = ecohab_data.get_visit_addresses(mouse)
-    starts = ecohab_data.get_starttimes(mouse)
-    ends = ecohab_data.get_endtimes(mouse)
-    ecohab_data.unmask_data()
-    return adresses, starts, ends
-
-
-def prepare_data(ecohab_data, mice, times=None):
-    """Prepare masked data."""
+        t_start, t_end = get_session_window(ecohab_data)
+    else:
+        t_start, t_end = t_start - margin, t_end + margin
+    return ecohab_data.get_visit_addresses(mouse, t_start, t_end),\
+        ecohab_data.get_starttimes(mouse, t_start, t_end),\
+        ecohab_data.get_endtimes(mouse, t_start, t_end)
+
+
+def prepare_data(ecohab_data, mice, times=None, clip=True):
+    """Prepare masked data.
+
+    Visits of every mouse starting or ending between times are clipped
+    to times. If clip is False, all visits overlapping times are returned
+    unchanged."""
     data = {}
     if not isinstance(mice, list):
         mice = [mice]
     if times is None:
-        ecohab_data.unmask_data()
-        times = (ecohab_data.get_starttimes(mice)[0],
-                 ecohab_data.get_endtimes(mice)[-1])
+        window = get_session_window(ecohab_data)
+        times = (ecohab_data.get_starttimes(mice, *window)[0],
+                 ecohab_data.get_endtimes(mice, *window)[-1])
     t_start, t_end = times
     for mouse in mice:
         data[mouse] = []
         ads, sts, ens = get_ecohab_data_with_margin(ecohab_data, mouse,
                                                     t_start, t_end)
+        if not clip:
+            idxs = np.where((np.array(sts) < t_end) &
+                            (np.array(ens) > t_start))[0]
+            data[mouse] = [(ads[i], sts[i], ens[i]) for i in idxs]
+            continue
         idxs = get_indices(t_start, t_end, sts, ens)
         for i in idxs:
             data[mouse].append((ads[i],
@@ -341,6 +365,261 @@ def prepare_data(ecohab_data, mice, times=None):
     return data
 
 
+def prepare_data_in_bins(ecohab_data, mice, plan, phase, margin=12*3600):
+    """Prepare data (see prepare_data) in every bin of phase of plan
+    (a BinPlan). Visits of every mouse are read in once for the phase
+    and split into bins with index ranges of plan (visits of a mouse
+    do not overlap, so their ends are sorted as well)."""
+    bins = plan.bins[phase]
+    t_start, t_end = plan.window(phase)
+    edges = plan.edges(phase)
+    index = plan.index(ecohab_data, mice, phase, visits=True)
+    data = OrderedDict((label, {}) for label in bins)
+    for mouse in mice:
+        ads, sts, ens = get_ecohab_data_with_margin(ecohab_data, mouse,
+                                                    t_start, t_end, margin)
+        offset = np.searchsorted(np.array(sts), t_start)
+        first, last = index[mouse]
+        ends = np.searchsorted(np.array(ens), edges)
+        for i, (label, (st, en)) in enumerate(bins.items()):
+            idxs = set(range(offset + first[i], offset + last[i]))
+            idxs.update(j for j in range(ends[i], ends[i + 1])
+                        if sts[j] >= st - margin)
+            data[label][mouse] = [(ads[j], max(sts[j], st),
+                                   min(ens[j], en)) for j in sorted(idxs)]
+    return data
+
+
+class PhaseData(Mapping):
+    """
+    Data prepared with prepare_data for time bins of consecutive phases.
+    Data of a phase is prepared, when the phase is accessed, and only
+    the most recently accessed phase is kept in memory, so that phases
+    (e.g. of a ChunkedLoader) can be processed one at a time.
+    Accessing a phase other than the most recent one prepares its data
+    again, so phases should be processed in order, once each.
+    PhaseData is returned by prepare_binned_data(..., lazy=True).
+
+    Args:
+    ecohab_data: Loader or Loader_like
+    mice: list
+    times: OrderedDict
+       time bins (a dictionary of bin labels and (start, end) tuples)
+       of every phase
+
+    Keyword Args:
+    plan: BinPlan
+       if times are bins of plan, visits of a phase are read in once
+       and split into bins (see prepare_data_in_bins)
+    """
+    def __init__(self, ecohab_data, mice, times, plan=None):
+        self.ecohab_data = ecohab_data
+        self.mice = mice
+        self.times = times
+        self.plan = plan
+        self._phase = None
+        self._data = None
+
+    def __getitem__(self, phase):
+        if phase != self._phase:
+            if self.plan is not None:
+                data = prepare_data_in_bins(self.ecohab_data, self.mice,
+                                            self.plan, phase)
+            else:
+                data = OrderedDict()
+                for label, time in self.times[phase].items():
+                    data[label] = prepare_data(self.ecohab_data, self.mice,
+                                               time)
+            self._phase, self._data = phase, data
+        return self._data
+
+    def __iter__(self):
+        return iter(self.times)
+
+    def __len__(self):
+        return len(self.times)
+
+
+class BinPlan(object):
+    """
+    Time bins of the phases of an experiment established once from
+    a timeline and a binsize, so that analyses share phase boundaries,
+    bin edges and bin labels instead of recomputing them. A plan can be
+    passed to analyses, which need the same bins (see get_bin_plan).
+
+    Args:
+    timeline: Timeline
+    binsize: number (seconds) or string
+       A number splits every phase into bins of binsize seconds (the last
+       bin of a phase ends with the phase). If binsize is longer than
+       threshold, the experiment is split into consecutive bins of binsize
+       seconds instead, which are named "1_x", "2_x", etc.
+       "ALL" -- a single bin spanning the ALL section of the timeline.
+       Any other string -- every phase is a single bin.
+
+    Keyword Args:
+    phases: list
+       sections of the timeline. Default: dark and light phases.
+    threshold: float
+       Default: duration of the shortest phase.
+    clip: bool
+       If False, the last bin of every phase is binsize long, even if it
+       ends after the phase. Default True.
+
+    Attributes:
+    phases: list of phase names
+    times: OrderedDict of (start, end) tuples of every phase
+    bins: OrderedDict of bin labels and (start, end) tuples of every phase
+    labels: OrderedDict of bin labels of every phase
+
+    Index ranges of every mouse (see index) are found once, when they are
+    first needed, and kept by the plan for the dataset they were found in
+    until the data of the dataset changes (see data_version of Loader).
+    """
+    def __init__(self, timeline, binsize, phases=None, threshold=None,
+                 clip=True):
+        self.binsize = binsize
+        self._data = None
+        self._version = None
+        self._index = {}
+        self.times = OrderedDict()
+        self.bins = OrderedDict()
+        self.labels = OrderedDict()
+        if phases is None:
+            phases = filter_dark_light(timeline.sections())
+        if isinstance(binsize, str):
+            if binsize.lower() == "all":
+                section = "ALL"
+                for name in ["ALL", "All", "all"]:
+                    if name in timeline.sections():
+                        section = name
+                        break
+                self.times["ALL"] = timeline.get_time_from_epoch(section)
+            else:
+                for phase in phases:
+                    self.times[phase] = timeline.get_time_from_epoch(phase)
+            for phase, time in self.times.items():
+                self.labels[phase] = [0]
+                self.bins[phase] = OrderedDict([(0, time)])
+        else:
+            if threshold is None:
+                threshold = get_shortest_phase_duration(timeline)
+            # you can not iterate by phases, if bins are longer than phases
+            if binsize > threshold:
+                t_start, t_end = timeline.get_time_from_epoch(phases)
+                i = 1
+                while t_start < t_end:
+                    self.times["%d_x" % i] = (t_start, t_start + binsize)
+                    i += 1
+                    t_start += binsize
+            else:
+                for phase in phases:
+                    self.times[phase] = timeline.get_time_from_epoch(phase)
+            for phase, (t_start, t_end) in self.times.items():
+                self.labels[phase] = get_times(binsize,
+                                               time_end=t_end-t_start)
+                self.bins[phase] = OrderedDict()
+                for label in self.labels[phase]:
+                    t_e = t_start + binsize
+                    if clip and t_e > t_end:
+                        t_e = t_end
+                    self.bins[phase][label] = (t_start, t_e)
+                    t_start += binsize
+        self.phases = list(self.times.keys())
+
+    def edges(self, phase):
+        """Return edges of consecutive bins of phase (an array one element
+        longer than the number of bins)"""
+        bins = list(self.bins[phase].values())
+        return np.array([b[0] for b in bins] + [bins[-1][1]])
+
+    def window(self, phase):
+        """Return (start, end) of bins of phase"""
+        edges = self.edges(phase)
+        return edges[0], edges[-1]
+
+    def ranges(self, times, phase):
+        """Return [start, stop) index ranges (two arrays) of sorted times
+        in every bin of phase (a bin includes its start and excludes
+        its end, as windows of t_start/t_end queries)"""
+        idx = np.searchsorted(times, self.edges(phase))
+        return idx[:-1], idx[1:]
+
+    def index(self, ecohab_data, mice, phase, visits=False):
+        """
+        Return per-mouse [start, stop) index ranges of registrations
+        in every bin of phase. Ranges index arrays of registrations
+        of the mouse within window(phase), e.g. returned by
+        ecohab_data.get_times_array(mouse, *plan.window(phase)).
+        If visits is True, ranges of visits (by visit start) are returned
+        instead, e.g. indexing
+        ecohab_data.get_starttimes_array(mouse, *plan.window(phase)).
+        Ranges are found once for every phase and mouse. Ranges found
+        in another dataset or before the data of the dataset changed
+        (e.g. with Loader.refresh) are discarded.
+        """
+        if ecohab_data is not self._data or\
+           ecohab_data.data_version != self._version:
+            self._data = ecohab_data
+            self._version = ecohab_data.data_version
+            self._index = {}
+        cache = self._index.setdefault((phase, visits), {})
+        t_start, t_end = self.window(phase)
+        out = OrderedDict()
+        for mouse in mice:
+            if mouse not in cache:
+                if visits:
+                    times = ecohab_data.get_starttimes_array(mouse, t_start,
+                                                             t_end)
+                else:
+                    times = ecohab_data.get_times_array(mouse, t_start,
+                                                        t_end)
+                cache[mouse] = self.ranges(times, phase)
+            out[mouse] = cache[mouse]
+        return out
+
+
+def get_bin_plan(timeline, binsize, plan=None, **kwargs):
+    """Return BinPlan(timeline, binsize, **kwargs) or plan, if plan
+    has the same binsize and bins. Bins of a plan made with other options
+    (phases, threshold or clip) would change results of an analysis,
+    so an exception is raised instead."""
+    expected = BinPlan(timeline, binsize, **kwargs)
+    if plan is None:
+        return expected
+    if plan.binsize != binsize or plan.bins != expected.bins:
+        raise Exception("BinPlan of binsize %s does not match bins of"
+                        " binsize %s required by the analysis"
+                        % (plan.binsize, binsize))
+    return plan
+
+
+def encode_antennas(codes, same_pipe, same_address, opposite_pipe, address,
+                    surrounding, address_not_adjacent, internal_antennas):
+    """
+    Translate antenna labels in setup config dictionaries (see
+    get_animal_position) to antenna codes. codes is a dictionary
+    mapping antenna labels to codes. Codes have to be assigned to sorted
+    labels, so that comparing codes gives the same result as comparing
+    labels. Antennas without codes are skipped.
+    """
+    def translate_keys(dictionary):
+        return dict((codes[key], value) for key, value in dictionary.items()
+                    if key in codes)
+
+    def translate_lists(dictionary):
+        return dict((key, [codes[a] for a in value if a in codes])
+                    for key, value in translate_keys(dictionary).items())
+
+    new_surrounding = dict(((codes[key[0]], codes[key[1]]), value)
+                           for key, value in surrounding.items()
+                           if key[0] in codes and key[1] in codes)
+    return (translate_lists(same_pipe), translate_lists(same_address),
+            translate_lists(opposite_pipe), translate_keys(address),
+            new_surrounding, translate_keys(address_not_adjacent),
+            [codes[a] for a in internal_antennas if a in codes])
+
+
 def get_animal_position(times, antennas, mouse, threshold, same_pipe,
                         same_address, opposite_pipe, address, surrounding,
                         address_not_adjacent, internal_antennas):
@@ -472,80 +751,45 @@ def get_dark_light_data(phase, timeline, ecohab_data, mice):
     return out_phases, {phase: {0: total_time}}, {phase: {0: data}}
 
 
-def prepare_binned_data(ecohab_data, timeline, bins, mice):
+def prepare_binned_data(ecohab_data, timeline, bins, mice, plan=None,
+                        lazy=False):
+    """Prepare data in time bins of bins seconds (see BinPlan).
+    plan (a BinPlan of timeline and bins, see get_bin_plan) can be reused
+    by many analyses. Data of all phases is prepared up front
+    (an OrderedDict), unless lazy is True. Data of numeric and whole
+    phase bins is then prepared phase by phase, when a phase is accessed
+    (see PhaseData), e.g. for a ChunkedLoader. Visits of a phase are read
+    in once and split into bins (see prepare_data_in_bins)."""
     total_time = OrderedDict()
     data = OrderedDict()
-    if bins in ["ALL", "all", "All"]:
-        phases = ["ALL"]
-        time = timeline.get_time_from_epoch("ALL")
-        total_time["ALL"] = {0: (time[1] - time[0])}
-        data["ALL"] = {0: prepare_data(ecohab_data, mice, time)}
-        keys = [["ALL"], {"ALL": [0]}]
-    elif bins in ['dark', "DARK", "Dark", "light", "LIGHT", "Light"]:
+    if bins in ['dark', "DARK", "Dark", "light", "LIGHT", "Light"]:
         phases, total_time, data = get_dark_light_data(bins, timeline,
                                                        ecohab_data, mice)
         labels = {}
         for key in data.keys():
             labels[key] = [0]
-        keys = [list(data.keys()), labels]
-    elif (isinstance(bins, str) and
-          bins.lower() in ["whole_phase", "whole phase"]):
-        phases = []
-        all_phases = filter_dark_light(timeline.sections())
-        phases = [phase.replace(" ", "_") for phase in all_phases]
-        times = [timeline.get_time_from_epoch(phase)
-                 for phase in all_phases]
-        data = OrderedDict()
-        total_time = OrderedDict()
-        bin_labels = {}
-        for phase in all_phases:
-            bin_labels[phase] = [0]
-            time = timeline.get_time_from_epoch(phase)
-            total_time[phase] = {}
-            total_time[phase][0] = time[-1] - time[0]
-            data[phase] = {}
-            data[phase][0] = prepare_data(ecohab_data, mice,
-                                          time)
-        keys = [all_phases, bin_labels]
+        return phases, total_time, data, [list(data.keys()), labels]
+    plan = get_bin_plan(timeline, bins, plan)
+    for phase in plan.phases:
+        total_time[phase] = OrderedDict((label, time[1] - time[0])
+                                        for label, time
+                                        in plan.bins[phase].items())
+    if bins in ["ALL", "all", "All"]:
+        phases = ["ALL"]
+        data["ALL"] = {0: prepare_data(ecohab_data, mice,
+                                       plan.times["ALL"])}
+        keys = [["ALL"], {"ALL": [0]}]
     elif isinstance(bins, int) or isinstance(bins, float):
-        phases = []
-        all_phases = filter_dark_light(timeline.sections())
-        shortest_phase = get_shortest_phase_duration(timeline)
-        bin_labels = {}
-        # you can not iterate by phases, if bins are longer than phases
-        if bins > shortest_phase:
-            t_start = timeline.get_time_from_epoch(all_phases[0])[0]
-            t_end = timeline.get_time_from_epoch(all_phases[-1])[-1]
-            all_phases = []
-            times = []
-            i = 1
-            while t_start < t_end:
-                times.append((t_start, t_start + bins))
-                all_phases.append("%d_x" % i)
-                bin_labels["%d_x" % i] = [0]
-                i += 1
-                t_start += bins
-        else:
-            times = [timeline.get_time_from_epoch(phase)
-                     for phase in all_phases]
-        for i, phase in enumerate(all_phases):
-            t_start, t_end = times[i]
-            phases.append("%s_%4.2fh" % (phase.replace(" ", "_"), bins/3600))
-            bin_labels[phase] = get_times(bins, time_end=t_end-t_start)
-            data[phase] = OrderedDict()
-            total_time[phase] = OrderedDict()
-            j = 0
-            while t_start < t_end:
-                t_e = t_start + bins
-                if t_e > t_end:
-                    t_e = t_end
-                time = [t_start, t_e]
-                data[phase][bin_labels[phase][j]] = prepare_data(ecohab_data, mice,
-                                                                 time)
-                total_time[phase][bin_labels[phase][j]] = time[1] - time[0]
-                t_start += bins
-                j += 1
-        keys = [all_phases, bin_labels]
+        phases = ["%s_%4.2fh" % (phase.replace(" ", "_"), bins/3600)
+                  for phase in plan.phases]
+        data = PhaseData(ecohab_data, mice, plan.bins, plan)
+        keys = [plan.phases, plan.labels]
+    else:
+        phases = [phase.replace(" ", "_") for phase in plan.phases]
+        data = PhaseData(ecohab_data, mice, plan.bins, plan)
+        keys = [plan.phases, plan.labels]
+    if not lazy and isinstance(data, PhaseData):
+        data = OrderedDict((phase, data[phase]) for phase in data)
     return phases, total_time, data, keys
 
 
@@ -592,96 +836,87 @@ def prepare_registrations(ecohab_data, mice, st, en):
     return directions
 
 
+def prepare_registrations_in_bins(ecohab_data, mice, plan, phase):
+    """prepare_registrations in every bin of phase of plan (a BinPlan).
+    Registrations of every mouse are read in once for the phase
+    and split into bins with index ranges of plan."""
+    bins = plan.bins[phase]
+    t_start, t_end = plan.window(phase)
+    last_start = list(bins.values())[-1][0]
+    index = plan.index(ecohab_data, mice, phase)
+    data = OrderedDict((label, {}) for label in bins)
+    for mouse in mice:
+        # the antenna following the last bin is looked for up to one
+        # bin length after the phase (as in prepare_registrations)
+        times, antennas = get_times_antennas(ecohab_data, mouse, t_start,
+                                             t_end + (t_end - last_start))
+        first, last = index[mouse]
+        for i, (label, (st, en)) in enumerate(bins.items()):
+            start, stop = first[i], last[i]
+            last_antenna = None
+            if stop < len(times) and times[stop] < en + (en - st):
+                last_antenna = antennas[stop]
+            data[label][mouse] = extract_directions(times[start:stop],
+                                                    antennas[start:stop],
+                                                    last_antenna,
+                                                    ecohab_data.directions)
+    return data
+
+
+def get_times_antennas_in_bins(ecohab_data, mice, plan, phase):
+    """get_times_antennas_list_of_mice in every bin of phase of plan
+    (a BinPlan). Registrations of every mouse are read in once
+    for the phase and split into bins with index ranges of plan."""
+    bins = plan.bins[phase]
+    index = plan.index(ecohab_data, mice, phase)
+    data = OrderedDict((label, {}) for label in bins)
+    for mouse in mice:
+        times, antennas = get_times_antennas(ecohab_data, mouse,
+                                             *plan.window(phase))
+        for label, start, stop in zip(bins, *index[mouse]):
+            data[label][mouse] = {"times": times[start:stop],
+                                  "antennas": antennas[start:stop]}
+    return data
+
+
+# functions applied to registrations in bins (see get_registrations_bins),
+# which can split registrations of a whole phase into bins
+BINNED_FUNCTIONS = {
+    prepare_registrations: prepare_registrations_in_bins,
+    get_times_antennas_list_of_mice: get_times_antennas_in_bins,
+}
+
+
 def get_registrations_bins(ecohab_data, timeline, bins, mice,
-                           function=prepare_registrations):
+                           function=prepare_registrations, plan=None):
+    """Apply function to registrations in time bins of bins seconds
+    (see BinPlan). plan (a BinPlan of timeline and bins, see get_bin_plan)
+    can be reused by many analyses. For functions in BINNED_FUNCTIONS
+    registrations of a phase are read in once and split into bins
+    with index ranges of plan, other functions are called for every bin."""
+    plan = get_bin_plan(timeline, bins, plan,
+                        threshold=int(get_shortest_phase_duration(timeline)))
     total_time = OrderedDict()
     data = OrderedDict()
+    binned = BINNED_FUNCTIONS.get(function)
+    for phase in plan.phases:
+        total_time[phase] = OrderedDict(plan.bins[phase])
+        if binned is not None:
+            data[phase] = binned(ecohab_data, mice, plan, phase)
+            continue
+        data[phase] = OrderedDict()
+        for label, time in plan.bins[phase].items():
+            data[phase][label] = function(ecohab_data, mice, *time)
     if bins in ["ALL", "all", "All"]:
         phases = ["ALL"]
-        time = timeline.get_time_from_epoch("ALL")
-        data["ALL"] = {0: function(ecohab_data, mice, *time)}
         data_keys = [["ALL"], {"ALL": [0.0]}]
-        total_time["ALL"] = {0: time}
-    elif (isinstance(bins, str)
-          and bins.lower() in ["whole_phase", "whole phase", "whole phases",
-                               "whole_phases"]):
-        phases = []
-        all_phases = filter_dark_light(timeline.sections())
-        phases = [phase.replace(" ", "_") for phase in all_phases]
-        times = [timeline.get_time_from_epoch(phase)
-                 for phase in all_phases]
-        data = OrderedDict()
-        total_time = OrderedDict()
-        bin_labels = {}
-        for phase in all_phases:
-            bin_labels[phase] = [0]
-            time = timeline.get_time_from_epoch(phase)
-            total_time[phase] = {}
-            total_time[phase][0] = (time[0], time[-1])
-            data[phase] = {}
-            data[phase][0] = function(ecohab_data, mice,
-                                      *time)
-        data_keys = [all_phases, bin_labels]
     elif isinstance(bins, int) or isinstance(bins, float):
-        phases = []
-        all_phases = filter_dark_light(timeline.sections())
-        min_phase = int(get_shortest_phase_duration(timeline))
-        bin_labels = {}
-        # you can not iterate by phases, if bins are longer than phases
-        if bins > min_phase:
-            t_start = timeline.get_time_from_epoch(all_phases[0])[0]
-            t_end = timeline.get_time_from_epoch(all_phases[-1])[-1]
-            all_phases = []
-            times = []
-            i = 1
-            while t_start < t_end:
-                times.append((t_start, t_start + bins))
-                all_phases.append("%d_x" % i)
-                bin_labels["%d_x" % i] = [0]
-                i += 1
-                t_start += bins
-        else:
-            times = [timeline.get_time_from_epoch(phase)
-                     for phase in all_phases]
-        for i, phase in enumerate(all_phases):
-            t_start, t_end = times[i]
-            phases.append("%s_%4.2fh" % (phase.replace(" ", "_"),
-                                         bins/3600))
-            data[phase] = OrderedDict()
-            total_time[phase] = OrderedDict()
-            bin_labels[phase] = get_times(bins, time_end=t_end-t_start)
-            j = 0
-            while t_start < t_end:
-                t_e = t_start + bins
-                if t_e > t_end:
-                    t_e = t_end
-                time = (t_start, t_e)
-                data[phase][bin_labels[phase][j]] = function(ecohab_data,
-                                                      mice,
-                                                      *time)
-                total_time[phase][bin_labels[phase][j]] = time
-                t_start += bins
-                j += 1
-            data_keys = [all_phases, bin_labels]
+        phases = ["%s_%4.2fh" % (phase.replace(" ", "_"), bins/3600)
+                  for phase in plan.phases]
+        data_keys = [plan.phases, plan.labels]
     else:
-        phases = []
-        all_phases = filter_dark_light(timeline.sections())
-        phases = [phase.replace(" ", "_") for phase in all_phases]
-        times = [timeline.get_time_from_epoch(phase)
-                 for phase in all_phases]
-        data = OrderedDict()
-        total_time = OrderedDict()
-        bin_labels = {}
-        for phase in all_phases:
-            bin_labels[phase] = [0]
-            time = timeline.get_time_from_epoch(phase)
-            total_time[phase] = {}
-            total_time[phase][0] = (time[0], time[-1])
-            data[phase] = {}
-            data[phase][0] = function(ecohab_data, mice,
-                                      *time)
-        data_keys = [all_phases, bin_labels]
-            
+        phases = [phase.replace(" ", "_") for phase in plan.phases]
+        data_keys = [plan.phases, plan.labels]
     return phases, total_time, data, data_keys
 
 
@@ -1,10 +1,22 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import division, print_function, absolute_import
 import os
+import io
+import bz2
+import glob
+import gzip
+import json
+import lzma
 import time
+import queue
+import tarfile
+import threading
+import zipfile
 import calendar
 import sys
 from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import numpy as np
 from pyEcoHAB.utility_functions import check_directory
 
@@ -15,6 +27,24 @@ try:
 except NameError:
     basestring = str
 
+REGISTRATION_DTYPE = [("Id", int),
+                      ("Time", float),
+                      ("Antenna", "U15"),
+                      ("Duration", int),
+                      ("Tag", "U15")]
+# columns of registrations and visits, which store times
+TIME_COLUMNS = ("Time", "AbsStartTimecode", "AbsEndTimecode", "VisitDuration")
+# registrations can be saved to a data file of the previous or next hour
+FILE_SLACK = 3600.
+MANIFEST_FNAME = "pyEcoHAB_manifest.json"
+# classes decompressing file objects of individually compressed data files
+COMPRESSED_FILES = OrderedDict([(".gz", gzip.GzipFile),
+                                (".bz2", bz2.BZ2File),
+                                (".xz", lzma.LZMAFile)])
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz",
+                ".txz")
+
 PAIRS = ["1 3", "1 4", "1 5", "1 6", "1 7", "2 4", "2 5", "2 6", "2 7", "2 8",
          "3 5", "3 6", "3 7", "3 8", "4 6", "4 7", "4 8", "5 7", "5 8", "6 8"]
 
@@ -76,6 +106,7 @@ def make_prefix(path):
 
 def parse_fname(fname):
     """"Extracts time and date from data filename"""
+    fname = os.path.basename(fname)
     try:
         date, hour = fname.split("_")
     except ValueError:
@@ -93,6 +124,63 @@ def parse_fname(fname):
     return hour, date, datenext
 
 
+def fname_time_range(fname):
+    """
+    Return beginning and end (in seconds since epoch) of the hour
+    recorded in a data file.
+    """
+    hour, date, datenext = parse_fname(fname)
+    start = calendar.timegm(time.strptime(date + hour[:2] + " UTC",
+                                          '%Y%m%d%H %Z'))
+    return start, start + 3600.
+
+
+def mask_bounds(mask):
+    """Return (start, end) of a mask, which is None, (end,)
+    or (start, end)"""
+    if mask is None or not len(mask):
+        return -np.inf, np.inf
+    if len(mask) == 1:
+        return -np.inf, mask[0]
+    return mask[0], mask[-1]
+
+
+def select_fnames(fnames, mask, slack=FILE_SLACK, manifest=None):
+    """
+    Select data files, which can contain registrations between mask
+    bounds. Registrations are sometimes saved to a file of the previous
+    or the next hour, therefore hour ranges of files are extended by
+    slack seconds. If manifest (a dictionary of file statistics, see
+    build_manifest) contains a file, the first and the last registration
+    time of the file are used instead.
+    """
+    if mask is None:
+        return list(fnames)
+    if manifest is None:
+        manifest = {}
+    start, end = mask_bounds(mask)
+    out = []
+    for fname in fnames:
+        if fname in manifest:
+            stats = manifest[fname]
+            if stats["rows"] and stats["min_time"] < end\
+               and stats["max_time"] >= start:
+                out.append(fname)
+            continue
+        f_start, f_end = fname_time_range(fname)
+        if f_start - slack < end and f_end + slack > start:
+            out.append(fname)
+    return out
+
+
+def clip_to_mask(data, mask):
+    """Remove registrations outside mask from a 2D structured array"""
+    if mask is None:
+        return data
+    start, end = mask_bounds(mask)
+    return data[(data["Time"] >= start) & (data["Time"] < end)]
+
+
 def print_human_time(tt):
     """convert seconds to date and time since epoch """
     st = time.gmtime(tt)
@@ -112,6 +200,81 @@ def time_to_sec(tt):
     return seconds + float(less_than_sec)/1000
 
 
+def times_to_sec(times):
+    """
+    Convert an array of dates and times ("YYYYMMDD HH:MM:SS.mmm") to
+    seconds since epoch.
+
+    Dates and hours are converted once for every distinct date and hour,
+    minutes, seconds and milliseconds are added as offsets. Strings
+    in any other format are converted by time_to_sec.
+    """
+    times = np.asarray(times, dtype=str)
+    out = np.zeros(len(times), dtype=float)
+    if not len(times):
+        return out
+    regular = np.char.str_len(times) == 21
+    if np.any(regular):
+        chars = times[regular].astype("U21").view(np.uint32).reshape(-1, 21)
+        digits = chars.astype(np.int64) - ord("0")
+        separators = (chars[:, 8] == ord(" ")) & (chars[:, 11] == ord(":"))\
+            & (chars[:, 14] == ord(":")) & (chars[:, 17] == ord("."))
+        digit_idx = [0, 1, 2, 3, 4, 5, 6, 7, 9, 10, 12, 13, 15, 16, 18, 19, 20]
+        correct = separators & np.all((digits[:, digit_idx] >= 0)
+                                      & (digits[:, digit_idx] <= 9), axis=1)
+        minutes = digits[:, 12]*10 + digits[:, 13]
+        seconds = digits[:, 15]*10 + digits[:, 16]
+        correct &= (minutes < 60) & (seconds < 62)
+        date_hour = np.zeros(len(digits), dtype=np.int64)
+        for i in [0, 1, 2, 3, 4, 5, 6, 7, 9, 10]:
+            date_hour = date_hour*10 + digits[:, i]
+        date_hour = date_hour[correct]
+        keys, inverse = np.unique(date_hour, return_inverse=True)
+        bases = np.array([calendar.timegm(time.strptime("%010d UTC" % key,
+                                                        '%Y%m%d%H %Z'))
+                          for key in keys], dtype=np.int64)
+        whole = bases[inverse.reshape(-1)] + minutes[correct]*60\
+            + seconds[correct]
+        msec = digits[correct, 18]*100 + digits[correct, 19]*10\
+            + digits[correct, 20]
+        where = np.where(regular)[0]
+        out[where[correct]] = whole + msec/1000
+        regular[where[~correct]] = False
+    for i in np.where(~regular)[0]:
+        out[i] = time_to_sec(times[i])
+    return out
+
+
+def sec_to_msec(times):
+    """Convert seconds (a float or an array) to integer milliseconds"""
+    return np.round(np.asarray(times, dtype=float)*1000).astype(np.int64)
+
+
+def convert_times(data, msec=True):
+    """
+    Return a copy of registrations or visits (a 2D structured array) with
+    times (see TIME_COLUMNS) stored as int64 milliseconds (msec=True)
+    or as float seconds (msec=False). Registration times read in from
+    data files have millisecond resolution, so the conversion to
+    milliseconds is exact.
+    """
+    new_type = []
+    for key in data.dtype.names:
+        if key in TIME_COLUMNS:
+            new_type.append((key, np.int64 if msec else float))
+        else:
+            new_type.append((key, data.dtype[key]))
+    out = np.empty(len(data), dtype=new_type)
+    for key in data.dtype.names:
+        if key not in TIME_COLUMNS or out.dtype[key] == data.dtype[key]:
+            out[key] = data[key]
+        elif msec:
+            out[key] = sec_to_msec(data[key])
+        else:
+            out[key] = data[key]/1000
+    return out
+
+
 def reformat_date_time(date, time):
     return "%s %s" % (date.replace('.', ''), time)
 
@@ -128,56 +291,737 @@ def process_line_5_elements(elements, date):
     return elements
 
 
+def is_zip(path):
+    return path.lower().endswith(ZIP_SUFFIXES) and os.path.isfile(path)
+
+
+def is_tar(path):
+    return path.lower().endswith(TAR_SUFFIXES) and os.path.isfile(path)
+
+
+def is_archive(path):
+    """Check, if path is a zip or tar archive with data files"""
+    return is_zip(path) or is_tar(path)
+
+
+def data_directory(path):
+    """Return directory containing data path (a directory or an archive)"""
+    if is_archive(path):
+        return os.path.dirname(os.path.abspath(path))
+    return path
+
+
+def strip_compression(fname):
+    """Remove the suffix of an individually compressed file"""
+    for suffix in COMPRESSED_FILES:
+        if fname.endswith(suffix):
+            return fname[:-len(suffix)]
+    return fname
+
+
+def is_data_fname(fname):
+    f_name = strip_compression(os.path.basename(fname))
+    if f_name.endswith("0000.txt"):
+        return True
+    split = f_name.split("_")
+    if len(split) < 3:
+        return False
+    return split[-1].endswith(".txt") and split[1].endswith("0000")
+
+
+def list_archive(path):
+    """List names of all files stored in an archive"""
+    if is_zip(path):
+        with zipfile.ZipFile(path) as zf:
+            return [info.filename for info in zf.infolist()
+                    if not info.is_dir()]
+    with tarfile.open(path) as tf:
+        return [member.name for member in tf.getmembers()
+                if member.isfile()]
+
+
 def get_filenames(path):
-    try:
-        f_list = os.listdir(path)
-    except FileNotFoundError:
-        return []
-    out = []
-    for f_name in f_list:
-        if f_name.endswith("0000.txt"):
-            out.append(f_name)
-        else:
-            split = f_name.split("_")
-            if len(split) < 3:
-                continue
-            if split[-1].endswith(".txt") and split[1].endswith("0000"):
-                out.append(f_name)
-    return out
+    """
+    List data files in path. Path can be a directory or a zip/tar archive
+    (names of data files stored in the archive are returned). Data files
+    can be compressed individually (gzip, bzip2 or xz).
+    """
+    if is_archive(path):
+        f_list = list_archive(path)
+    else:
+        try:
+            f_list = os.listdir(path)
+        except FileNotFoundError:
+            return []
+    return [f_name for f_name in f_list if is_data_fname(f_name)]
+
+
+def decompress(fname, fileobj):
+    """Wrap file object of data file fname in a decompressor,
+    if the data file is compressed"""
+    for suffix, decompressor in COMPRESSED_FILES.items():
+        if fname.endswith(suffix):
+            return decompressor(fileobj=fileobj)
+    return fileobj
+
+
+def open_data_file(dir_path, fname):
+    """
+    Open data file fname stored in directory or archive dir_path for
+    reading (as text). Compressed data is decompressed on the fly.
+    """
+    if is_zip(dir_path):
+        with zipfile.ZipFile(dir_path) as zf:
+            fileobj = zf.open(fname)
+    elif is_tar(dir_path):
+        with tarfile.open(dir_path) as tf:
+            fileobj = io.BytesIO(tf.extractfile(fname).read())
+    else:
+        fileobj = open(os.path.join(dir_path, fname), 'rb')
+    return io.TextIOWrapper(decompress(fname, fileobj))
+
+
+def process_line(line, hour, date, datenext, fname):
+    """Split a single line of a data file into a registration"""
+    elements = line.split()
+    if len(elements) == 5:
+        if hour == '23' and elements[1][:2] == '00':
+            return process_line_5_elements(elements, datenext)
+        return process_line_5_elements(elements, date)
+    elif len(elements) > 5:
+        return process_line_more_elements(elements)
+    raise(IOError('Unknown data format in file %s' % fname))
 
 
 def read_single_file(dir_path, fname):
     """Reads in a single data file"""
     hour, date, datenext = parse_fname(fname)
     raw_data = []
-    f = open(os.path.join(dir_path, fname), 'r')
+    f = open_data_file(dir_path, fname)
     for line in f:
-        elements = line.split()
-        if len(elements) == 5:
-            if hour == '23' and elements[1][:2] == '00':
-                line = process_line_5_elements(elements, datenext)
-            else:
-                line = process_line_5_elements(elements, date)
-        elif len(elements) > 5:
-            line = process_line_more_elements(elements)
-        else:
-            raise(IOError('Unknown data format in file %s' % f))
-        raw_data += [line]
+        raw_data += [process_line(line, hour, date, datenext, fname)]
     f.close()
     return raw_data
 
 
+def map_unique(column, function):
+    """Apply function once to every distinct value in column"""
+    out = np.empty(len(column), dtype=object)
+    todo = np.ones(len(column), dtype=bool)
+    while todo.any():
+        value = column[np.argmax(todo)]
+        same = column == value
+        out[same] = function(value)
+        todo &= ~same
+    return out
+
+
+def tokenize_data(text, fname):
+    """
+    Split contents of a single data file into columns.
+
+    File format (old 5-column or new 6+ column) is detected once from the
+    first line and the whole file is tokenized in bulk. Files, in which
+    any line has a different number of columns than the first one,
+    are tokenized line by line with process_line.
+
+    Args:
+    text: str
+       contents of a data file
+    fname: str
+       data filename (used to establish date of registrations for old
+       data files)
+
+    Returns:
+       OrderedDict of arrays: Id, Time, Antenna, Duration, Tag.
+       Time is formatted as "YYYYMMDD HH:MM:SS.mmm"
+    """
+    hour, date, datenext = parse_fname(fname)
+    lines = text.splitlines()
+    n_cols = len(lines[0].split()) if len(lines) else 0
+    columns = None
+    # the bulk split is reshaped into rows, so every line has to have
+    # n_cols tokens (a missing column in one line and an additional
+    # one in another do not change the number of tokens)
+    if n_cols >= 5 and all(len(line.split()) == n_cols for line in lines):
+        tokens = text.split()
+        table = np.array(tokens, dtype=object).reshape(len(lines), n_cols)
+        if n_cols == 5:
+            ids, times, antennas, durations, tags = table.T
+            if hour == '23':
+                next_day = np.char.startswith(times.astype(str), '00')
+                dates = np.where(next_day, datenext, date).astype(object)
+            else:
+                dates = date
+        else:
+            ids, dates, times, antennas, durations, tags = table[:, :6].T
+            dates = map_unique(dates, lambda x: x.replace('.', ''))
+        try:
+            columns = make_columns(ids, dates + ' ' + times, antennas,
+                                   durations, tags)
+        except ValueError:
+            pass
+    if columns is None:
+        raw_data = [process_line(line, hour, date, datenext, fname)[:5]
+                    for line in lines]
+        table = np.array(raw_data, dtype=object).reshape(len(lines), 5)
+        columns = make_columns(*table.T)
+    return columns
+
+
+def make_columns(ids, times, antennas, durations, tags):
+    """Convert tokenized registrations to columns of correct types"""
+    columns = OrderedDict()
+    columns["Id"] = ids.astype(int)
+    columns["Time"] = times.astype(str)
+    columns["Antenna"] = antennas.astype("U15")
+    columns["Duration"] = durations.astype(int)
+    columns["Tag"] = tags.astype("U15")
+    return columns
+
+
+def from_columns(columns):
+    """
+    Transform columns returned by tokenize_data to a 2D structured
+    array with registrations of animal tags (the same as returned
+    by from_raw_data).
+    """
+    data = np.zeros(len(columns["Id"]), dtype=REGISTRATION_DTYPE)
+    data["Id"] = columns["Id"]
+    data["Time"] = times_to_sec(columns["Time"])
+    data["Antenna"] = columns["Antenna"]
+    data["Duration"] = columns["Duration"]
+    data["Tag"] = columns["Tag"]
+    return data
+
+
+def read_single_file_array(dir_path, fname, mask=None, legal_tags="ALL",
+                           removed_antennas=None):
+    """Reads in a single data file into a 2D structured array.
+    Registrations outside mask, registrations of tags not in legal_tags
+    and registrations by removed_antennas are skipped (the last two
+    before timestamps are converted)."""
+    with open_data_file(dir_path, fname) as f:
+        text = f.read()
+    columns = filter_rows(tokenize_data(text, fname), legal_tags,
+                          removed_antennas)
+    return clip_to_mask(from_columns(columns), mask)
+
+
+def read_raw(dir_path, fname):
+    """Read contents of data file fname stored in directory or zip archive
+    dir_path (bytes, not decompressed)"""
+    if is_zip(dir_path):
+        with zipfile.ZipFile(dir_path) as zf:
+            return zf.read(fname)
+    with open(os.path.join(dir_path, fname), 'rb') as f:
+        return f.read()
+
+
+def parse_raw(raw, fname):
+    """Decompress (if necessary), decode and tokenize contents of data
+    file fname read in by read_raw (see tokenize_data)"""
+    text = io.TextIOWrapper(decompress(fname, io.BytesIO(raw))).read()
+    return tokenize_data(text, fname)
+
+
+class _Failure(object):
+    """Exception raised in a pipeline stage passed down the pipeline"""
+    def __init__(self, exception):
+        self.exception = exception
+
+
+_END = object()
+
+
+def _put(out_queue, item, stop):
+    """Put item in out_queue, waiting while the queue is full, unless
+    stop is set"""
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(in_queue, stop):
+    """Get an item from in_queue, waiting while the queue is empty,
+    unless stop is set"""
+    while not stop.is_set():
+        try:
+            return in_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _END
+
+
+def _feed(items, out_queue, stop):
+    for item in items:
+        if not _put(out_queue, item, stop):
+            return
+    _put(out_queue, _END, stop)
+
+
+def _run_stage(function, in_queue, out_queue, stop):
+    while True:
+        item = _get(in_queue, stop)
+        if item is _END or isinstance(item, _Failure):
+            _put(out_queue, item, stop)
+            return
+        try:
+            item = function(item)
+        except Exception as e:
+            _put(out_queue, _Failure(e), stop)
+            return
+        if not _put(out_queue, item, stop):
+            return
+
+
+def pipeline(items, stages, queue_size=2):
+    """
+    Pass items through stages (functions) running in separate threads
+    connected by queues of at most queue_size items. A stage waits,
+    while the queue of the next stage is full (backpressure), so at most
+    about queue_size items per stage are kept in memory, and stages
+    work at the same time, e.g. files are read, while previously read
+    files are parsed. Exceptions raised by stages are reraised.
+
+    Args:
+    items: iterable
+    stages: list of functions
+       every function is called with a result of the previous stage
+    queue_size: int
+
+    Returns:
+       a generator of results of the last stage in the order of items
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size)
+              for i in range(len(stages) + 1)]
+    threads = [threading.Thread(target=_feed, args=(items, queues[0], stop))]
+    for i, function in enumerate(stages):
+        threads.append(threading.Thread(target=_run_stage,
+                                        args=(function, queues[i],
+                                              queues[i + 1], stop)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def stream_files(dir_path, fnames, prefetch=2, queue_size=2, mask=None,
+                 legal_tags="ALL", removed_antennas=None):
+    """
+    Read in data files into 2D structured arrays in a pipeline
+    (see pipeline): prefetch threads read data files (read_raw),
+    the parse stage decompresses and tokenizes them (parse_raw) and
+    the filter stage skips registrations of tags not in legal_tags and
+    by removed_antennas, converts timestamps and clips registrations
+    to mask. Reading files (e.g. from network storage) overlaps with
+    parsing, and at most about queue_size + prefetch files are kept
+    in memory at each stage.
+
+    Returns:
+       a generator of arrays in the order of fnames
+    """
+    def filter_stage(columns):
+        columns = filter_rows(columns, legal_tags, removed_antennas)
+        return clip_to_mask(from_columns(columns), mask)
+
+    with ThreadPoolExecutor(max_workers=max(1, prefetch)) as pool:
+        stages = [lambda fname: (fname, pool.submit(read_raw, dir_path,
+                                                    fname)),
+                  lambda item: parse_raw(item[1].result(), item[0]),
+                  filter_stage]
+        for data in pipeline(fnames, stages, queue_size=queue_size):
+            yield data
+
+
+def file_signature(dir_path, fname):
+    """Size and modification time of a data file (of the archive,
+    if dir_path is an archive)"""
+    if is_archive(dir_path):
+        stat = os.stat(dir_path)
+    else:
+        stat = os.stat(os.path.join(dir_path, fname))
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def cache_key(dir_path, fname):
+    """Name identifying a data file in the cache directory"""
+    if is_archive(dir_path):
+        return "%s_%s" % (os.path.basename(dir_path),
+                          os.path.basename(fname))
+    return os.path.basename(fname)
+
+
+def cache_fname(dir_path, fname):
+    """
+    Return name of the cache file of a data file. The name is made from
+    the data filename, its size and its modification time, so that any
+    change to the data file invalidates the cached array.
+    """
+    return "%s_%d_%d.npy" % tuple([cache_key(dir_path, fname)]
+                                  + file_signature(dir_path, fname))
+
+
+def load_cached(dir_path, fname, cache_dir):
+    """Load a parsed data file from cache_dir. Returns None, if the file
+    has not been cached or it has changed since."""
+    cache_path = os.path.join(cache_dir, cache_fname(dir_path, fname))
+    if os.path.isfile(cache_path):
+        try:
+            return np.load(cache_path)
+        except (IOError, ValueError):
+            pass
+    return None
+
+
+def save_cached(data, dir_path, fname, cache_dir):
+    """Save a parsed data file in cache_dir, removing its outdated
+    versions"""
+    cache_path = os.path.join(cache_dir, cache_fname(dir_path, fname))
+    pattern = glob.escape(cache_key(dir_path, fname)) + "_*.npy"
+    for old_path in glob.glob(os.path.join(glob.escape(cache_dir),
+                                           pattern)):
+        os.remove(old_path)
+    temp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+    with open(temp_path, "wb") as f:
+        np.save(f, data)
+    os.replace(temp_path, cache_path)
+
+
+def read_single_file_cached(dir_path, fname, cache_dir, mask=None,
+                            legal_tags="ALL", removed_antennas=None):
+    """
+    Reads in a single data file into a 2D structured array. Parsed
+    array is saved in cache_dir and loaded from there the next time,
+    if the data file has not changed. The whole file is cached,
+    registrations outside mask, of tags not in legal_tags and
+    by removed_antennas are skipped afterwards.
+    """
+    data = load_cached(dir_path, fname, cache_dir)
+    if data is None:
+        data = read_single_file_array(dir_path, fname)
+        save_cached(data, dir_path, fname, cache_dir)
+    return clip_to_mask(filter_rows(data, legal_tags, removed_antennas),
+                        mask)
+
+
+def read_tar_files(dir_path, fnames, cache_dir=None, mask=None,
+                   legal_tags="ALL", removed_antennas=None):
+    """
+    Read in data files fnames from a tar archive. Compressed tar archives
+    do not allow random access, so the archive is decompressed once and
+    all data files are parsed, while the archive is streamed.
+    """
+    out = {}
+    if cache_dir is not None:
+        for fname in fnames:
+            data = load_cached(dir_path, fname, cache_dir)
+            if data is not None:
+                out[fname] = data
+    missing = set(fnames) - set(out.keys())
+    if len(missing):
+        with tarfile.open(dir_path, mode="r|*") as tf:
+            for member in tf:
+                if member.name not in missing:
+                    continue
+                fileobj = io.BytesIO(tf.extractfile(member).read())
+                text = io.TextIOWrapper(decompress(member.name,
+                                                   fileobj)).read()
+                data = from_columns(tokenize_data(text, member.name))
+                if cache_dir is not None:
+                    save_cached(data, dir_path, member.name, cache_dir)
+                out[member.name] = data
+    return [clip_to_mask(filter_rows(out[fname], legal_tags,
+                                     removed_antennas), mask)
+            for fname in fnames]
+
+
+def read_files(dir_path, fnames, n_jobs=1, executor=None, cache_dir=None,
+               mask=None, legal_tags="ALL", removed_antennas=None,
+               prefetch=0):
+    """
+    Read in data files into a list of 2D structured arrays.
+
+    Args:
+    dir_path: str
+       directory or a zip/tar archive containing data files
+    fnames: list of str
+       data filenames
+    n_jobs: int or None
+       number of worker processes parsing data files. If n_jobs is None
+       or smaller than 1, one worker per CPU is started. By default files
+       are read in one after another. Files stored in a tar archive
+       are always read in one after another.
+    executor: concurrent.futures.Executor
+       executor used for reading in files (overrides n_jobs)
+    cache_dir: str
+       directory with cached parsed files. Unchanged files are loaded
+       from cache_dir, new or changed files are parsed and cached.
+       By default no cache is used.
+    mask: list or tuple of floats
+       registrations outside mask (see mask_bounds) are skipped
+    legal_tags: list or str
+       registrations of other tags are skipped. Default "ALL".
+    removed_antennas: list
+       registrations by these antennas are skipped
+    prefetch: int
+       number of threads reading data files ahead of parsing
+       (see stream_files). Used, if files are read in one after another
+       and not cached. By default reading and parsing are not overlapped.
+
+    Returns:
+       a list of arrays in the order of fnames
+    """
+    if cache_dir is not None:
+        check_directory(cache_dir)
+    if is_tar(dir_path):
+        return read_tar_files(dir_path, fnames, cache_dir=cache_dir,
+                              mask=mask, legal_tags=legal_tags,
+                              removed_antennas=removed_antennas)
+    paths = [dir_path]*len(fnames)
+    if cache_dir is None:
+        read = partial(read_single_file_array, mask=mask,
+                       legal_tags=legal_tags,
+                       removed_antennas=removed_antennas)
+    else:
+        read = partial(read_single_file_cached, cache_dir=cache_dir,
+                       mask=mask, legal_tags=legal_tags,
+                       removed_antennas=removed_antennas)
+    if executor is not None:
+        return list(executor.map(read, paths, fnames))
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs == 1 or len(fnames) < 2:
+        if prefetch and cache_dir is None:
+            return list(stream_files(dir_path, fnames, prefetch=prefetch,
+                                     mask=mask, legal_tags=legal_tags,
+                                     removed_antennas=removed_antennas))
+        return [read(dir_path, fname) for fname in fnames]
+    chunksize = max(1, len(fnames)//(4*n_jobs))
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(read, paths, fnames, chunksize=chunksize))
+
+
+def file_stats(data):
+    """
+    Statistics of registrations read in from a single data file: number
+    of registrations, time of the first and the last registration,
+    registration counts of each antenna and tags present.
+    """
+    antennas, counts = np.unique(data["Antenna"], return_counts=True)
+    stats = {
+        "rows": len(data),
+        "min_time": None,
+        "max_time": None,
+        "antennas": dict(zip(antennas.tolist(), counts.tolist())),
+        "tags": np.unique(data["Tag"]).tolist(),
+    }
+    if len(data):
+        stats["min_time"] = float(data["Time"].min())
+        stats["max_time"] = float(data["Time"].max())
+    return stats
+
+
+def default_manifest_path(path):
+    """Manifest filename of a data directory or a data archive"""
+    if is_archive(path):
+        return "%s_%s" % (os.path.abspath(path), MANIFEST_FNAME)
+    return os.path.join(path, MANIFEST_FNAME)
+
+
+def load_manifest(path):
+    """
+    Load a manifest of data files saved by save_manifest. Returns an empty
+    manifest, if the file does not exist or cannot be read.
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(manifest, dict):
+        return {}
+    return manifest
+
+
+def save_manifest(manifest, path):
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def valid_manifest_entries(dir_path, fnames, manifest):
+    """
+    Return manifest entries of data files fnames, which have not
+    changed since the manifest was made.
+    """
+    out = {}
+    for fname in fnames:
+        stats = manifest.get(fname)
+        if stats is None:
+            continue
+        try:
+            signature = file_signature(dir_path, fname)
+        except OSError:
+            continue
+        if stats["signature"] == signature:
+            out[fname] = stats
+    return out
+
+
+def update_manifest(manifest, dir_path, fnames, arrays):
+    """
+    Add statistics of data files fnames (read in into arrays) to manifest.
+    """
+    for fname, data in zip(fnames, arrays):
+        stats = file_stats(data)
+        stats["signature"] = file_signature(dir_path, fname)
+        manifest[fname] = stats
+    return manifest
+
+
+def build_manifest(dir_path, manifest_path=None, n_jobs=1, executor=None,
+                   cache_dir=None):
+    """
+    Make or update a manifest of data files in dir_path. For every data
+    file the manifest stores its number of registrations, time of
+    the first and the last registration, registration counts of each
+    antenna and tags present. Only files, which are new or have changed
+    since the manifest was saved, are read in.
+
+    Args:
+    dir_path: str
+       directory or archive containing data files
+    manifest_path: str
+       manifest filename. By default dir_path/pyEcoHAB_manifest.json
+       (or archive_name_pyEcoHAB_manifest.json next to an archive)
+    n_jobs, executor, cache_dir:
+       see read_files
+
+    Returns:
+       manifest (a dictionary of statistics of data files)
+    """
+    if manifest_path is None:
+        manifest_path = default_manifest_path(dir_path)
+    fnames = get_filenames(dir_path)
+    old_manifest = load_manifest(manifest_path)
+    manifest = valid_manifest_entries(dir_path, fnames, old_manifest)
+    new_fnames = [fname for fname in fnames if fname not in manifest]
+    arrays = read_files(dir_path, new_fnames, n_jobs=n_jobs,
+                        executor=executor, cache_dir=cache_dir)
+    update_manifest(manifest, dir_path, new_fnames, arrays)
+    if manifest != old_manifest:
+        save_manifest(manifest, manifest_path)
+    return manifest
+
+
+def manifest_summary(manifest, max_break=FILE_SLACK):
+    """
+    Summarize a manifest of data files: time of the first and the last
+    registration, number of registrations, registration counts of each
+    antenna, tags present and breaks in registrations longer than
+    max_break seconds (only breaks between data files are detected).
+    """
+    out = {
+        "files": len(manifest),
+        "rows": 0,
+        "start": None,
+        "end": None,
+        "antennas": Counter(),
+        "tags": set(),
+        "gaps": [],
+    }
+    entries = sorted([stats for stats in manifest.values() if stats["rows"]],
+                     key=lambda x: x["min_time"])
+    for stats in entries:
+        out["rows"] += stats["rows"]
+        out["antennas"].update(stats["antennas"])
+        out["tags"].update(stats["tags"])
+        if out["end"] is not None:
+            if stats["min_time"] - out["end"] > max_break:
+                out["gaps"].append((out["end"], stats["min_time"]))
+        else:
+            out["start"] = stats["min_time"]
+        if out["end"] is None or stats["max_time"] > out["end"]:
+            out["end"] = stats["max_time"]
+    out["antennas"] = dict(out["antennas"])
+    out["tags"] = sorted(out["tags"])
+    return out
+
+
+def isin_labels(column, values):
+    """
+    Vectorized "label in values" for a column of text labels (e.g. tags
+    or antennas). Values, which are not strings (e.g. None or int antenna
+    ids), never match a label.
+    """
+    labels = sorted(set(value for value in values
+                        if isinstance(value, basestring)))
+    if not len(labels):
+        return np.zeros(len(column), dtype=bool)
+    return np.isin(column, np.array(labels, dtype=str))
+
+
+def legal_rows(data, legal_tags="ALL", removed_antennas=None):
+    """
+    Return a boolean index of registrations of legal_tags by antennas
+    not in removed_antennas.
+
+    Args:
+    data: 2D structured array or columns returned by tokenize_data
+    legal_tags: list or str
+        animal tags to be kept. Default "ALL". Keep all tags.
+    removed_antennas: list
+        antennas, which registrations are to be removed
+    """
+    keep = np.ones(len(data["Tag"]), dtype=bool)
+    if legal_tags != "ALL":
+        if isinstance(legal_tags, basestring):
+            legal_tags = [legal_tags]
+        keep &= isin_labels(data["Tag"], legal_tags)
+    if removed_antennas:
+        if not isinstance(removed_antennas, list):
+            removed_antennas = [removed_antennas]
+        keep &= ~isin_labels(data["Antenna"], removed_antennas)
+    return keep
+
+
+def filter_rows(data, legal_tags="ALL", removed_antennas=None):
+    """
+    Remove registrations of tags not in legal_tags and registrations
+    by antennas in removed_antennas from data (a 2D structured array or
+    columns returned by tokenize_data).
+    """
+    if legal_tags == "ALL" and not removed_antennas:
+        return data
+    keep = legal_rows(data, legal_tags, removed_antennas)
+    if isinstance(data, dict):
+        return OrderedDict((key, value[keep]) for key, value in data.items())
+    return data[keep]
+
+
 def remove_one_antenna(data, antenna):
     """
     Remove animal tags registered by a specified antenna from 2D data array
     """
-    where = []
-    for i, a in enumerate(data["Antenna"]):
-        if a == antenna:
-            where.append(i)
-    if len(where) == 0:
-        return data
-    return np.delete(data, where, axis=0)
+    return remove_antennas(data, [antenna])
 
 
 def remove_antennas(data, antennas):
@@ -196,11 +1040,7 @@ def remove_antennas(data, antennas):
     """
     if not isinstance(antennas, list):
         antennas = [antennas]
-    new_data = data.copy()
-    if isinstance(antennas, list):
-        for antenna in antennas:
-            new_data = remove_one_antenna(new_data, antenna)
-    return new_data
+    return data[~isin_labels(data["Antenna"], antennas)]
 
 
 def remove_ghost_tags(raw_data, legal_tags="ALL"):
@@ -223,15 +1063,13 @@ def remove_ghost_tags(raw_data, legal_tags="ALL"):
     if legal_tags == "ALL":
         return raw_data
 
-    new_data = []
     if isinstance(legal_tags, basestring):
         legal_tags = [legal_tags]
+    if isinstance(raw_data, np.ndarray) and raw_data.dtype.names:
+        return raw_data[isin_labels(raw_data["Tag"], legal_tags)]
 
-    for d in raw_data:
-        mouse = d[4]
-        if mouse in legal_tags:
-            new_data.append(d)
-    return new_data[:]
+    legal_tags = set(legal_tags)
+    return [d for d in raw_data if d[4] in legal_tags]
 
 
 def check_antenna_presence(raw_data, setup_config, max_break):
@@ -266,22 +1104,33 @@ def check_antenna_presence(raw_data, setup_config, max_break):
 
 
 def antenna_mismatch(raw_data, setup_config):
+    """
+    Count consecutive registrations of the same animal by antenna pairs
+    in setup_config.mismatched_pairs. Tags and antennas are compared
+    as integer codes.
+    """
     if not len(raw_data):
         raise Exception("Empty dataset")
     pairs = setup_config.mismatched_pairs
-    all_times = raw_data['Time']
-    mice = set(raw_data['Tag'])
     mismatches = OrderedDict()
     for pair in pairs:
         mismatches[pair] = 0
-    for mouse in mice:
-        mouse_idx = np.where(np.array(raw_data['Tag']) == mouse)[0]
-        times = all_times[mouse_idx]
-        ant = raw_data['Antenna'][mouse_idx]
-        for i, a in enumerate(ant[:-1]):
-            key = "%s %s" % (min(a, ant[i+1]), max(a, ant[i+1]))
-            if key in pairs:
-                mismatches[key] += 1
+    antennas, antenna_codes = np.unique(raw_data['Antenna'],
+                                        return_inverse=True)
+    tag_codes = np.unique(raw_data['Tag'], return_inverse=True)[1]
+    order = np.argsort(tag_codes, kind="stable")
+    tag_codes, antenna_codes = tag_codes[order], antenna_codes[order]
+    same_mouse = tag_codes[1:] == tag_codes[:-1]
+    first = np.minimum(antenna_codes[:-1], antenna_codes[1:])[same_mouse]
+    second = np.maximum(antenna_codes[:-1], antenna_codes[1:])[same_mouse]
+    n_antennas = len(antennas)
+    pair_codes, counts = np.unique(first*n_antennas + second,
+                                   return_counts=True)
+    for pair_code, count in zip(pair_codes, counts):
+        key = "%s %s" % (antennas[pair_code // n_antennas],
+                         antennas[pair_code % n_antennas])
+        if key in mismatches:
+            mismatches[key] += int(count)
     return mismatches
 
 
@@ -508,23 +1357,20 @@ def from_raw_data(raw_data):
     Transform raw data, which is in the form of a double list
     to a 2D structured array with registrations of animal tags.
     """
-    new_data = []
-    for row in raw_data:
-        new_data.append(transform_raw(row))
-    data_type = [("Id", int),
-                 ("Time", float),
-                 ("Antenna", "U15"),
-                 ("Duration", int),
-                 ("Tag", "U15")]
-    return np.array(new_data, dtype=data_type)
+    table = np.array([row[:5] for row in raw_data],
+                     dtype=object).reshape(len(raw_data), 5)
+    return from_columns(make_columns(*table.T))
 
 
-def transform_visits(data):
+def transform_visits(data, msec=False):
+    """Transform a list of visits to a 2D structured array. If msec is
+    True, times are int64 milliseconds."""
+    time_type = np.int64 if msec else float
     data_type = [("Address", "U30"),
                  ("Tag", "U15"),
-                 ("AbsStartTimecode", float),
-                 ("AbsEndTimecode", float),
-                 ("VisitDuration", float),
+                 ("AbsStartTimecode", time_type),
+                 ("AbsEndTimecode", time_type),
+                 ("VisitDuration", time_type),
                  ("ValidVisitSolution", bool)]
     return np.array(data, dtype=data_type)
 
@@ -536,10 +1382,67 @@ def rename_antennas(name, dataset):
     return new_data
 
 
+def merge_sorted(arrays, column="Time"):
+    """
+    Merge 2D structured arrays (e.g. registrations read in from
+    consecutive data files) into one array sorted by column.
+
+    Arrays are collected into blocks, which do not overlap in time.
+    Blocks are simply concatenated. Registrations within a block (a single
+    array or overlapping arrays) are sorted with a stable argsort, which
+    merges already sorted runs in linear time. The result is the same as
+    a stable sort of the concatenation of arrays.
+    """
+    data = np.concatenate(arrays)
+    times = data[column]
+    blocks = []
+    start = 0
+    for array in arrays:
+        stop = start + len(array)
+        if stop > start:
+            block = [start, stop, times[start:stop].max()]
+            first = times[start:stop].min()
+            # join preceding blocks overlapping with array
+            while len(blocks) and blocks[-1][2] > first:
+                previous = blocks.pop()
+                block = [previous[0], stop, max(previous[2], block[2])]
+            blocks.append(block)
+        start = stop
+    order = []
+    unsorted = False
+    for start, stop, end in blocks:
+        block_times = times[start:stop]
+        if np.all(block_times[1:] >= block_times[:-1]):
+            order.append(np.arange(start, stop))
+        else:
+            order.append(start + np.argsort(block_times, kind="stable"))
+            unsorted = True
+    if not unsorted:
+        return data
+    return data[np.concatenate(order)]
+
+
+def sort_ties(data, column="Time"):
+    """Sort registrations with equal values of column by all the other
+    fields (as data.sort(order=column) would do) in an array sorted by
+    column."""
+    times = data[column]
+    tied = np.flatnonzero(times[1:] == times[:-1])
+    if not len(tied):
+        return data
+    data = data.copy()
+    starts = tied[np.r_[True, np.diff(tied) > 1]]
+    ends = tied[np.r_[np.diff(tied) > 1, True]] + 2
+    for start, end in zip(starts, ends):
+        data[start:end] = np.sort(data[start:end], order=column)
+    return data
+
+
 def append_data_sources(data_sets):
-    new_data = np.concatenate(data_sets)
-    new_data.sort(order="Time")
-    return new_data
+    """Merge registrations of different data sources (each sorted by
+    Time) into one array sorted by Time. Registrations with equal Time
+    are ordered by the other fields."""
+    return sort_ties(merge_sorted(data_sets))
 
 
 class NamedDict(dict):
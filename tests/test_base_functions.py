@@ -0,0 +1,521 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+from __future__ import print_function, division, absolute_import
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+
+from pyEcoHAB.BaseFunctions import Data, Visits, SQLiteData, SQLiteVisits
+from pyEcoHAB.utils.for_loading import REGISTRATION_DTYPE, transform_visits
+from pyEcoHAB.utils.for_loading import convert_times
+
+
+def make_data():
+    data = np.zeros(6, dtype=REGISTRATION_DTYPE)
+    data["Id"] = range(6)
+    data["Time"] = [1, 2, 3, 4, 5, 6]
+    data["Antenna"] = ["1", "2", "10", "1", "2", "3"]
+    data["Duration"] = [100, 200, 300, 400, 500, 600]
+    data["Tag"] = ["mouse_2", "mouse_1", "mouse_2", "mouse_1", "mouse_1",
+                   "mouse_2"]
+    return data
+
+
+class TestDataEncoding(unittest.TestCase):
+    def setUp(self):
+        self.raw = make_data()
+        self.data = Data(self.raw, None)
+
+    def test_decoded(self):
+        self.assertEqual(self.data.data.dtype, self.raw.dtype)
+        self.assertTrue(np.all(self.data.data == self.raw))
+
+    def test_categories(self):
+        self.assertEqual(self.data.categories["Antenna"].tolist(),
+                         ["1", "10", "2", "3"])
+        self.assertEqual(self.data.categories["Tag"].tolist(),
+                         ["mouse_1", "mouse_2"])
+
+    def test_codes(self):
+        self.assertEqual(self.data.columns["Antenna"].dtype, np.uint8)
+        self.assertEqual(self.data.columns["Antenna"].tolist(),
+                         [0, 2, 1, 0, 2, 3])
+
+    def test_numeric_columns(self):
+        self.assertEqual(self.data.columns["Time"].tolist(),
+                         [1, 2, 3, 4, 5, 6])
+
+    def test_encode(self):
+        self.assertEqual(self.data.encode("Tag", ["mouse_2", "mouse_3"])
+                         .tolist(), [1])
+
+    def test_category_codes(self):
+        self.assertEqual(self.data.category_codes("Tag"),
+                         {"mouse_1": 0, "mouse_2": 1})
+
+    def test_len(self):
+        self.assertEqual(len(self.data), 6)
+
+    def test_empty(self):
+        data = Data(np.zeros(0, dtype=REGISTRATION_DTYPE), None)
+        self.assertEqual(len(data.data), 0)
+        self.assertEqual(data.get_antennas("mouse_1"), [])
+
+
+class TestGetProperty(unittest.TestCase):
+    def setUp(self):
+        self.data = Data(make_data(), None)
+
+    def test_antennas(self):
+        self.assertEqual(self.data.get_antennas("mouse_2"), ["1", "10", "3"])
+
+    def test_antenna_codes(self):
+        self.assertEqual(self.data.get_antenna_codes("mouse_2").tolist(),
+                         [0, 1, 3])
+
+    def test_times(self):
+        self.assertEqual(self.data.get_times(["mouse_1"]), [2., 4., 5.])
+
+    def test_durations(self):
+        self.assertEqual(self.data.get_durations(["mouse_1", "mouse_2"]),
+                         [100, 200, 300, 400, 500, 600])
+
+    def test_unknown_mouse(self):
+        self.assertEqual(self.data.get_times("mouse_3"), [])
+
+    def test_mask(self):
+        self.data.mask_data((2, 5))
+        self.assertEqual(self.data.get_times("mouse_1"), [2., 4.])
+        self.assertEqual(self.data.get_antennas("mouse_2"), ["10"])
+        self.data.unmask_data()
+        self.assertEqual(self.data.get_times("mouse_1"), [2., 4., 5.])
+
+    def test_cut_out(self):
+        data = Data(make_data(), (2, 5))
+        self.assertTrue(np.all(data.data == make_data()[1:4]))
+
+    def test_mask_end(self):
+        self.data.mask_data(4.)
+        self.assertEqual(self.data.mask, (1., 4.))
+        self.assertEqual(self.data.get_times("mouse_1"), [2.])
+        self.data.mask_data([4])
+        self.assertEqual(self.data.get_times("mouse_2"), [1., 3.])
+
+    def test_mask_empty(self):
+        self.data.mask_data((2.5, 2.7))
+        self.assertEqual(self.data.get_times(["mouse_1", "mouse_2"]), [])
+        self.data.mask_data((10, 20))
+        self.assertEqual(self.data.get_times(["mouse_1", "mouse_2"]), [])
+
+    def test_mask_indices(self):
+        self.assertEqual(self.data._find_mask_indices((2, 5), "Time"),
+                         (1, 4))
+        self.assertEqual(self.data._find_mask_indices((0, 1), "Time"),
+                         (0, 0))
+        self.assertEqual(self.data._find_mask_indices((5.5, 10), "Time"),
+                         (5, 6))
+
+    def test_labels(self):
+        data = Data(make_data(), (2, 3))
+        self.assertEqual(data.labels("Tag").tolist(), ["mouse_1"])
+
+    def test_window(self):
+        self.assertEqual(self.data.get_times("mouse_1", 2, 5), [2., 4.])
+        self.assertEqual(self.data.get_antennas("mouse_2", t_start=3),
+                         ["10", "3"])
+        self.assertEqual(self.data.get_antenna_codes("mouse_2",
+                                                     t_end=3).tolist(), [0])
+        self.assertIsNone(self.data.mask)
+
+    def test_window_ignores_mask(self):
+        self.data.mask_data((2, 3))
+        self.assertEqual(self.data.get_times("mouse_1", 4, 6), [4., 5.])
+        self.assertEqual(self.data.get_times("mouse_1"), [2.])
+
+    def test_arrays(self):
+        times = self.data.get_times_array(["mouse_1"])
+        self.assertEqual(times.dtype, np.float64)
+        self.assertEqual(times.tolist(), [2., 4., 5.])
+        antennas = self.data.get_antennas_array("mouse_2", 2, 7)
+        self.assertEqual(antennas.tolist(), ["10", "3"])
+        durations = self.data.get_durations_array("mouse_1")
+        self.assertEqual(durations.dtype.kind, "i")
+        self.assertEqual(durations.tolist(), [200, 400, 500])
+
+    def test_msec_arrays(self):
+        data = Data(convert_times(make_data(), msec=True), None)
+        times = data.get_times_array("mouse_1", 2, 5)
+        self.assertEqual(times.dtype, np.float64)
+        self.assertEqual(times.tolist(), [2., 4.])
+
+    def test_visit_arrays(self):
+        visits = Visits(transform_visits([("A", "mouse_1", 1., 3., 2., True),
+                                          ("B", "mouse_1", 4., 5., 1.,
+                                           False)]), None)
+        self.assertEqual(visits.get_starttimes_array("mouse_1").tolist(),
+                         [1., 4.])
+        self.assertEqual(visits.get_endtimes_array("mouse_1",
+                                                   t_start=2).tolist(),
+                         [5.])
+        self.assertEqual(visits.get_durations_array("mouse_1").tolist(),
+                         [2., 1.])
+        self.assertEqual(visits.get_visit_addresses_array(
+            "mouse_1").tolist(), ["A", "B"])
+
+    def test_repeated_mouse(self):
+        self.assertEqual(self.data.get_times(["mouse_1", "mouse_1"]),
+                         [2., 4., 5.])
+
+    def test_cut_out_queries(self):
+        data = Data(make_data(), (2, 5))
+        self.assertEqual(data.get_times("mouse_2"), [3.])
+        self.assertEqual(data.get_times(["mouse_1", "mouse_2"]),
+                         [2., 3., 4.])
+
+
+class TestView(unittest.TestCase):
+    def setUp(self):
+        self.data = Data(make_data(), None)
+
+    def test_window(self):
+        view = self.data.view(2, 5)
+        self.assertTrue(np.all(view.data == make_data()[1:4]))
+        self.assertTrue(np.shares_memory(view.columns["Time"],
+                                         self.data.columns["Time"]))
+
+    def test_mice(self):
+        view = self.data.view(mice="mouse_1")
+        self.assertEqual(len(view), 3)
+        self.assertEqual(view.labels("Tag").tolist(), ["mouse_1"])
+        self.assertEqual(view.get_times(["mouse_1", "mouse_2"]),
+                         [2., 4., 5.])
+
+    def test_mask(self):
+        view = self.data.view(mice=["mouse_2"], t_end=6)
+        view.mask_data([2, 6])
+        self.assertEqual(view.get_times("mouse_2"), [3.])
+        self.assertIsNone(self.data.mask)
+
+    def test_tag_index(self):
+        view = self.data.view(2, 6, mice="mouse_1")
+        rows, offsets = view.tag_index()
+        self.assertEqual(rows.tolist(), [0, 2, 3])
+        self.assertEqual(offsets.tolist(), [0, 3, 3])
+        self.assertEqual(view.get_times("mouse_1"), [2., 4., 5.])
+
+    def test_nested(self):
+        view = self.data.view(mice=["mouse_1", "mouse_2"]).view(
+            t_start=2).view(mice="mouse_2")
+        self.assertEqual(len(view), 2)
+        self.assertEqual(view.labels("Tag").tolist(), ["mouse_2"])
+        self.assertEqual(view.get_times(["mouse_1", "mouse_2"]), [3., 6.])
+
+    def test_save(self):
+        path = tempfile.mkdtemp()
+        self.data.view(mice=["mouse_2"]).save(path)
+        loaded = Data.load(path)
+        self.assertEqual(loaded.get_times("mouse_2"), [1., 3., 6.])
+        self.assertEqual(loaded.get_times("mouse_1"), [])
+        shutil.rmtree(path)
+
+
+class TestTagIndex(unittest.TestCase):
+    def setUp(self):
+        self.data = Data(make_data(), None)
+
+    def test_rows(self):
+        rows, offsets = self.data.tag_index()
+        self.assertEqual(rows.tolist(), [1, 3, 4, 0, 2, 5])
+        self.assertEqual(offsets.tolist(), [0, 3, 6])
+
+    def test_cut_out(self):
+        data = Data(make_data(), (2, 5))
+        rows, offsets = data.tag_index()
+        self.assertEqual(rows.tolist(), [0, 2, 1])
+        self.assertEqual(offsets.tolist(), [0, 2, 3])
+
+    def test_random(self):
+        raw = np.zeros(1000, dtype=REGISTRATION_DTYPE)
+        rng = np.random.RandomState(0)
+        raw["Time"] = np.sort(rng.uniform(0, 100, len(raw)))
+        raw["Tag"] = rng.choice(["a", "b", "c", "d"], len(raw))
+        raw["Antenna"] = rng.choice(["1", "2", "3"], len(raw))
+        data = Data(raw, None)
+        data.mask_data([20, 70])
+        idx = (raw["Time"] >= 20) & (raw["Time"] < 70)
+        for mice in [["a"], ["b", "d"], ["a", "b", "c", "d"]]:
+            selected = idx & np.isin(raw["Tag"], mice)
+            self.assertEqual(data.get_times(mice),
+                             raw["Time"][selected].tolist())
+            self.assertEqual(data.get_antennas(mice),
+                             raw["Antenna"][selected].tolist())
+
+
+class TestVisitsEncoding(unittest.TestCase):
+    def setUp(self):
+        self.raw = transform_visits([("cage A", "mouse_1", 1., 2., 1., True),
+                                     ("cage B", "mouse_2", 2., 5., 3., False),
+                                     ("cage A", "mouse_2", 6., 8., 2., True)])
+        self.visits = Visits(self.raw, None)
+
+    def test_decoded(self):
+        self.assertTrue(np.all(self.visits.data == self.raw))
+
+    def test_addresses(self):
+        self.assertEqual(self.visits.get_visit_addresses("mouse_2"),
+                         ["cage B", "cage A"])
+
+    def test_address_codes(self):
+        self.assertEqual(self.visits.columns["Address"].tolist(), [0, 1, 0])
+
+
+class TestMsec(unittest.TestCase):
+    def setUp(self):
+        raw = convert_times(make_data(), msec=True)
+        raw["Time"] += 1500
+        self.data = Data(raw, None)
+
+    def test_msec(self):
+        self.assertTrue(self.data.msec)
+        self.assertFalse(Data(make_data(), None).msec)
+
+    def test_stored(self):
+        self.assertEqual(self.data.columns["Time"].dtype, np.int64)
+        self.assertEqual(self.data.columns["Time"].tolist(),
+                         [2500, 3500, 4500, 5500, 6500, 7500])
+
+    def test_times(self):
+        self.assertEqual(self.data.get_times("mouse_1"), [3.5, 5.5, 6.5])
+
+    def test_raw(self):
+        self.assertEqual(self.data.getraw("mouse_1", "Time").tolist(),
+                         [3500, 5500, 6500])
+
+    def test_mask(self):
+        self.data.mask_data((3.5, 6.5))
+        self.assertEqual(self.data.get_times("mouse_1"), [3.5, 5.5])
+
+    def test_infinite_bounds(self):
+        self.assertEqual(self.data.get_times("mouse_1", -np.inf, np.inf),
+                         [3.5, 5.5, 6.5])
+        self.assertEqual(self.data.get_times("mouse_1", 4, np.inf),
+                         [5.5, 6.5])
+        self.assertEqual(self.data.get_times("mouse_1", -np.inf, 1e300),
+                         [3.5, 5.5, 6.5])
+        self.data.mask_data((-np.inf, 5.5))
+        self.assertEqual(self.data.get_times("mouse_1"), [3.5])
+
+    def test_visits(self):
+        visits = Visits(transform_visits([("cage A", "mouse_1", 1000, 2500,
+                                           1500, True)], msec=True), None)
+        self.assertTrue(visits.msec)
+        self.assertEqual(visits.get_starttimes("mouse_1"), [1.])
+        self.assertEqual(visits.get_endtimes("mouse_1"), [2.5])
+        self.assertEqual(visits.get_durations("mouse_1"), [1.5])
+
+
+class TestColumnStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.raw = make_data()
+        self.data = Data(self.raw, None)
+        self.data.save(self.dir)
+        self.loaded = Data.load(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_memmap(self):
+        for key in self.raw.dtype.names:
+            self.assertIsInstance(self.loaded.columns[key], np.memmap)
+
+    def test_not_mapped(self):
+        loaded = Data.load(self.dir, mmap_mode=None)
+        self.assertNotIsInstance(loaded.columns["Time"], np.memmap)
+        self.assertTrue(np.all(loaded.data == self.raw))
+
+    def test_decoded(self):
+        self.assertEqual(self.loaded.data.dtype, self.raw.dtype)
+        self.assertTrue(np.all(self.loaded.data == self.raw))
+
+    def test_getproperty(self):
+        self.loaded.mask_data([2, 5])
+        self.data.mask_data([2, 5])
+        self.assertEqual(self.loaded.get_antennas("mouse_1"),
+                         self.data.get_antennas("mouse_1"))
+        self.assertEqual(self.loaded.get_times(["mouse_1", "mouse_2"]),
+                         self.data.get_times(["mouse_1", "mouse_2"]))
+
+    def test_msec(self):
+        data = Data(convert_times(self.raw, msec=True), None)
+        data.save(os.path.join(self.dir, "msec"))
+        loaded = Data.load(os.path.join(self.dir, "msec"))
+        self.assertTrue(loaded.msec)
+        self.assertEqual(loaded.get_times("mouse_1"),
+                         data.get_times("mouse_1"))
+
+    def test_visits(self):
+        visits = Visits(transform_visits([("A", "mouse_1", 1., 3., 2., True),
+                                          ("B", "mouse_2", 2., 5., 3.,
+                                           False)]), None)
+        visits.save(os.path.join(self.dir, "visits"))
+        loaded = Visits.load(os.path.join(self.dir, "visits"))
+        self.assertEqual(loaded.get_visit_addresses(["mouse_1", "mouse_2"]),
+                         ["A", "B"])
+
+
+class TestShared(unittest.TestCase):
+    def setUp(self):
+        self.raw = make_data()
+        self.data = Data(self.raw, None)
+        self.handle = self.data.share()
+        self.shared = pickle.loads(pickle.dumps(self.handle)).attach()
+
+    def tearDown(self):
+        del self.shared
+        self.handle.close()
+
+    def test_data(self):
+        self.assertEqual(self.shared.data.dtype, self.raw.dtype)
+        self.assertTrue(np.all(self.shared.data == self.raw))
+
+    def test_read_only(self):
+        with self.assertRaises(ValueError):
+            self.shared.columns["Time"][0] = 0
+
+    def test_getproperty(self):
+        self.shared.mask_data([2, 5])
+        self.data.mask_data([2, 5])
+        self.assertEqual(self.shared.get_antennas("mouse_1"),
+                         self.data.get_antennas("mouse_1"))
+        self.assertEqual(self.shared.get_times(["mouse_1", "mouse_2"]),
+                         self.data.get_times(["mouse_1", "mouse_2"]))
+
+    def test_tag_index(self):
+        rows, offsets = self.shared._tag_index
+        self.assertFalse(rows.flags.writeable)
+        for shared, expected in zip(self.shared.tag_index(),
+                                    self.data.tag_index()):
+            self.assertEqual(shared.tolist(), expected.tolist())
+
+    def test_view(self):
+        handle = self.data.view(mice="mouse_2").share()
+        shared = handle.attach()
+        self.assertEqual(len(shared), 3)
+        self.assertEqual(shared.get_times("mouse_2"), [1., 3., 6.])
+        self.assertEqual(shared.get_times("mouse_1"), [])
+        del shared
+        handle.close()
+
+
+class TestSQLite(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "data.sqlite")
+        self.data = Data(make_data(), None)
+        self.msec_data = Data(convert_times(make_data(), msec=True), None)
+        self.visits = Visits(transform_visits(
+            [("A", "mouse_1", 1., 3., 2., True),
+             ("B", "mouse_2", 2., 5., 3., False),
+             ("A", "mouse_2", 6., 7., 1., True)]), None)
+        connection = sqlite3.connect(self.path)
+        SQLiteData.write(self.data, connection)
+        SQLiteVisits.write(self.visits, connection)
+        connection.close()
+        self.sql_data = SQLiteData(self.path)
+        self.sql_visits = SQLiteVisits(self.path)
+
+    def tearDown(self):
+        self.sql_data.close()
+        self.sql_visits.close()
+        shutil.rmtree(self.dir)
+
+    def test_data(self):
+        self.assertTrue(np.all(self.sql_data.data == self.data.data))
+        self.assertEqual(len(self.sql_data), 6)
+
+    def test_visits(self):
+        self.assertTrue(np.all(self.sql_visits.data == self.visits.data))
+
+    def test_labels(self):
+        self.assertEqual(self.sql_data.labels("Tag").tolist(),
+                         ["mouse_1", "mouse_2"])
+
+    def test_getproperty(self):
+        for mice in ["mouse_1", ["mouse_1", "mouse_2"]]:
+            self.assertEqual(self.sql_data.get_times(mice),
+                             self.data.get_times(mice))
+            self.assertEqual(self.sql_data.get_antennas(mice),
+                             self.data.get_antennas(mice))
+
+    def test_getraw(self):
+        self.assertEqual(self.sql_data.get_antenna_codes("mouse_2").tolist(),
+                         self.data.get_antenna_codes("mouse_2").tolist())
+
+    def test_mask(self):
+        self.sql_data.mask_data([2, 5])
+        self.data.mask_data([2, 5])
+        self.assertEqual(self.sql_data.get_durations(["mouse_1", "mouse_2"]),
+                         self.data.get_durations(["mouse_1", "mouse_2"]))
+        self.sql_data.unmask_data()
+        self.assertEqual(len(self.sql_data.get_times("mouse_1")), 3)
+
+    def test_mask_visits(self):
+        self.sql_visits.mask_data([2, 7])
+        self.assertEqual(self.sql_visits.get_visit_addresses("mouse_2"),
+                         ["B", "A"])
+        self.assertEqual(self.sql_visits.get_visit_addresses("mouse_1"), [])
+
+    def test_msec(self):
+        connection = sqlite3.connect(self.path)
+        SQLiteData.write(self.msec_data, connection)
+        connection.close()
+        data = SQLiteData(self.path)
+        self.assertTrue(data.msec)
+        data.mask_data([2, 5])
+        self.msec_data.mask_data([2, 5])
+        self.assertEqual(data.get_times("mouse_1"),
+                         self.msec_data.get_times("mouse_1"))
+        data.close()
+
+    def test_view(self):
+        view = self.sql_data.view(2, 6, "mouse_2")
+        expected = self.data.view(2, 6, "mouse_2")
+        self.assertTrue(np.all(view.data == expected.data))
+        self.assertEqual(len(view), len(expected))
+        self.assertEqual(view.get_times(["mouse_1", "mouse_2"]),
+                         expected.get_times(["mouse_1", "mouse_2"]))
+        self.assertEqual(view.get_times("mouse_2", t_start=4),
+                         expected.get_times("mouse_2", t_start=4))
+        self.assertEqual(len(self.sql_data), 6)
+
+    def test_read_only(self):
+        self.assertRaises(sqlite3.OperationalError,
+                          self.sql_data._connection.execute,
+                          "DELETE FROM registrations")
+
+    def test_window(self):
+        self.sql_data.mask_data([2, 3])
+        self.assertEqual(self.sql_data.get_times("mouse_1", 4, 6), [4., 5.])
+        self.assertEqual(self.sql_data.get_times("mouse_1", t_start=4),
+                         [4., 5.])
+        self.assertEqual(self.sql_data.get_times("mouse_1"), [2.])
+
+    def test_arrays(self):
+        self.assertEqual(self.sql_data.get_times_array("mouse_1").dtype,
+                         np.float64)
+        self.assertEqual(self.sql_data.get_antennas_array(
+            "mouse_2").tolist(), self.data.get_antennas("mouse_2"))
+
+    def test_pickle(self):
+        data = pickle.loads(pickle.dumps(self.sql_data))
+        self.assertEqual(data.get_times("mouse_2"), [1., 3., 6.])
+        data.close()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
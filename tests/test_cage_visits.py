@@ -1,5 +1,8 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
+import os
+import shutil
+import tempfile
 import unittest
 from collections import OrderedDict
 
@@ -9,6 +12,15 @@ from pyEcoHAB import sample_data, data_path
 from pyEcoHAB import Loader
 from pyEcoHAB import Timeline
 
+
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
 class TestGetVisits(unittest.TestCase):
     def test_intervals_only_in_the_bin(self):
         t_start = 10
@@ -294,10 +306,36 @@ class TestCalculateVisitsDurations(unittest.TestCase):
         self.assertEqual(all_vis, self.all_vB["mouse_2"])
 
 
+class TestCalculateVisitsDurationsEdges(unittest.TestCase):
+    def test_edges(self):
+        data = {
+            "mouse_1": [["A", 1, 11], ["B", 12, 15], ["A", 18, 20],
+                        ["B", 40, 70], ["A", 80, 90], ["A", 95, 130]],
+            "mouse_2": [["B", 1, 11], ["A", 12, 15], ["A", 18, 20]],
+            "mouse_3": [],
+        }
+        mice = ["mouse_1", "mouse_2", "mouse_3"]
+        edges = [5 + i*10 for i in range(10)] + [100]
+        index = {}
+        for mouse in mice:
+            starts = [s for a, s, e in data[mouse] if s >= 5]
+            idx = np.searchsorted(starts, edges)
+            index[mouse] = (idx[:-1], idx[1:])
+        for address in ["A", "B"]:
+            self.assertEqual(cv.calculate_visits_and_durations(data, mice,
+                                                               address, 5,
+                                                               100, 10),
+                             cv.calculate_visits_and_durations(data, mice,
+                                                               address, 5,
+                                                               100, 10,
+                                                               edges,
+                                                               index))
+
+
 class TestGetActivity(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.data = Loader(sample_data)
+        cls.data = Loader(sample_data, res_dir=RES_DIR)
         cls.config = Timeline(sample_data)
         cls.uneven = Timeline(data_path, "uneven_phases.txt")
         cls.ALL = cv.get_activity(cls.data, cls.config, "ALL")
@@ -1,7 +1,10 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
+import shutil
+import tempfile
 import os
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 import pyEcoHAB.utils.for_loading as uf
 import pyEcoHAB.utility_functions as utils
@@ -11,6 +14,14 @@ from pyEcoHAB import Timeline
 from pyEcoHAB.SetupConfig import SetupConfig
 
 
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
 class TestSingleAntennaStats(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -39,6 +50,138 @@ class TestSingleAntennaStats(unittest.TestCase):
                                                   times[1], "8", 900)
         self.assertEqual(result, ([0, 0, 0, 1], [0, 0, 0, 1026/1000]))
 
+    def test_mask_unchanged(self):
+        times = self.config.get_time_from_epoch("ALL")
+        self.data.get_registration_stats("mouse_1", times[0], times[1], "1",
+                                         900)
+        self.assertIsNone(self.data.registrations.mask)
+
+
+class TestWindowQueries(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "weird_short")
+        cls.data = Loader(path, res_dir=RES_DIR)
+        cls.windows = [(t, t + 600) for t in
+                       range(int(cls.data.session_start),
+                             int(cls.data.session_end), 600)]
+
+    def masked(self, mouse, t_start, t_end):
+        self.data.mask_data(t_start, t_end)
+        out = (self.data.get_times(mouse), self.data.get_antennas(mouse),
+               self.data.get_durations(mouse),
+               self.data.get_visit_addresses(mouse),
+               self.data.get_starttimes(mouse),
+               self.data.get_endtimes(mouse),
+               self.data.get_visit_durations(mouse))
+        self.data.unmask_data()
+        return out
+
+    def window(self, mouse, t_start, t_end):
+        return (self.data.get_times(mouse, t_start, t_end),
+                self.data.get_antennas(mouse, t_start, t_end),
+                self.data.get_durations(mouse, t_start, t_end),
+                self.data.get_visit_addresses(mouse, t_start, t_end),
+                self.data.get_starttimes(mouse, t_start, t_end),
+                self.data.get_endtimes(mouse, t_start, t_end),
+                self.data.get_visit_durations(mouse, t_start, t_end))
+
+    def test_same_as_mask(self):
+        for mouse in self.data.mice:
+            for t_start, t_end in self.windows:
+                self.assertEqual(self.masked(mouse, t_start, t_end),
+                                 self.window(mouse, t_start, t_end))
+
+    def test_mask_ignored(self):
+        t_start, t_end = self.windows[1]
+        expected = self.data.get_times(self.data.mice, t_start, t_end)
+        self.data.mask_data(*self.windows[0])
+        self.assertEqual(self.data.get_times(self.data.mice, t_start, t_end),
+                         expected)
+        self.assertEqual(self.data.mask, self.windows[0])
+        self.data.unmask_data()
+
+    def test_one_bound(self):
+        t_start = self.windows[2][0]
+        times = self.data.get_times(self.data.mice)
+        self.assertEqual(self.data.get_times(self.data.mice, t_start=t_start),
+                         [t for t in times if t >= t_start])
+        self.assertEqual(self.data.get_times(self.data.mice, t_end=t_start),
+                         [t for t in times if t < t_start])
+
+    def test_whole_dataset_mask(self):
+        mouse = self.data.mice[0]
+        self.data.mask_data(*self.windows[0])
+        times, antennas = utils.get_times_antennas(self.data, mouse, 0, -1)
+        data = utils.prepare_data(self.data, mouse)[mouse]
+        self.assertEqual(self.data.mask, self.windows[0])
+        self.data.unmask_data()
+        self.assertEqual(times, self.data.get_times(mouse))
+        self.assertEqual(antennas, self.data.get_antennas(mouse))
+        self.assertEqual(len(data), len(self.data.get_starttimes(mouse)))
+
+    def test_whole_dataset_msec(self):
+        data = Loader(os.path.join(data_path, "weird_short"),
+                      msec_timestamps=True, res_dir=RES_DIR)
+        for mouse in data.mice:
+            times, antennas = utils.get_times_antennas(data, mouse, 0, -1)
+            self.assertEqual(times, data.get_times(mouse))
+            self.assertEqual(antennas, data.get_antennas(mouse))
+
+    def test_whole_dataset_empty(self):
+        mouse = self.data.mice[0]
+        empty = self.data.view(t_start=self.data.session_end + 3600)
+        self.assertEqual(utils.get_times_antennas(empty, mouse, 0, -1),
+                         ([], []))
+        self.assertEqual(utils.get_ecohab_data_with_margin(empty, mouse,
+                                                           0, -1),
+                         ([], [], []))
+
+    def test_get_visits_mask(self):
+        self.data.get_visits(t_start=self.windows[1][0],
+                             t_end=self.windows[1][1])
+        self.assertIsNone(self.data.mask)
+        self.assertIsNone(self.data.visits.mask)
+
+    def test_arrays(self):
+        for mouse in self.data.mice:
+            for t_start, t_end in self.windows[:3]:
+                self.assertEqual(
+                    self.data.get_times_array(mouse, t_start,
+                                              t_end).tolist(),
+                    self.data.get_times(mouse, t_start, t_end))
+                self.assertEqual(
+                    self.data.get_antennas_array(mouse, t_start,
+                                                 t_end).tolist(),
+                    self.data.get_antennas(mouse, t_start, t_end))
+                self.assertEqual(
+                    self.data.get_starttimes_array(mouse, t_start,
+                                                   t_end).tolist(),
+                    self.data.get_starttimes(mouse, t_start, t_end))
+                self.assertEqual(
+                    self.data.get_visit_addresses_array(mouse, t_start,
+                                                        t_end).tolist(),
+                    self.data.get_visit_addresses(mouse, t_start, t_end))
+
+    def test_times_arrays_antennas(self):
+        t_start, t_end = self.windows[1]
+        out = utils.get_times_arrays_antennas(self.data, self.data.mice,
+                                              t_start, t_end)
+        for mouse in self.data.mice:
+            times, antennas = utils.get_times_antennas(self.data, mouse,
+                                                       t_start, t_end)
+            self.assertEqual(out[mouse][0].tolist(), times)
+            self.assertEqual(out[mouse][1], antennas)
+
+    def test_threads(self):
+        queries = [(mouse, t_start, t_end) for mouse in self.data.mice
+                   for t_start, t_end in self.windows]
+        expected = [self.window(*query) for query in queries]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            out = list(pool.map(lambda query: self.window(*query), queries))
+        self.assertEqual(out, expected)
+
+
 
 if __name__ == '__main__':
     unittest.main()
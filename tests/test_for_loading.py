@@ -4,6 +4,11 @@
 from __future__ import print_function, division, absolute_import
 import os
 import glob
+import gzip
+import shutil
+import tarfile
+import zipfile
+import tempfile
 import unittest
 import numpy as np
 import pyEcoHAB.utils.for_loading as uf
@@ -12,6 +17,18 @@ from pyEcoHAB import data_path
 from pyEcoHAB.SetupConfig import SetupConfig
 
 
+TMP_DIR = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
+def results_dir(path):
+    """Results of data in path are written to TMP_DIR"""
+    return os.path.join(TMP_DIR, os.path.basename(path), "Results")
+
+
 SAME_PIPE = {
     "1": ["1", "2"],
     "2": ["1", "2"],
@@ -98,6 +115,51 @@ class TestParseFilename(unittest.TestCase):
         self.assertRaises(ValueError, uf.parse_fname, fname=fname)
 
 
+class TestFnameTimeRange(unittest.TestCase):
+    def test_range(self):
+        start, end = uf.fname_time_range("20190403_120000.txt")
+        self.assertEqual(start, uf.time_to_sec("20190403 12:00:00"))
+        self.assertEqual(end, start + 3600)
+
+
+class TestSelectFnames(unittest.TestCase):
+    fnames = ["20190403_100000.txt", "20190403_110000.txt",
+              "20190403_120000.txt", "20190403_130000.txt",
+              "20190403_140000.txt", "20190403_150000.txt"]
+
+    def test_no_mask(self):
+        self.assertEqual(uf.select_fnames(self.fnames, None), self.fnames)
+
+    def test_mask(self):
+        mask = (uf.time_to_sec("20190403 12:30:00"),
+                uf.time_to_sec("20190403 13:30:00"))
+        self.assertEqual(uf.select_fnames(self.fnames, mask),
+                         self.fnames[1:5])
+
+    def test_mask_no_slack(self):
+        mask = (uf.time_to_sec("20190403 12:30:00"),
+                uf.time_to_sec("20190403 13:30:00"))
+        self.assertEqual(uf.select_fnames(self.fnames, mask, slack=0),
+                         self.fnames[2:4])
+
+    def test_end_only(self):
+        mask = (uf.time_to_sec("20190403 10:30:00"),)
+        self.assertEqual(uf.select_fnames(self.fnames, mask),
+                         self.fnames[:2])
+
+
+class TestClipToMask(unittest.TestCase):
+    def test_clip(self):
+        data = np.zeros(4, dtype=uf.REGISTRATION_DTYPE)
+        data["Time"] = [1, 2, 3, 4]
+        out = uf.clip_to_mask(data, (2, 4))
+        self.assertEqual(out["Time"].tolist(), [2, 3])
+
+    def test_no_mask(self):
+        data = np.zeros(4, dtype=uf.REGISTRATION_DTYPE)
+        self.assertEqual(len(uf.clip_to_mask(data, None)), 4)
+
+
 class TestPrintHumanTime(unittest.TestCase):
     def test_date(self):
         tt = 1554247067
@@ -122,6 +184,70 @@ class TestTimeToSec(unittest.TestCase):
         self.assertRaises(ValueError, uf.time_to_sec, tt=string)
 
 
+class TestTimesToSec(unittest.TestCase):
+    def test_sec(self):
+        strings = ["20190709 20:05:13.333", "20190709 21:05:13.003",
+                   "20190710 00:00:00.000"]
+        out = uf.times_to_sec(strings)
+        expected = [uf.time_to_sec(string) for string in strings]
+        self.assertEqual(out.tolist(), expected)
+
+    def test_irregular(self):
+        strings = ["20190709 20:05:13", "20190709 20:05:13.5",
+                   "20190709 20:05:13.333"]
+        out = uf.times_to_sec(strings)
+        expected = [uf.time_to_sec(string) for string in strings]
+        self.assertEqual(out.tolist(), expected)
+
+    def test_empty(self):
+        self.assertEqual(len(uf.times_to_sec([])), 0)
+
+    def test_sec_raise_1(self):
+        strings = ["20190709 20:05:13.333", "2019070920:05:13"]
+        self.assertRaises(ValueError, uf.times_to_sec, strings)
+
+    def test_sec_raise_2(self):
+        strings = ["20191309 20:05:13.333"]
+        self.assertRaises(ValueError, uf.times_to_sec, strings)
+
+
+class TestConvertTimes(unittest.TestCase):
+    def setUp(self):
+        self.data = uf.read_single_file_array(os.path.join(data_path,
+                                                           "weird_short"),
+                                              "20101010_110000.txt")
+
+    def test_sec_to_msec(self):
+        self.assertEqual(uf.sec_to_msec(1286708400.218), 1286708400218)
+
+    def test_msec(self):
+        out = uf.convert_times(self.data, msec=True)
+        self.assertEqual(out.dtype["Time"], np.int64)
+        self.assertTrue(np.all(out["Time"] ==
+                               np.round(self.data["Time"]*1000)))
+        self.assertTrue(np.all(out["Tag"] == self.data["Tag"]))
+
+    def test_round_trip(self):
+        out = uf.convert_times(uf.convert_times(self.data, msec=True),
+                               msec=False)
+        self.assertEqual(out.dtype, self.data.dtype)
+        self.assertTrue(np.all(out == self.data))
+
+    def test_visits(self):
+        visits = uf.transform_visits([("cage A", "mouse_1", 1.5, 3.25, 1.75,
+                                       True)])
+        out = uf.convert_times(visits, msec=True)
+        self.assertEqual(out["AbsStartTimecode"].tolist(), [1500])
+        self.assertEqual(out["AbsEndTimecode"].tolist(), [3250])
+        self.assertEqual(out["VisitDuration"].tolist(), [1750])
+        self.assertEqual(out.dtype["ValidVisitSolution"], bool)
+
+    def test_transform_visits_msec(self):
+        visits = uf.transform_visits([("cage A", "mouse_1", 1500, 3250, 1750,
+                                       True)], msec=True)
+        self.assertEqual(visits.dtype["AbsStartTimecode"], np.int64)
+
+
 class TestReformatDateTime(unittest.TestCase):
     def test_1(self):
         date = "2018.07.27"
@@ -181,6 +307,272 @@ class TestReadInSingleFile(unittest.TestCase):
         self.assertEqual(last_line, self.out[-1])
 
 
+class TestReadInSingleFileArray(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.paths = [os.path.join(data_path, "weird_short"),
+                     os.path.join(data_path, "weird_short_3_mice"),
+                     os.path.join(data_path, "time_change"),
+                     os.path.join(data_path, "BALB_VPA_data_cohort_1")]
+
+    def test_same_as_from_raw_data(self):
+        for path in self.paths:
+            for fname in uf.get_filenames(path):
+                raw_data = uf.read_single_file(path, fname)
+                expected = uf.from_raw_data(raw_data)
+                out = uf.read_single_file_array(path, fname)
+                self.assertEqual(out.dtype, expected.dtype)
+                self.assertTrue(np.all(out == expected))
+
+    def test_old_format(self):
+        text = "1\t11:00:49.020\t5\t102\tmouse_3\n"\
+            + "2\t11:01:49.020\t4\t12\tmouse_1\n"
+        out = uf.tokenize_data(text, "20101010_110000.txt")
+        self.assertEqual(out["Time"].tolist(), ["20101010 11:00:49.020",
+                                                "20101010 11:01:49.020"])
+        self.assertEqual(out["Tag"].tolist(), ["mouse_3", "mouse_1"])
+
+    def test_mixed_format(self):
+        text = "1\t11:00:49.020\t5\t102\tmouse_3\n"\
+            + "2\t2010.10.10\t11:01:49.020\t4\t12\tmouse_1\n"
+        out = uf.tokenize_data(text, "20101010_110000.txt")
+        self.assertEqual(out["Time"].tolist(), ["20101010 11:00:49.020",
+                                                "20101010 11:01:49.020"])
+        self.assertEqual(out["Duration"].tolist(), [102, 12])
+
+    def test_compensating_columns(self):
+        text = "1\t2010.10.10\t11:00:49.020\t5\t102\tmouse_3\n"\
+            + "2\t2010.10.10\t11:01:49.020\t4\t12\tmouse_1\t0\n"\
+            + "3\t11:02:49.020\t3\t22\tmouse_2\n"
+        out = uf.tokenize_data(text, "20101010_110000.txt")
+        self.assertEqual(out["Time"].tolist(), ["20101010 11:00:49.020",
+                                                "20101010 11:01:49.020",
+                                                "20101010 11:02:49.020"])
+        self.assertEqual(out["Tag"].tolist(),
+                         ["mouse_3", "mouse_1", "mouse_2"])
+        self.assertEqual(out["Duration"].tolist(), [102, 12, 22])
+
+    def test_empty(self):
+        out = uf.from_columns(uf.tokenize_data("", "20101010_110000.txt"))
+        self.assertEqual(len(out), 0)
+
+    def test_wrong_format(self):
+        text = "1\t11:00:49.020\t5\t102\n"
+        self.assertRaises(IOError, uf.tokenize_data, text,
+                          "20101010_110000.txt")
+
+
+class TestReadSingleFileCached(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dir, "cache")
+        os.makedirs(self.cache_dir)
+        self.fname = "20101010_110000.txt"
+        shutil.copy(os.path.join(data_path, "weird_short", self.fname),
+                    self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cache_created(self):
+        uf.read_single_file_cached(self.dir, self.fname, self.cache_dir)
+        self.assertEqual(os.listdir(self.cache_dir),
+                         [uf.cache_fname(self.dir, self.fname)])
+
+    def test_cached_data(self):
+        out1 = uf.read_single_file_cached(self.dir, self.fname,
+                                          self.cache_dir)
+        out2 = uf.read_single_file_cached(self.dir, self.fname,
+                                          self.cache_dir)
+        expected = uf.read_single_file_array(self.dir, self.fname)
+        self.assertTrue(np.all(out1 == expected))
+        self.assertTrue(np.all(out2 == expected))
+
+    def test_changed_file(self):
+        uf.read_single_file_cached(self.dir, self.fname, self.cache_dir)
+        with open(os.path.join(self.dir, self.fname), "a") as f:
+            f.write("15895\t2010.10.10\t11:59:59.218\t4\t307\tmouse_1\n")
+        out = uf.read_single_file_cached(self.dir, self.fname,
+                                         self.cache_dir)
+        self.assertEqual(len(out), 102)
+        self.assertEqual(os.listdir(self.cache_dir),
+                         [uf.cache_fname(self.dir, self.fname)])
+
+    def test_read_files(self):
+        out = uf.read_files(self.dir, [self.fname], cache_dir=self.cache_dir)
+        expected = uf.read_single_file_array(self.dir, self.fname)
+        self.assertTrue(np.all(out[0] == expected))
+
+
+class TestCompressedData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                                "setup_1")
+        cls.fnames = sorted(uf.get_filenames(cls.path))[:3]
+        cls.dir = tempfile.mkdtemp()
+        cls.zip = os.path.join(cls.dir, "data.zip")
+        with zipfile.ZipFile(cls.zip, "w", zipfile.ZIP_DEFLATED) as zf:
+            for fname in cls.fnames:
+                zf.write(os.path.join(cls.path, fname), "data/" + fname)
+            zf.writestr("data/info.txt", "genotype: none\n")
+        cls.tar = os.path.join(cls.dir, "data.tar.xz")
+        with tarfile.open(cls.tar, "w:xz") as tf:
+            for fname in cls.fnames:
+                tf.add(os.path.join(cls.path, fname), fname)
+        cls.gz = os.path.join(cls.dir, "gz")
+        os.makedirs(cls.gz)
+        for fname in cls.fnames:
+            with open(os.path.join(cls.path, fname), "rb") as f_in:
+                with gzip.open(os.path.join(cls.gz, fname + ".gz"),
+                               "wb") as f_out:
+                    f_out.write(f_in.read())
+        cls.expected = [uf.read_single_file_array(cls.path, fname)
+                        for fname in cls.fnames]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def test_is_archive(self):
+        self.assertTrue(uf.is_archive(self.zip))
+        self.assertTrue(uf.is_archive(self.tar))
+        self.assertFalse(uf.is_archive(self.gz))
+
+    def test_data_directory(self):
+        self.assertEqual(uf.data_directory(self.zip), self.dir)
+        self.assertEqual(uf.data_directory(self.gz), self.gz)
+
+    def test_get_filenames_zip(self):
+        self.assertEqual(sorted(uf.get_filenames(self.zip)),
+                         ["data/" + fname for fname in self.fnames])
+
+    def test_get_filenames_tar(self):
+        self.assertEqual(sorted(uf.get_filenames(self.tar)), self.fnames)
+
+    def test_get_filenames_gz(self):
+        self.assertEqual(sorted(uf.get_filenames(self.gz)),
+                         [fname + ".gz" for fname in self.fnames])
+
+    def test_read_zip(self):
+        for fname, expected in zip(self.fnames, self.expected):
+            out = uf.read_single_file_array(self.zip, "data/" + fname)
+            self.assertTrue(np.all(out == expected))
+
+    def test_read_tar(self):
+        out = uf.read_files(self.tar, self.fnames[::-1])
+        for data, expected in zip(out, self.expected[::-1]):
+            self.assertTrue(np.all(data == expected))
+
+    def test_read_tar_single_file(self):
+        out = uf.read_single_file(self.tar, self.fnames[0])
+        expected = uf.read_single_file(self.path, self.fnames[0])
+        self.assertEqual(out, expected)
+
+    def test_read_gz(self):
+        out = uf.read_files(self.gz, [fname + ".gz" for fname in self.fnames])
+        for data, expected in zip(out, self.expected):
+            self.assertTrue(np.all(data == expected))
+
+    def test_read_tar_cached(self):
+        cache_dir = os.path.join(self.dir, "cache")
+        uf.read_files(self.tar, self.fnames, cache_dir=cache_dir)
+        self.assertEqual(len(os.listdir(cache_dir)), len(self.fnames))
+        out = uf.read_files(self.tar, self.fnames, cache_dir=cache_dir)
+        for data, expected in zip(out, self.expected):
+            self.assertTrue(np.all(data == expected))
+        shutil.rmtree(cache_dir)
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                                 "setup_1")
+        self.fnames = sorted(uf.get_filenames(self.path))
+        for fname in self.fnames[:2]:
+            shutil.copy(os.path.join(self.path, fname), self.dir)
+        self.manifest_path = os.path.join(self.dir, uf.MANIFEST_FNAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_build(self):
+        manifest = uf.build_manifest(self.dir)
+        self.assertEqual(sorted(manifest.keys()), self.fnames[:2])
+        data = uf.read_single_file_array(self.dir, self.fnames[0])
+        stats = manifest[self.fnames[0]]
+        self.assertEqual(stats["rows"], len(data))
+        self.assertEqual(stats["min_time"], data["Time"].min())
+        self.assertEqual(stats["max_time"], data["Time"].max())
+        self.assertEqual(sum(stats["antennas"].values()), len(data))
+        self.assertEqual(stats["tags"], sorted(set(data["Tag"])))
+
+    def test_saved(self):
+        manifest = uf.build_manifest(self.dir)
+        self.assertEqual(uf.load_manifest(self.manifest_path), manifest)
+
+    def test_incremental(self):
+        uf.build_manifest(self.dir)
+        shutil.copy(os.path.join(self.path, self.fnames[2]), self.dir)
+        manifest = uf.build_manifest(self.dir)
+        self.assertEqual(sorted(manifest.keys()), self.fnames[:3])
+
+    def test_removed_file(self):
+        uf.build_manifest(self.dir)
+        os.remove(os.path.join(self.dir, self.fnames[1]))
+        manifest = uf.build_manifest(self.dir)
+        self.assertEqual(list(manifest.keys()), self.fnames[:1])
+
+    def test_changed_file(self):
+        uf.build_manifest(self.dir)
+        with open(os.path.join(self.dir, self.fnames[0]), "a") as f:
+            f.write("15895\t2014.06.16\t12:59:59.218\t4\t307\tmouse_1\n")
+        manifest = uf.build_manifest(self.dir)
+        data = uf.read_single_file_array(self.dir, self.fnames[0])
+        self.assertEqual(manifest[self.fnames[0]]["rows"], len(data))
+
+    def test_load_missing(self):
+        self.assertEqual(uf.load_manifest(self.manifest_path), {})
+
+    def test_summary(self):
+        manifest = uf.build_manifest(self.dir)
+        summary = uf.manifest_summary(manifest)
+        data = np.concatenate([uf.read_single_file_array(self.dir, fname)
+                               for fname in self.fnames[:2]])
+        self.assertEqual(summary["rows"], len(data))
+        self.assertEqual(summary["start"], data["Time"].min())
+        self.assertEqual(summary["end"], data["Time"].max())
+        self.assertEqual(summary["tags"], sorted(set(data["Tag"])))
+        self.assertEqual(summary["gaps"], [])
+
+    def test_summary_gaps(self):
+        manifest = {
+            "a": {"rows": 1, "min_time": 0., "max_time": 100.,
+                  "antennas": {"1": 1}, "tags": ["a"]},
+            "b": {"rows": 1, "min_time": 5000., "max_time": 6000.,
+                  "antennas": {"1": 1}, "tags": ["b"]},
+            "c": {"rows": 0, "min_time": None, "max_time": None,
+                  "antennas": {}, "tags": []},
+        }
+        summary = uf.manifest_summary(manifest, max_break=1000)
+        self.assertEqual(summary["gaps"], [(100., 5000.)])
+        self.assertEqual(summary["antennas"], {"1": 2})
+
+    def test_select_fnames(self):
+        manifest = {
+            "20190403_100000.txt": {"rows": 1, "min_time": 0.,
+                                    "max_time": 100.},
+            "20190403_110000.txt": {"rows": 1, "min_time": 100.,
+                                    "max_time": 200.},
+            "20190403_120000.txt": {"rows": 0, "min_time": None,
+                                    "max_time": None},
+        }
+        out = uf.select_fnames(sorted(manifest.keys()), (150, 300),
+                               manifest=manifest)
+        self.assertEqual(out, ["20190403_110000.txt"])
+
+
 class TestRemoveGhostTags(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -272,6 +664,62 @@ class TestRemoveAntennas(unittest.TestCase):
                          set(["mouse_1", "mouse_2"]))
 
 
+class TestFilterRows(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(data_path, "weird_short_3_mice")
+        cls.fname = "20101010_110000.txt"
+        cls.data = uf.read_single_file_array(cls.path, cls.fname)
+
+    def test_isin_labels(self):
+        out = uf.isin_labels(np.array(["1", "2", "1", "3"]), ["1", 3])
+        self.assertEqual(out.tolist(), [True, False, True, False])
+
+    def test_default(self):
+        out = uf.filter_rows(self.data)
+        self.assertTrue(np.all(out == self.data))
+
+    def test_legal_tags(self):
+        out = uf.filter_rows(self.data, legal_tags=["mouse_1", "mouse_3"])
+        expected = uf.remove_ghost_tags(self.data, ["mouse_1", "mouse_3"])
+        self.assertTrue(np.all(out == expected))
+        self.assertEqual(set(out["Tag"]), set(["mouse_1", "mouse_3"]))
+
+    def test_removed_antennas(self):
+        out = uf.filter_rows(self.data, removed_antennas=["1", "2"])
+        self.assertEqual(len(out), len(self.data) - 6)
+        self.assertFalse(set(out["Antenna"]) & set(["1", "2"]))
+
+    def test_columns(self):
+        with open(os.path.join(self.path, self.fname)) as f:
+            columns = uf.tokenize_data(f.read(), self.fname)
+        out = uf.filter_rows(columns, "mouse_2", ["1"])
+        expected = uf.filter_rows(self.data, "mouse_2", ["1"])
+        self.assertTrue(np.all(uf.from_columns(out) == expected))
+
+    def test_read_single_file_array(self):
+        out = uf.read_single_file_array(self.path, self.fname,
+                                        legal_tags=["mouse_1"],
+                                        removed_antennas=["1"])
+        expected = uf.filter_rows(self.data, ["mouse_1"], ["1"])
+        self.assertTrue(np.all(out == expected))
+
+    def test_read_files_cached(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            for i in range(2):
+                out = uf.read_files(self.path, [self.fname],
+                                    cache_dir=cache_dir,
+                                    legal_tags="mouse_3",
+                                    removed_antennas=["2"])
+                expected = uf.filter_rows(self.data, "mouse_3", ["2"])
+                self.assertTrue(np.all(out[0] == expected))
+            cached = uf.load_cached(self.path, self.fname, cache_dir)
+            self.assertTrue(np.all(cached == self.data))
+        finally:
+            shutil.rmtree(cache_dir)
+
+
 class TestTransformRaw(unittest.TestCase):
     def test_date_1(self):
         row = [1, "gugu", 2, 222, "AAA"]
@@ -445,7 +893,7 @@ class TestRunDiagnostics(unittest.TestCase):
         data = uf.from_raw_data(raw_data)
         cls.mismatch1 = uf.antenna_mismatch(data, config)
         cls.presences1 = uf.check_antenna_presence(data, config, 24*3600)
-        res_path = os.path.join(path, "Results")
+        res_path = results_dir(path)
         files = glob.glob(os.path.join(res_path + "/diagnostics/*.csv"))
         for f in files:
             print("rm ", f)
@@ -457,7 +905,7 @@ class TestRunDiagnostics(unittest.TestCase):
         data = uf.from_raw_data(raw_data)
         cls.mismatch2 = uf.antenna_mismatch(data, config)
         cls.presences2 = uf.check_antenna_presence(data, config, 24*3600)
-        res_path = os.path.join(path, "Results")
+        res_path = results_dir(path)
         files = glob.glob(os.path.join(res_path + "/diagnostics/*.csv"))
         for f in files:
             os.remove(f)
@@ -468,7 +916,7 @@ class TestRunDiagnostics(unittest.TestCase):
         raw_data1 = uf.read_single_file(path1, "20101010_110000.txt")
         data1 = uf.from_raw_data(raw_data1)
         config1 = SetupConfig()
-        res_path1 = os.path.join(path1, "Results")
+        res_path1 = results_dir(path1)
         out = uf.run_diagnostics(data1, 24*3600, res_path1, config1)
         cls.incorr_tunnel = out[-1]
 
@@ -478,7 +926,7 @@ class TestRunDiagnostics(unittest.TestCase):
 
     def test_no_registration_breaks_file(self):
         path = os.path.join(data_path, "weird_short")
-        res_path = os.path.join(path, "Results")
+        res_path = results_dir(path)
         f_path = os.path.join(res_path +
                               "/diagnostics/breaks_in_registrations.csv")
         f = open(f_path)
@@ -487,7 +935,7 @@ class TestRunDiagnostics(unittest.TestCase):
 
     def test_no_mismatch_antennas_file(self):
         path = os.path.join(data_path, "weird_short")
-        res_path = os.path.join(path, "Results")
+        res_path = results_dir(path)
         f_path = os.path.join(res_path +
                               "/diagnostics/antenna_mismatches.csv")
         f = open(f_path)
@@ -496,7 +944,7 @@ class TestRunDiagnostics(unittest.TestCase):
 
     def test_total_no_mismatch_antennas_file(self):
         path = os.path.join(data_path, "weird_short")
-        res_path = os.path.join(path, "Results")
+        res_path = results_dir(path)
         f_path = os.path.join(res_path +
                               "/diagnostics/incorrect_antenna_transitions.csv")
         f = open(f_path)
@@ -505,7 +953,7 @@ class TestRunDiagnostics(unittest.TestCase):
 
     def test_registration_breaks_file(self):
         path = os.path.join(data_path, "weird_short_3_mice")
-        res_path = os.path.join(path, "Results")
+        res_path = results_dir(path)
         f_path = os.path.join(res_path +
                               "/diagnostics/breaks_in_registrations.csv")
         f = open(f_path)
@@ -514,7 +962,7 @@ class TestRunDiagnostics(unittest.TestCase):
 
     def test_mismatch_antennas_file(self):
         path = os.path.join(data_path, "weird_short_3_mice")
-        res_path = os.path.join(path, "Results")
+        res_path = results_dir(path)
         f_path = os.path.join(res_path +
                               "/diagnostics/antenna_mismatches.csv")
         f = open(f_path)
@@ -523,7 +971,7 @@ class TestRunDiagnostics(unittest.TestCase):
 
     def test_total_mismatch_antennas_file(self):
         path = os.path.join(data_path, "weird_short_3_mice")
-        res_path = os.path.join(path, "Results")
+        res_path = results_dir(path)
         f_path = os.path.join(res_path +
                               "/diagnostics/incorrect_antenna_transitions.csv")
         f = open(f_path)
@@ -654,6 +1102,118 @@ class TestAppendData(unittest.TestCase):
         line1["Time"] += 15*60
         self.assertTrue(np.all(line1 == line2))
 
+    def test_sort_order(self):
+        data2 = self.data1.copy()
+        data2["Id"] += 1000
+        out = uf.append_data_sources([self.data1, data2])
+        expected = np.concatenate([self.data1, data2])
+        expected.sort(order="Time")
+        self.assertTrue(np.all(out == expected))
+
+
+class TestMergeSorted(unittest.TestCase):
+    def make_array(self, times, first_id=0):
+        data = np.zeros(len(times), dtype=uf.REGISTRATION_DTYPE)
+        data["Time"] = times
+        data["Id"] = first_id + np.arange(len(times))
+        return data
+
+    def expected(self, arrays):
+        data = np.concatenate(arrays)
+        return data[np.argsort(data["Time"], kind="stable")]
+
+    def test_not_overlapping(self):
+        arrays = [self.make_array([1., 2., 3.]),
+                  self.make_array([3., 4.], 10),
+                  self.make_array([7.], 20)]
+        out = uf.merge_sorted(arrays)
+        self.assertEqual(out["Id"].tolist(), [0, 1, 2, 10, 11, 20])
+
+    def test_overlapping(self):
+        arrays = [self.make_array([1., 5., 3.]),
+                  self.make_array([2., 4., 6.], 10),
+                  self.make_array([7., 8.], 20)]
+        out = uf.merge_sorted(arrays)
+        self.assertTrue(np.all(out == self.expected(arrays)))
+
+    def test_overlapping_earlier_block(self):
+        arrays = [self.make_array([11., 18.]),
+                  self.make_array([21., 22.], 10),
+                  self.make_array([0., 3., 18.], 20),
+                  self.make_array([], 30)]
+        out = uf.merge_sorted(arrays)
+        self.assertTrue(np.all(out == self.expected(arrays)))
+
+    def test_ties(self):
+        arrays = [self.make_array([1., 2., 2.]),
+                  self.make_array([2., 2.], 10)]
+        out = uf.merge_sorted(arrays)
+        self.assertEqual(out["Id"].tolist(), [0, 1, 2, 10, 11])
+
+    def test_data_files(self):
+        path = os.path.join(data_path, "BALB_VPA_data_cohort_1")
+        arrays = uf.read_files(path, sorted(uf.get_filenames(path)))
+        out = uf.merge_sorted(arrays)
+        self.assertTrue(np.all(out == self.expected(arrays)))
+
+
+class TestPipeline(unittest.TestCase):
+    def test_order(self):
+        out = uf.pipeline(range(50), [lambda x: x + 1, lambda x: 2*x],
+                          queue_size=1)
+        self.assertEqual(list(out), [2*(x + 1) for x in range(50)])
+
+    def test_exception(self):
+        def fail(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+        out = uf.pipeline(range(10), [fail, lambda x: x])
+        self.assertRaises(ValueError, list, out)
+
+    def test_close(self):
+        out = uf.pipeline(range(100), [lambda x: x], queue_size=1)
+        self.assertEqual(next(out), 0)
+        out.close()
+
+    def test_empty(self):
+        self.assertEqual(list(uf.pipeline([], [lambda x: x])), [])
+
+
+class TestStreamFiles(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(data_path, "weird_short_3_mice")
+        cls.fnames = sorted(uf.get_filenames(cls.path))
+
+    def test_same_as_read_files(self):
+        expected = uf.read_files(self.path, self.fnames)
+        out = list(uf.stream_files(self.path, self.fnames, prefetch=3))
+        self.assertEqual(len(out), len(expected))
+        for data, exp in zip(out, expected):
+            self.assertTrue(np.all(data == exp))
+
+    def test_filters(self):
+        expected = uf.read_files(self.path, self.fnames,
+                                 legal_tags=["mouse_1"],
+                                 removed_antennas=["2"])
+        out = uf.read_files(self.path, self.fnames, legal_tags=["mouse_1"],
+                            removed_antennas=["2"], prefetch=2)
+        for data, exp in zip(out, expected):
+            self.assertTrue(np.all(data == exp))
+
+    def test_mask(self):
+        data = uf.merge_sorted(uf.read_files(self.path, self.fnames))
+        mask = (data["Time"][10], data["Time"][-10])
+        expected = uf.read_files(self.path, self.fnames, mask=mask)
+        out = uf.read_files(self.path, self.fnames, mask=mask, prefetch=2)
+        for data, exp in zip(out, expected):
+            self.assertTrue(np.all(data == exp))
+
+    def test_missing_file(self):
+        out = uf.stream_files(self.path, self.fnames + ["20101010_100000.txt"])
+        self.assertRaises(IOError, list, out)
+
 
 class TestTunnelErrors(unittest.TestCase):
     @classmethod
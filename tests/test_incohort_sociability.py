@@ -1,5 +1,7 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
+import shutil
+import tempfile
 import os
 import unittest
 import numpy as np
@@ -11,6 +13,14 @@ from pyEcoHAB import Loader
 from pyEcoHAB import Timeline
 
 
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
 try:
     basestring
 except NameError:
@@ -617,7 +627,7 @@ class TestSinglePhaseResults(unittest.TestCase):
         cls.duration = 3*3600
         path = os.path.join(data_path, "weird_3_mice")
         cls.config = Timeline(path)
-        data = Loader(path)
+        data = Loader(path, res_dir=RES_DIR)
         cls.phases, cls.total_time,\
             cls.data, cls.keys = utils.prepare_binned_data(data,
                                                            cls.config,
@@ -750,20 +760,18 @@ class TestSinglePhaseResults(unittest.TestCase):
 class TestGetIncohortSociability(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.data = Loader(sample_data)
+        cls.data = Loader(sample_data, res_dir=RES_DIR)
         cls.config = Timeline(sample_data)
         cls.uneven = Timeline(data_path, "uneven_phases.txt")
 
     def test_run_3600(self):
         ics.get_incohort_sociability(self.data, self.config, 3600,
-                                     res_dir=os.path.join(self.data.path,
-                                                          "Resu2"),
+                                     res_dir=os.path.join(TMP_DIR, "Resu2"),
                                      full_dir_tree=False)
 
     def test_run_dayandnight(self):
         ics.get_incohort_sociability(self.data, self.config, 24*3600,
-                                     res_dir=os.path.join(self.data.path,
-                                                          "Resu2"),
+                                     res_dir=os.path.join(TMP_DIR, "Resu2"),
                                      full_dir_tree=False)
 
     def test_run_whole_phase(self):
@@ -774,8 +782,7 @@ class TestGetIncohortSociability(unittest.TestCase):
 
     def test_run_whole_phase_uneven_2(self):
         ics.get_incohort_sociability(self.data, self.uneven, "whole phase",
-                                     res_dir=os.path.join(self.data.path,
-                                                          "Resu2"),
+                                     res_dir=os.path.join(TMP_DIR, "Resu2"),
                                      full_dir_tree=False)
 
 
@@ -0,0 +1,133 @@
+# SPDX-License-Identifier: LGPL-2.1-or-later
+from __future__ import print_function, division, absolute_import
+import os
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+import numpy as np
+
+import pyEcoHAB.utils.for_loading as uf
+from pyEcoHAB import data_path
+from pyEcoHAB import Loader, LiveLoader
+
+
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
+def sort_visits(visits):
+    return visits[np.lexsort((visits["Tag"], visits["AbsStartTimecode"]))]
+
+
+class TestLiveLoader(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                                "setup_1")
+        cls.fnames = sorted(uf.get_filenames(cls.path))
+        cls.expected = Loader(cls.path, res_dir=RES_DIR)
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for fname in os.listdir(self.path):
+            if fname not in self.fnames and\
+               os.path.isfile(os.path.join(self.path, fname)):
+                shutil.copy(os.path.join(self.path, fname), self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_part(self, fname, start, end):
+        with open(os.path.join(self.path, fname), "rb") as f:
+            text = f.read()
+        with open(os.path.join(self.dir, fname), "ab") as f:
+            f.write(text[int(start*len(text)):int(end*len(text))])
+
+    def test_incremental(self):
+        live = LiveLoader(self.dir)
+        registrations = []
+        visits = []
+        for fname in self.fnames[:20]:
+            self.write_part(fname, 0, 0.37)
+            regs, vis = live.poll()
+            registrations.append(regs)
+            visits.append(vis)
+            self.write_part(fname, 0.37, 1)
+            regs, vis = live.poll()
+            registrations.append(regs)
+            visits.append(vis)
+        for fname in self.fnames[20:]:
+            self.write_part(fname, 0, 1)
+        regs, vis = live.poll()
+        registrations.append(regs)
+        visits.append(vis)
+        visits.append(live.flush())
+        registrations = np.concatenate(registrations)
+        visits = np.concatenate(visits)
+        self.assertTrue(np.all(np.sort(registrations) ==
+                               np.sort(self.expected.registrations.data)))
+        self.assertTrue(np.all(sort_visits(visits) ==
+                               sort_visits(self.expected.visits.data)))
+
+    def test_no_new_data(self):
+        live = LiveLoader(self.dir)
+        regs, visits = live.poll()
+        self.assertEqual(len(regs), 0)
+        self.assertEqual(len(visits), 0)
+
+    def test_watch(self):
+        live = LiveLoader(self.dir, poll_interval=0.01)
+        received = []
+
+        async def callback(registrations, visits):
+            received.append((registrations, visits))
+
+        async def write_and_stop(stop_event):
+            for fname in self.fnames:
+                self.write_part(fname, 0, 1)
+                await asyncio.sleep(0.02)
+            stop_event.set()
+
+        async def main():
+            stop_event = asyncio.Event()
+            await asyncio.gather(live.watch(stop_event),
+                                 write_and_stop(stop_event))
+
+        live.subscribe(callback)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(main())
+        loop.close()
+        visits = np.concatenate([out[1] for out in received])
+        self.assertTrue(np.all(sort_visits(visits) ==
+                               sort_visits(self.expected.visits.data)))
+
+    def test_watch_executor(self):
+        live = LiveLoader(self.dir, poll_interval=0.01)
+        threads = []
+        poll = live.poll
+
+        def recorded_poll():
+            threads.append(threading.current_thread())
+            return poll()
+        live.poll = recorded_poll
+
+        async def main():
+            stop_event = asyncio.Event()
+            stop_event.set()
+            await live.watch(stop_event)
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(main())
+        loop.close()
+        self.assertTrue(len(threads))
+        self.assertNotIn(threading.main_thread(), threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
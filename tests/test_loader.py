@@ -1,33 +1,56 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
 import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
 import unittest
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import date
 import numpy as np
 import pyEcoHAB.utils.for_loading as uf
 import pyEcoHAB.utility_functions as utils
 from pyEcoHAB import data_path, sample_data
 from pyEcoHAB.SetupConfig import SetupConfig
-from pyEcoHAB import Loader, Merger, Timeline
+from pyEcoHAB.BaseFunctions import Data
+from pyEcoHAB import Loader, Merger, ChunkedLoader, Timeline
 from pyEcoHAB import get_incohort_sociability
 from pyEcoHAB import get_solitude
 from pyEcoHAB import get_activity
 from pyEcoHAB import get_dynamic_interactions
 
 
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
+def shared_queries(args):
+    handle, mouse = args
+    data = handle.attach()
+    return (data.get_times(mouse),
+            [dict(visit) for visit in data.get_visits(mouse)])
+
+
 class TestLoader(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         cls.path1 = os.path.join(data_path, "modular_1",
                                  "data_setup_additional")
-        cls.dataset1 = Loader(cls.path1, visit_threshold=1.5, prefix="gugu")
+        cls.dataset1 = Loader(cls.path1, visit_threshold=1.5, prefix="gugu",
+                              res_dir=RES_DIR)
         cls.setup1 = SetupConfig(cls.path1)
-        cls.dataset1_standard = Loader(cls.path1)
+        cls.dataset1_standard = Loader(cls.path1, res_dir=RES_DIR)
         cls.path2 = os.path.join(data_path, "weird_very_short")
-        cls.dataset2 = Loader(cls.path2, visit_threshold=2)
+        cls.dataset2 = Loader(cls.path2, visit_threshold=2, res_dir=RES_DIR)
         cls.setup3 = SetupConfig(path=data_path, fname="setup_short.txt")
         cls.dataset3 = Loader(cls.path1, visit_threshold=1.5,
-                              setup_config=cls.setup3, remove_antennas=["8"])
+                              setup_config=cls.setup3, remove_antennas=["8"],
+                              res_dir=RES_DIR)
         cls.path_empty = os.path.join(data_path, "empty")
 
     def test_load_empty(self):
@@ -114,18 +137,763 @@ class TestLoader(unittest.TestCase):
         self.assertEqual(len(out)-1, len(out2))
 
 
+class TestLoaderParallel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                                "setup_1")
+        cls.data = Loader(cls.path, res_dir=RES_DIR)
+
+    def test_n_jobs(self):
+        data = Loader(self.path, n_jobs=2, res_dir=RES_DIR)
+        self.assertEqual(data._fnames, self.data._fnames)
+        self.assertTrue(np.all(data.registrations.data ==
+                               self.data.registrations.data))
+        self.assertTrue(np.all(data.visits.data == self.data.visits.data))
+
+    def test_executor(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            data = Loader(self.path, executor=executor, res_dir=RES_DIR)
+        self.assertTrue(np.all(data.registrations.data ==
+                               self.data.registrations.data))
+
+
+class TestLoaderMask(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                                "setup_1")
+        cls.full = Loader(cls.path, res_dir=RES_DIR)
+        start = uf.fname_time_range(sorted(cls.full._fnames)[20])[0]
+        cls.mask = (start, start + 6*3600)
+        cls.data = Loader(cls.path, mask=cls.mask, res_dir=RES_DIR)
+
+    def test_files(self):
+        self.assertEqual(len(self.data._fnames), 8)
+
+    def test_registrations(self):
+        times = self.full.registrations.data["Time"]
+        idx = (times >= self.mask[0]) & (times < self.mask[1])
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               self.full.registrations.data[idx]))
+
+    def test_cut_out_data(self):
+        data = Data(self.full.registrations.data, self.mask)
+        self.assertTrue(np.all(data.data ==
+                               self.data.registrations.data))
+
+    def test_session(self):
+        self.assertTrue(self.data.session_start >= self.mask[0])
+        self.assertTrue(self.data.session_end < self.mask[1])
+
+
+class TestLoaderFilters(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = os.path.join(data_path, "weird_short_3_mice")
+        cls.full = Loader(cls.path, res_dir=RES_DIR)
+        cls.data = Loader(cls.path, legal_tags=["mouse_1", "mouse_2"],
+                          remove_antennas=["1"], res_dir=RES_DIR)
+
+    def test_registrations(self):
+        data = self.full.registrations.data
+        idx = np.isin(data["Tag"], ["mouse_1", "mouse_2"])\
+            & (data["Antenna"] != "1")
+        self.assertTrue(np.all(self.data.registrations.data == data[idx]))
+
+    def test_mice(self):
+        self.assertEqual(self.data.mice, ["mouse_1", "mouse_2"])
+
+    def test_prefetch(self):
+        data = Loader(self.path, legal_tags=["mouse_1", "mouse_2"],
+                      remove_antennas=["1"], prefetch=2, res_dir=RES_DIR)
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               data.registrations.data))
+        self.assertTrue(np.all(self.data.visits.data == data.visits.data))
+
+
+class TestLoaderManifest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                            "setup_1")
+        cls.dir = tempfile.mkdtemp()
+        for fname in os.listdir(path):
+            if os.path.isfile(os.path.join(path, fname)):
+                shutil.copy(os.path.join(path, fname), cls.dir)
+        cls.full = Loader(cls.dir, manifest=True, res_dir=RES_DIR)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def test_manifest_saved(self):
+        manifest = uf.load_manifest(os.path.join(self.dir,
+                                                 uf.MANIFEST_FNAME))
+        self.assertEqual(sorted(manifest.keys()), sorted(self.full._fnames))
+
+    def test_summary(self):
+        summary = self.full.summary()
+        self.assertEqual(summary["rows"], len(self.full.registrations.data))
+        self.assertEqual(summary["start"], self.full.session_start)
+        self.assertEqual(summary["end"], self.full.session_end)
+
+    def test_repr(self):
+        self.assertIn("%d registrations" % len(self.full.registrations.data),
+                      repr(self.full))
+
+    def test_mask(self):
+        start = self.full.session_start + 20*3600
+        mask = (start, start + 6*3600)
+        data = Loader(self.dir, mask=mask, manifest=True, res_dir=RES_DIR)
+        self.assertEqual(len(data._fnames), 7)
+        times = self.full.registrations.data["Time"]
+        idx = (times >= mask[0]) & (times < mask[1])
+        self.assertTrue(np.all(data.registrations.data ==
+                               self.full.registrations.data[idx]))
+
+
+class TestLoaderArchive(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                            "setup_1")
+        cls.full = Loader(path, res_dir=RES_DIR)
+        cls.dir = tempfile.mkdtemp()
+        cls.zip = os.path.join(cls.dir, "data.zip")
+        cls.tar = os.path.join(cls.dir, "data.tar.gz")
+        with zipfile.ZipFile(cls.zip, "w", zipfile.ZIP_DEFLATED) as zf:
+            with tarfile.open(cls.tar, "w:gz") as tf:
+                for fname in uf.get_filenames(path):
+                    zf.write(os.path.join(path, fname), fname)
+                    tf.add(os.path.join(path, fname), fname)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def test_zip(self):
+        data = Loader(self.zip, setup_config=self.full.setup_config,
+                      res_dir=RES_DIR)
+        self.assertTrue(np.all(data.registrations.data ==
+                               self.full.registrations.data))
+        self.assertTrue(np.all(data.visits.data == self.full.visits.data))
+
+    def test_tar(self):
+        data = Loader(self.tar, setup_config=self.full.setup_config,
+                      res_dir=RES_DIR)
+        self.assertTrue(np.all(data.registrations.data ==
+                               self.full.registrations.data))
+
+    def test_res_dir(self):
+        data = Loader(self.zip, setup_config=self.full.setup_config,
+                      res_dir="Results_zip", add_date=False)
+        self.assertEqual(data.res_dir, os.path.join(self.dir,
+                                                    "Results_zip"))
+
+
+class TestLoaderMsec(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                            "setup_1")
+        cls.float = Loader(path, res_dir=RES_DIR)
+        cls.msec = Loader(path, msec_timestamps=True, res_dir=RES_DIR)
+
+    def test_registrations(self):
+        data = self.msec.registrations.data
+        self.assertEqual(data.dtype["Time"], np.int64)
+        expected = uf.convert_times(self.float.registrations.data)
+        self.assertTrue(np.all(data == expected))
+
+    def test_times(self):
+        mouse = self.float.mice[0]
+        self.assertTrue(np.allclose(self.msec.get_times(mouse),
+                                    self.float.get_times(mouse),
+                                    rtol=0, atol=1e-6))
+
+    def test_infinite_bounds(self):
+        mouse = self.float.mice[0]
+        self.assertEqual(len(self.msec.get_times(mouse, -np.inf, np.inf)),
+                         len(self.float.get_times(mouse, -np.inf, np.inf)))
+        self.assertEqual(len(self.msec.get_starttimes(mouse, -np.inf,
+                                                      np.inf)),
+                         len(self.float.get_starttimes(mouse)))
+
+    def test_session(self):
+        self.assertEqual(self.msec.session_start, self.float.session_start)
+        self.assertEqual(self.msec.session_end, self.float.session_end)
+
+    def test_visits(self):
+        visits = self.msec.visits.data
+        expected = self.float.visits.data
+        self.assertEqual(visits.dtype["AbsStartTimecode"], np.int64)
+        self.assertEqual(len(visits), len(expected))
+        self.assertTrue(np.all(visits["Address"] == expected["Address"]))
+        self.assertTrue(np.all(visits["AbsStartTimecode"] ==
+                               uf.sec_to_msec(expected["AbsStartTimecode"])))
+
+    def test_visit_durations(self):
+        mouse = self.float.mice[0]
+        self.assertTrue(np.allclose(self.msec.get_visit_durations(mouse),
+                                    self.float.get_visit_durations(mouse),
+                                    rtol=0, atol=1e-6))
+
+    def test_mask(self):
+        start = self.float.session_start + 3600
+        self.msec.mask_data(start, start + 3600)
+        self.float.mask_data(start, start + 3600)
+        mouse = self.float.mice[0]
+        self.assertEqual(len(self.msec.get_starttimes(mouse)),
+                         len(self.float.get_starttimes(mouse)))
+        self.msec.unmask_data()
+        self.float.unmask_data()
+
+    def test_snapshot(self):
+        fname = os.path.join(tempfile.mkdtemp(), "snapshot.npz")
+        self.msec.save_snapshot(fname)
+        new = Loader.from_snapshot(fname)
+        shutil.rmtree(os.path.dirname(fname))
+        self.assertTrue(new.registrations.msec)
+        self.assertTrue(np.all(new.visits.data == self.msec.visits.data))
+
+
+class TestChunkedLoader(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.path = sample_data
+        cls.timeline = Timeline(cls.path)
+        phases = utils.filter_dark_light(cls.timeline.sections())
+        start = cls.timeline.get_time_from_epoch(phases[0])[0]
+        cls.res_dir = tempfile.mkdtemp()
+        cls.full = Loader(cls.path, res_dir=cls.res_dir)
+        cls.data = ChunkedLoader(cls.path, res_dir=cls.res_dir, start=start)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.res_dir)
+
+    def test_mice(self):
+        self.assertEqual(self.data.mice, self.full.mice)
+
+    def test_session(self):
+        self.assertEqual(self.data.session_start, self.full.session_start)
+        self.assertEqual(self.data.session_end, self.full.session_end)
+
+    def test_chunk_visits(self):
+        margin = self.data.margin
+        visits = self.full.visits.data
+        n_chunks = 0
+        for chunk in self.data:
+            n_chunks += 1
+            start = chunk.chunk_start - margin
+            end = chunk.chunk_end + margin
+            out = chunk.visits.data
+            out = out[(out["AbsStartTimecode"] >= start) &
+                      (out["AbsStartTimecode"] < end)]
+            expected = visits[(visits["AbsStartTimecode"] >= start) &
+                              (visits["AbsStartTimecode"] < end)]
+            self.assertTrue(np.all(np.sort(out) == np.sort(expected)))
+        self.assertEqual(n_chunks, 4)
+
+    def test_mask_data(self):
+        t_start = self.data.start + 30*3600
+        self.data.mask_data(t_start, t_start + 3600)
+        self.full.mask_data(t_start, t_start + 3600)
+        for mouse in self.full.mice:
+            self.assertEqual(self.data.get_starttimes(mouse),
+                             self.full.get_starttimes(mouse))
+        self.assertTrue(self.data.chunk_start <= t_start)
+        self.full.unmask_data()
+
+    def test_activity(self):
+        out = get_activity(self.data, self.timeline, 3600,
+                           res_dir=self.res_dir)
+        expected = get_activity(self.full, self.timeline, 3600,
+                                res_dir=self.res_dir)
+        self.assertEqual(out, expected)
+
+    def test_activity_all(self):
+        out = get_activity(self.data, self.timeline, "ALL",
+                           res_dir=self.res_dir)
+        expected = get_activity(self.full, self.timeline, "ALL",
+                                res_dir=self.res_dir)
+        self.assertEqual(out, expected)
+
+    def test_incohort_sociability(self):
+        phases, total_time, data, keys = utils.prepare_binned_data(
+            self.data, self.timeline, 3600, self.full.mice, lazy=True)
+        phases, total_time, expected, keys = utils.prepare_binned_data(
+            self.full, self.timeline, 3600, self.full.mice)
+        for phase in keys[0]:
+            self.assertEqual(data[phase], expected[phase])
+
+
+class TestChunkedLoaderShortChunks(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "weird_short")
+        cls.full = Loader(path, res_dir=RES_DIR)
+        cls.data = ChunkedLoader(path, chunk_size=20, margin=1,
+                                 res_dir=RES_DIR)
+
+    def test_partial_minutes(self):
+        t_start = self.full.session_start
+        while t_start < self.full.session_end:
+            for mouse in self.full.mice:
+                self.assertEqual(self.data.get_times(mouse, t_start,
+                                                     t_start + 20),
+                                 self.full.get_times(mouse, t_start,
+                                                     t_start + 20))
+            t_start += 20
+
+    def test_whole_session(self):
+        for mouse in self.full.mice:
+            self.assertEqual(utils.get_times_antennas(self.data, mouse,
+                                                      0, -1),
+                             utils.get_times_antennas(self.full, mouse,
+                                                      0, -1))
+
+    def test_empty_chunk(self):
+        t_start = self.full.session_end + 3600
+        self.data.mask_data(t_start, t_start + 20)
+        self.assertTrue(self.data.chunk_empty)
+        self.assertEqual(self.data.get_times(self.full.mice), [])
+        self.assertEqual(self.data.get_visits(t_start=t_start,
+                                              t_end=t_start + 20), [])
+        self.data.unmask_data()
+
+
+class TestView(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.timeline = Timeline(sample_data)
+        cls.res_dir = tempfile.mkdtemp()
+        cls.data = Loader(sample_data, res_dir=cls.res_dir)
+        cls.mice = cls.data.mice[:5]
+        cls.view = cls.data.view(mice=cls.mice)
+        phases = utils.filter_dark_light(cls.timeline.sections())
+        cls.phase = cls.timeline.get_time_from_epoch(phases[2])
+        cls.window = cls.data.view(t_start=cls.phase[0] - 12*3600,
+                                   t_end=cls.phase[1] + 12*3600)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.res_dir)
+
+    def test_mice(self):
+        self.assertEqual(self.view.mice, self.mice)
+        self.assertEqual(self.view.get_mice(), self.mice)
+
+    def test_attributes(self):
+        self.assertIs(self.view.setup_config, self.data.setup_config)
+        self.assertEqual(self.view.cages, self.data.cages)
+        self.assertIsInstance(self.view, Loader)
+
+    def test_shared(self):
+        for view in [self.view, self.window]:
+            for key in ["Time", "Tag"]:
+                self.assertTrue(np.shares_memory(
+                    view.registrations.columns[key],
+                    self.data.registrations.columns[key]))
+            self.assertTrue(np.shares_memory(
+                view.visits.columns["AbsStartTimecode"],
+                self.data.visits.columns["AbsStartTimecode"]))
+
+    def test_registrations(self):
+        data = self.data.registrations.data
+        self.assertTrue(np.all(self.view.registrations.data ==
+                               data[np.isin(data["Tag"], self.mice)]))
+
+    def test_other_mice(self):
+        self.assertEqual(self.view.get_times(self.data.mice[-1]), [])
+        self.assertEqual(self.view.get_visits(self.data.mice[-1]), [])
+
+    def test_window(self):
+        times = self.window.get_times(self.window.mice)
+        self.assertTrue(self.phase[0] - 12*3600 <= times[0])
+        self.assertTrue(times[-1] < self.phase[1] + 12*3600)
+        self.assertEqual(self.window.session_start, times[0])
+        self.assertEqual(self.window.session_end, times[-1])
+
+    def test_empty(self):
+        view = self.data.view(t_start=self.data.session_end + 3600)
+        self.assertIsNone(view.session_start)
+        self.assertIsNone(view.session_end)
+        self.assertEqual(view.get_visits(), [])
+        self.assertEqual(utils.get_times_antennas(view, self.mice[0], 0, -1),
+                         ([], []))
+
+    def test_window_prepare_data(self):
+        self.assertEqual(utils.prepare_data(self.window, self.data.mice,
+                                            self.phase),
+                         utils.prepare_data(self.data, self.data.mice,
+                                            self.phase))
+
+    def test_nested(self):
+        view = self.view.view(mice=self.mice[1:3] + self.data.mice[-1:],
+                              t_start=self.phase[0], t_end=self.phase[1])
+        self.assertEqual(view.mice, self.mice[1:3])
+        self.assertEqual(view.get_times(self.data.mice[-1]), [])
+        self.assertEqual(view.get_times(self.mice[1]),
+                         self.data.get_times(self.mice[1], *self.phase))
+
+    def test_activity(self):
+        out = get_activity(self.view, self.timeline, 3600,
+                           res_dir=self.res_dir)
+        expected = get_activity(self.data, self.timeline, 3600,
+                                res_dir=self.res_dir)
+        for cage in out:
+            for i in out[cage]:
+                for phase in out[cage][i]:
+                    self.assertEqual(sorted(out[cage][i][phase].keys()),
+                                     sorted(self.mice))
+                    for mouse in self.mice:
+                        self.assertEqual(out[cage][i][phase][mouse],
+                                         expected[cage][i][phase][mouse])
+
+
+class TestRefresh(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                            "setup_1")
+        cls.dir = tempfile.mkdtemp()
+        fnames = sorted(uf.get_filenames(path))
+        for fname in os.listdir(path):
+            if fname not in fnames[30:] and\
+               os.path.isfile(os.path.join(path, fname)):
+                shutil.copy(os.path.join(path, fname), cls.dir)
+        cls.data = Loader(cls.dir, res_dir=RES_DIR)
+        cls.no_new_files = cls.data.refresh()
+        for fname in fnames[30:]:
+            shutil.copy(os.path.join(path, fname), cls.dir)
+        cls.new_files = cls.data.refresh()
+        cls.expected = Loader(path, res_dir=RES_DIR)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def test_no_new_files(self):
+        self.assertEqual(self.no_new_files, [])
+
+    def test_new_files(self):
+        self.assertEqual(len(self.new_files), 41)
+        self.assertEqual(sorted(self.data._fnames),
+                         sorted(self.expected._fnames))
+
+    def test_registrations(self):
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               self.expected.registrations.data))
+
+    def test_visits(self):
+        self.assertTrue(np.all(self.data.visits.data ==
+                               self.expected.visits.data))
+
+    def test_session(self):
+        self.assertEqual(self.data.session_start,
+                         self.expected.session_start)
+        self.assertEqual(self.data.session_end, self.expected.session_end)
+
+    def test_mice(self):
+        self.assertEqual(self.data.mice, self.expected.mice)
+
+
+class TestRefreshMasked(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                            "setup_1")
+        cls.dir = tempfile.mkdtemp()
+        fnames = sorted(uf.get_filenames(path))
+        for fname in os.listdir(path):
+            if fname not in fnames[30:] and\
+               os.path.isfile(os.path.join(path, fname)):
+                shutil.copy(os.path.join(path, fname), cls.dir)
+        cls.data = Loader(cls.dir, res_dir=RES_DIR)
+        cls.mask = (cls.data.session_start, cls.data.session_start + 3600)
+        cls.data.mask_data(*cls.mask)
+        for fname in fnames[30:]:
+            shutil.copy(os.path.join(path, fname), cls.dir)
+        cls.data.refresh()
+        cls.expected = Loader(path, res_dir=RES_DIR)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def test_mask(self):
+        self.assertEqual(self.data.mask, self.mask)
+        self.assertEqual(self.data.get_times(self.data.mice),
+                         self.expected.get_times(self.expected.mice,
+                                                 *self.mask))
+
+    def test_unmasked(self):
+        self.data.unmask_data()
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               self.expected.registrations.data))
+        self.assertTrue(np.all(self.data.visits.data ==
+                               self.expected.visits.data))
+        self.assertEqual(self.data.session_end, self.expected.session_end)
+
+
+class TestRefreshGrowingFile(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                            "setup_1")
+        cls.dir = tempfile.mkdtemp()
+        cls.expected_dir = tempfile.mkdtemp()
+        fnames = sorted(uf.get_filenames(path))
+        for fname in os.listdir(path):
+            if fname not in fnames[10:] and\
+               os.path.isfile(os.path.join(path, fname)):
+                shutil.copy(os.path.join(path, fname), cls.dir)
+                shutil.copy(os.path.join(path, fname), cls.expected_dir)
+        with open(os.path.join(path, fnames[9])) as f:
+            lines = f.readlines()
+        with open(os.path.join(cls.dir, fnames[9]), "w") as f:
+            f.writelines(lines[:len(lines)//2])
+        cls.data = Loader(cls.dir, res_dir=RES_DIR)
+        cls.rows = len(cls.data.registrations)
+        with open(os.path.join(cls.dir, fnames[9]), "a") as f:
+            f.writelines(lines[len(lines)//2:])
+        cls.changed = cls.data.refresh()
+        cls.fname = fnames[9]
+        cls.expected = Loader(cls.expected_dir, res_dir=RES_DIR)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+        shutil.rmtree(cls.expected_dir)
+
+    def test_changed(self):
+        self.assertEqual(self.changed, [self.fname])
+        self.assertLess(self.rows, len(self.expected.registrations))
+
+    def test_registrations(self):
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               self.expected.registrations.data))
+
+    def test_visits(self):
+        self.assertTrue(np.all(self.data.visits.data ==
+                               self.expected.visits.data))
+
+    def test_unchanged(self):
+        self.assertEqual(self.data.refresh(), [])
+
+
+class TestSnapshot(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        path = os.path.join(data_path, "weird_very_short")
+        cls.data = Loader(path, visit_threshold=1.5, prefix="gugu",
+                          res_dir=RES_DIR)
+        cls.fname = os.path.join(cls.dir, "snapshot.npz")
+        cls.data.save_snapshot(cls.fname)
+        cls.restored = Loader.from_snapshot(cls.fname)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def test_registrations(self):
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               self.restored.registrations.data))
+
+    def test_visits(self):
+        self.assertEqual(self.data.get_visits(), self.restored.get_visits())
+
+    def test_attributes(self):
+        self.assertEqual(self.data.mice, self.restored.mice)
+        self.assertEqual(self.data.session_start, self.restored.session_start)
+        self.assertEqual(self.data.session_end, self.restored.session_end)
+        self.assertEqual(self.data.threshold, self.restored.threshold)
+        self.assertEqual(self.data.prefix, self.restored.prefix)
+        self.assertEqual(self.data.setup_config.address,
+                         self.restored.setup_config.address)
+
+    def test_uncompressed(self):
+        fname = os.path.join(self.dir, "snapshot_2.npz")
+        self.data.save_snapshot(fname, compressed=False)
+        restored = Loader.from_snapshot(fname)
+        self.assertEqual(self.data.get_visits(), restored.get_visits())
+
+
+class TestStore(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        path = os.path.join(data_path, "weird_very_short")
+        cls.data = Loader(path, visit_threshold=1.5, prefix="gugu",
+                          res_dir=RES_DIR)
+        cls.data.save_store(cls.dir)
+        cls.restored = Loader.open_store(cls.dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def test_memmap(self):
+        self.assertIsInstance(self.restored.registrations.columns["Time"],
+                              np.memmap)
+        self.assertIsInstance(self.restored.visits.columns["Tag"],
+                              np.memmap)
+
+    def test_registrations(self):
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               self.restored.registrations.data))
+
+    def test_visits(self):
+        self.assertEqual(self.data.get_visits(), self.restored.get_visits())
+
+    def test_masked_queries(self):
+        start = self.data.session_start + 600
+        self.data.mask_data(start, start + 1200)
+        self.restored.mask_data(start, start + 1200)
+        for mouse in self.data.mice:
+            self.assertEqual(self.data.get_starttimes(mouse),
+                             self.restored.get_starttimes(mouse))
+            self.assertEqual(self.data.get_antennas(mouse),
+                             self.restored.get_antennas(mouse))
+        self.data.unmask_data()
+        self.restored.unmask_data()
+
+    def test_attributes(self):
+        self.assertEqual(self.data.mice, self.restored.mice)
+        self.assertEqual(self.data.prefix, self.restored.prefix)
+        self.assertEqual(self.data.setup_config.address,
+                         self.restored.setup_config.address)
+
+
+class TestShared(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "weird_very_short")
+        cls.data = Loader(path, visit_threshold=1.5, prefix="gugu",
+                          res_dir=RES_DIR)
+        cls.handle = cls.data.share()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.handle.close()
+
+    def test_workers(self):
+        with ProcessPoolExecutor(2) as pool:
+            out = list(pool.map(shared_queries,
+                                [(self.handle, mouse)
+                                 for mouse in self.data.mice]))
+        for mouse, (times, visits) in zip(self.data.mice, out):
+            self.assertEqual(times, self.data.get_times(mouse))
+            self.assertEqual(visits, self.data.get_visits(mouse))
+
+    def test_attach(self):
+        shared = self.handle.attach()
+        self.assertIsInstance(shared, Loader)
+        self.assertEqual(shared.mice, self.data.mice)
+        self.assertEqual(shared.prefix, self.data.prefix)
+        self.assertTrue(np.all(shared.registrations.data ==
+                               self.data.registrations.data))
+        self.assertEqual(shared.get_visits(), self.data.get_visits())
+
+    def test_context_manager(self):
+        with self.data.share() as handle:
+            name = handle.visits.columns["Tag"][0]
+            shared = handle.attach()
+            self.assertEqual(len(shared.visits), len(self.data.visits))
+            del shared
+        self.assertFalse(os.path.exists(os.path.join("/dev/shm", name)))
+
+
+class TestSQLite(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.dir, "data.sqlite")
+        path = os.path.join(data_path, "weird_very_short")
+        cls.data = Loader(path, visit_threshold=1.5, prefix="gugu",
+                          res_dir=RES_DIR)
+        cls.data.save_sqlite(cls.path)
+        cls.restored = Loader.open_sqlite(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.restored.registrations.close()
+        cls.restored.visits.close()
+        shutil.rmtree(cls.dir)
+
+    def test_registrations(self):
+        self.assertTrue(np.all(self.data.registrations.data ==
+                               self.restored.registrations.data))
+
+    def test_visits(self):
+        self.assertEqual(self.data.get_visits(), self.restored.get_visits())
+
+    def test_cage_visits(self):
+        cage = self.data.cages[0]
+        t_start = self.data.session_start + 600
+        self.assertEqual(self.data.get_visits(cage=cage, t_start=t_start),
+                         self.restored.get_visits(cage=cage,
+                                                  t_start=t_start))
+
+    def test_masked_queries(self):
+        start = self.data.session_start + 600
+        self.data.mask_data(start, start + 1200)
+        self.restored.mask_data(start, start + 1200)
+        for mouse in self.data.mice:
+            self.assertEqual(self.data.get_times(mouse),
+                             self.restored.get_times(mouse))
+            self.assertEqual(self.data.get_endtimes(mouse),
+                             self.restored.get_endtimes(mouse))
+        self.data.unmask_data()
+        self.restored.unmask_data()
+
+    def test_view(self):
+        mice = self.data.mice[:2]
+        t_start = self.data.session_start + 600
+        view = self.restored.view(mice=mice, t_start=t_start)
+        expected = self.data.view(mice=mice, t_start=t_start)
+        self.assertEqual(view.mice, expected.mice)
+        self.assertEqual(view.session_start, expected.session_start)
+        self.assertEqual(view.get_visits(), expected.get_visits())
+        self.assertTrue(np.all(view.registrations.data ==
+                               expected.registrations.data))
+        nested = view.view(mice=self.data.mice[1:], t_end=t_start + 600)
+        self.assertEqual(nested.get_times(self.data.mice),
+                         self.data.get_times(self.data.mice[1:2], t_start,
+                                             t_start + 600))
+
+    def test_registration_stats(self):
+        mouse = self.data.mice[0]
+        antenna = self.data.get_antennas(mouse)[0]
+        start = self.data.session_start
+        self.assertEqual(
+            self.data.get_registration_stats(mouse, start, start + 3600,
+                                             antenna, 900),
+            self.restored.get_registration_stats(mouse, start, start + 3600,
+                                                 antenna, 900))
+
+    def test_attributes(self):
+        self.assertEqual(self.data.mice, self.restored.mice)
+        self.assertEqual(self.data.prefix, self.restored.prefix)
+        self.assertEqual(self.data.session_start,
+                         self.restored.session_start)
+
+
 class TestMerger(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         path = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided")
         cls.path1 = os.path.join(path, "setup_1")
         cls.path2 = os.path.join(path, "setup_2")
-        cls.data1 = Loader(cls.path1)
-        cls.data2 = Loader(cls.path2)
-        cls.res_dir = os.path.join(path, "results")
+        cls.data1 = Loader(cls.path1, res_dir=RES_DIR)
+        cls.data2 = Loader(cls.path2, res_dir=RES_DIR)
+        cls.res_dir = os.path.join(TMP_DIR, "results")
         config = os.path.join(path, "experiment_setup.txt")
         cls.data = Merger(config, cls.res_dir, cls.data1, cls.data2)
-        cls.original_data = Loader(sample_data)
+        cls.original_data = Loader(sample_data, res_dir=RES_DIR)
 
     def test_1(self):
         self.assertEqual(self.data.res_dir,
@@ -136,6 +904,21 @@ class TestMerger(unittest.TestCase):
         out = sorted(["cage A", "cage B", "cage C", "cage D"])
         self.assertEqual(sorted(self.data.cages), out)
 
+    def test_msec(self):
+        config = os.path.join(data_path, "BALB_VPA_data_cohort_1_divided",
+                              "experiment_setup.txt")
+        data1 = Loader(self.path1, msec_timestamps=True, res_dir=RES_DIR)
+        data2 = Loader(self.path2, msec_timestamps=True, res_dir=RES_DIR)
+        merged = Merger(config, self.res_dir, data1, data2)
+        self.assertTrue(merged.registrations.msec)
+        registrations = uf.convert_times(merged.registrations.data,
+                                         msec=False)
+        self.assertTrue(np.all(registrations ==
+                               self.data.registrations.data))
+        self.assertEqual(len(merged.visits.data), len(self.data.visits.data))
+        mixed = Merger(config, self.res_dir, data1, self.data2)
+        self.assertFalse(mixed.registrations.msec)
+
     def test_incohort_sociability_1(self):
         config = Timeline(sample_data)
         out_1 = get_incohort_sociability(self.data, config, 3600)
@@ -166,6 +949,16 @@ class TestMerger(unittest.TestCase):
         out_2 = get_activity(self.original_data, config, 24*3600)
         self.assertEqual(out_1, out_2)
 
+    def test_snapshot(self):
+        directory = tempfile.mkdtemp()
+        fname = os.path.join(directory, "merged.npz")
+        self.data.save_snapshot(fname)
+        restored = Merger.from_snapshot(fname)
+        shutil.rmtree(directory)
+        self.assertTrue(isinstance(restored, Merger))
+        self.assertEqual(restored.cages, self.data.cages)
+        self.assertEqual(restored.get_visits(), self.data.get_visits())
+
     def get_dynamic_interactions(self):
         config = Timeline(sample_data)
         out_1 = get_dynamic_interactions(self.data, config, N=1, seed=1)
@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
 
+import shutil
+import tempfile
 import unittest
 import os
 from pyEcoHAB import single_antenna_registrations as sar
@@ -10,11 +12,19 @@ from pyEcoHAB import Timeline
 from pyEcoHAB import data_path
 
 
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
 class TestExecution(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         sample_data = os.path.join(data_path, "weird_short")
-        cls.data = Loader(sample_data)
+        cls.data = Loader(sample_data, res_dir=RES_DIR)
         cls.config = Timeline(sample_data)
 
     def test1(self):
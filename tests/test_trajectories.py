@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
 
+import shutil
+import tempfile
 import unittest
 import os
 import numpy as np
@@ -11,6 +13,14 @@ from pyEcoHAB import Timeline
 from pyEcoHAB import data_path
 
 
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
 class TestSingleMouseAntennaTransitions(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -36,7 +46,7 @@ class TestAntennaTransitions(unittest.TestCase):
     def setUpClass(cls):
         path = os.path.join(data_path, "weird_very_short_3_mice")
         cls.timeline = Timeline(path)
-        cls.data = Loader(path)
+        cls.data = Loader(path, res_dir=RES_DIR)
         cls.expected = {"ALL": {0.0: {}}}
         cls.expected_dark = {"1 dark": {0.0: {}},
                              "1 light": {0.0: {}}}
@@ -243,7 +253,7 @@ class TestGetAntennaTransitions(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         path = os.path.join(data_path, "weird_very_short_3_mice")
-        cls.data = Loader(path)
+        cls.data = Loader(path, res_dir=RES_DIR)
         cls.timeline = Timeline(path)
 
     def test_all_phases(self):
@@ -261,7 +271,7 @@ class TestTrainsOfSingleAntennaRegistrations(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         path = os.path.join(data_path, "weird_very_short_3_mice")
-        cls.data = Loader(path)
+        cls.data = Loader(path, res_dir=RES_DIR)
         cls.dur, cls.count = tr.get_registration_trains(cls.data)
         cls.pred_dur = {"ALL": {0: {}}}
         cls.pred_count = {"ALL": {0: {}}}
@@ -1,12 +1,23 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 #!/usr/bin/env python
 from __future__ import print_function, division, absolute_import
+import os
+import shutil
+import tempfile
 import unittest
 from pyEcoHAB import tube_dominance as tubed
 from pyEcoHAB import SetupConfig, Loader, Timeline
 from pyEcoHAB import data_path, sample_data
 
 
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
 class TestCheckTwoMice(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -197,7 +208,7 @@ class TestCheckMousePushingOut(unittest.TestCase):
 
 class TestExecution(unittest.TestCase):
     def test(self):
-        data = Loader(sample_data)
+        data = Loader(sample_data, res_dir=RES_DIR)
         config = Timeline(sample_data)
         tubed.get_tube_dominance(data, config)
 
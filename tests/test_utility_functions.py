@@ -1,6 +1,8 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 #!/usr/bin/env python
 # encoding: utf-8
+import shutil
+import tempfile
 import os
 import unittest
 import random
@@ -16,6 +18,14 @@ from pyEcoHAB import Timeline
 from pyEcoHAB import SetupConfig
 
 
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
 SAME_PIPE = {"1": ["1", "2"],
              "2": ["1", "2"],
              "3": ["3", "4"],
@@ -1428,7 +1438,7 @@ class TestGetEHSData(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         path = os.path.join(data_path, "weird_short")
-        cls.data = Loader(path)
+        cls.data = Loader(path, res_dir=RES_DIR)
         cls.t1 = 1286701470+7200
         cls.t2 = 1286701580+7200
         cls.m_1_a, cls.s1, cls.e1 = uf.get_ecohab_data_with_margin(cls.data,
@@ -1466,7 +1476,7 @@ class TestPrepareData(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         path = os.path.join(data_path, "weird_short")
-        cls.data = Loader(path)
+        cls.data = Loader(path, res_dir=RES_DIR)
         cls.t1 = calendar.timegm(uf.to_struck("10.10.201011:04:30"))
         cls.t2 = calendar.timegm(uf.to_struck("10.10.201011:06:20"))
         data1 = uf.prepare_data(cls.data, "mouse_1",
@@ -1485,7 +1495,7 @@ class TestPrepareData(unittest.TestCase):
                                        [cls.t1, cls.t2])["mouse_2"]
 
         path2 = os.path.join(data_path, "weird_3_mice")
-        data_longer = Loader(path2)
+        data_longer = Loader(path2, res_dir=RES_DIR)
 
         cls.data_longer = uf.prepare_data(data_longer, ["mouse_1",
                                                         "mouse_2"],
@@ -1544,6 +1554,145 @@ class TestPrepareData(unittest.TestCase):
         self.assertEqual(sum(data_mouse2), 0)
 
 
+class TestBinPlan(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        path = os.path.join(data_path, "weird_short")
+        cls.data = Loader(path, res_dir=RES_DIR)
+        cls.timeline = Timeline(path)
+        cls.start = calendar.timegm(uf.to_struck("10.10.201011:00"))
+
+    def test_whole_phase(self):
+        plan = uf.BinPlan(self.timeline, "whole_phase")
+        self.assertEqual(plan.phases, ["1 dark", "1 light"])
+        self.assertEqual(plan.bins["1 light"],
+                         {0: (self.start + 1800, self.start + 3600)})
+        self.assertEqual(plan.labels["1 dark"], [0])
+
+    def test_all(self):
+        plan = uf.BinPlan(self.timeline, "ALL")
+        self.assertEqual(plan.phases, ["ALL"])
+        self.assertEqual(plan.times["ALL"], (self.start, self.start + 3600))
+
+    def test_bins(self):
+        plan = uf.BinPlan(self.timeline, 600)
+        self.assertEqual(plan.labels["1 dark"], [0., 600., 1200.])
+        self.assertEqual(plan.edges("1 light").tolist(),
+                         [self.start + 1800 + i*600 for i in range(4)])
+
+    def test_clip(self):
+        plan = uf.BinPlan(self.timeline, 1000)
+        self.assertEqual(list(plan.bins["1 dark"].values()),
+                         [(self.start, self.start + 1000),
+                          (self.start + 1000, self.start + 1800)])
+        plan = uf.BinPlan(self.timeline, 1000, clip=False)
+        self.assertEqual(plan.window("1 dark"),
+                         (self.start, self.start + 2000))
+
+    def test_long_bins(self):
+        plan = uf.BinPlan(self.timeline, 2400)
+        self.assertEqual(plan.phases, ["1_x", "2_x"])
+        self.assertEqual(plan.times["2_x"],
+                         (self.start + 2400, self.start + 4800))
+        self.assertEqual(plan.labels["2_x"], [0.])
+
+    def test_index(self):
+        plan = uf.BinPlan(self.timeline, 300)
+        for phase in plan.phases:
+            index = plan.index(self.data, self.data.mice, phase)
+            visits = plan.index(self.data, self.data.mice, phase,
+                                visits=True)
+            for mouse in self.data.mice:
+                times = self.data.get_times(mouse, *plan.window(phase))
+                for i, time in enumerate(plan.bins[phase].values()):
+                    start, stop = index[mouse][0][i], index[mouse][1][i]
+                    self.assertEqual(times[start:stop],
+                                     self.data.get_times(mouse, *time))
+                    self.assertEqual(visits[mouse][1][i] -
+                                     visits[mouse][0][i],
+                                     len(self.data.get_starttimes(mouse,
+                                                                  *time)))
+
+    def test_index_cached(self):
+        plan = uf.BinPlan(self.timeline, 300)
+        phase = plan.phases[0]
+        mouse = self.data.mice[0]
+        index = plan.index(self.data, [mouse], phase)
+        self.assertIs(plan.index(self.data, self.data.mice, phase)[mouse],
+                      index[mouse])
+        other = self.data.view(mice=self.data.mice[1:])
+        self.assertEqual(len(plan.index(other, [mouse], phase)[mouse][0]),
+                         len(index[mouse][0]))
+        self.assertIsNot(plan.index(other, [mouse], phase)[mouse],
+                         index[mouse])
+
+    def test_index_refresh(self):
+        path = os.path.join(data_path, "weird_short")
+        new_dir = os.path.join(TMP_DIR, "weird_short_growing")
+        os.makedirs(new_dir)
+        fname = "20101010_110000.txt"
+        shutil.copy(os.path.join(path, "config.txt"), new_dir)
+        with open(os.path.join(path, fname)) as f:
+            lines = f.readlines()
+        with open(os.path.join(new_dir, fname), "w") as f:
+            f.writelines(lines[:len(lines)//2])
+        data = Loader(new_dir, res_dir=RES_DIR)
+        plan = uf.BinPlan(self.timeline, 300)
+        phase = plan.phases[-1]
+        index = plan.index(data, data.mice, phase)
+        with open(os.path.join(new_dir, fname), "a") as f:
+            f.writelines(lines[len(lines)//2:])
+        data.refresh()
+        expected = uf.BinPlan(self.timeline, 300).index(self.data,
+                                                        self.data.mice,
+                                                        phase)
+        refreshed = plan.index(data, data.mice, phase)
+        for mouse in data.mice:
+            self.assertEqual(refreshed[mouse][1].tolist(),
+                             expected[mouse][1].tolist())
+        self.assertNotEqual([index[mouse][1].tolist()
+                             for mouse in index],
+                            [refreshed[mouse][1].tolist()
+                             for mouse in index])
+
+    def test_get_bin_plan(self):
+        plan = uf.get_bin_plan(self.timeline, 600, threshold=12*3600)
+        self.assertIs(uf.get_bin_plan(self.timeline, 600, plan,
+                                      threshold=12*3600), plan)
+
+    def test_get_bin_plan_binsize(self):
+        plan = uf.BinPlan(self.timeline, 600)
+        self.assertRaises(Exception, uf.get_bin_plan, self.timeline,
+                          300, plan)
+
+    def test_get_bin_plan_options(self):
+        plan = uf.BinPlan(self.timeline, 1000)
+        self.assertRaises(Exception, uf.get_bin_plan, self.timeline,
+                          1000, plan, clip=False)
+
+    def test_prepare_data_in_bins(self):
+        plan = uf.BinPlan(self.timeline, 300)
+        for phase in plan.phases:
+            data = uf.prepare_data_in_bins(self.data, self.data.mice,
+                                           plan, phase)
+            for label, time in plan.bins[phase].items():
+                self.assertEqual(data[label],
+                                 uf.prepare_data(self.data, self.data.mice,
+                                                 time))
+
+    def test_prepare_registrations_in_bins(self):
+        plan = uf.BinPlan(self.timeline, 300)
+        for phase in plan.phases:
+            data = uf.prepare_registrations_in_bins(self.data,
+                                                    self.data.mice,
+                                                    plan, phase)
+            for label, time in plan.bins[phase].items():
+                self.assertEqual(data[label],
+                                 uf.prepare_registrations(self.data,
+                                                          self.data.mice,
+                                                          *time))
+
+
 class TestGetAnimalPositions(unittest.TestCase):
     def test_threshold(self):
         out = uf.get_animal_position([2, 3], ["2", "2"], "mouse_1", 2,
@@ -1724,6 +1873,38 @@ class TestGetAnimalPositions(unittest.TestCase):
         self.assertEqual(o1, o2)
 
 
+class TestEncodeAntennas(unittest.TestCase):
+    def setUp(self):
+        self.codes = dict((str(i), i - 1) for i in range(1, 9))
+
+    def test_positions(self):
+        random.seed(0)
+        antennas = [random.choice(list(ADDRESS.keys())) for i in range(200)]
+        times = sorted([random.uniform(0, 1000) for i in range(200)])
+        config = uf.encode_antennas(self.codes, SAME_PIPE, SAME_ADDRESS,
+                                    OPPOSITE_PIPE, ADDRESS, SURROUNDING,
+                                    ADDRESS_NON_ADJACENT, ["8"])
+        out = uf.get_animal_position(times,
+                                     [self.codes[a] for a in antennas],
+                                     "mouse_1", 2, *config)
+        expected = uf.get_animal_position(times, antennas, "mouse_1", 2,
+                                          SAME_PIPE, SAME_ADDRESS,
+                                          OPPOSITE_PIPE, ADDRESS,
+                                          SURROUNDING, ADDRESS_NON_ADJACENT,
+                                          ["8"])
+        self.assertEqual(out, expected)
+
+    def test_missing_antennas(self):
+        codes = {"1": 0, "3": 1}
+        config = uf.encode_antennas(codes, SAME_PIPE, SAME_ADDRESS,
+                                    OPPOSITE_PIPE, ADDRESS, SURROUNDING,
+                                    ADDRESS_NON_ADJACENT, ["8"])
+        self.assertEqual(config[0], {0: [0], 1: [1]})
+        self.assertEqual(config[3], {0: "cage A", 1: "cage B"})
+        self.assertEqual(config[4], {(0, 1): "cage B"})
+        self.assertEqual(config[6], [])
+
+
 class TestDictToArray2D(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -1839,7 +2020,7 @@ class TestPrepareBinnedData(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         path = os.path.join(data_path, "weird_short")
-        cls.data = Loader(path)
+        cls.data = Loader(path, res_dir=RES_DIR)
         cls.config = Timeline(path)
 
         cls.all_phases, cls.all_total_time,\
@@ -1879,7 +2060,7 @@ class TestPrepareBinnedData(unittest.TestCase):
                                                         900, ["mouse_1"])
 
         path = os.path.join(data_path, "weird_short_3_mice")
-        cls.data2 = Loader(path)
+        cls.data2 = Loader(path, res_dir=RES_DIR)
         cls.config2 = Timeline(path)
         cls.phases_24h_bins, cls.total_time_24h_bins,\
             cls.data24h_b, cls.keys24h_b = uf.prepare_binned_data(cls.data2,
@@ -1890,6 +2071,18 @@ class TestPrepareBinnedData(unittest.TestCase):
     def test_all_phases(self):
         self.assertEqual(self.all_phases, ["ALL"])
 
+    def test_eager(self):
+        self.assertIsInstance(self.data_900s_bins, OrderedDict)
+        self.assertIsInstance(self.whole_data, OrderedDict)
+
+    def test_lazy(self):
+        data = uf.prepare_binned_data(self.data, self.config, 900,
+                                      ["mouse_1"], lazy=True)[2]
+        self.assertIsInstance(data, uf.PhaseData)
+        self.assertEqual(list(data.keys()), list(self.data_900s_bins.keys()))
+        for phase in data:
+            self.assertEqual(data[phase], self.data_900s_bins[phase])
+
     def test_all_time(self):
         time_dict = {"ALL": {0: 3600}}
         self.assertEqual(self.all_total_time, time_dict)
@@ -2061,7 +2254,7 @@ class TestPrepareRegistrations(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         path = os.path.join(data_path, "weird_short_3_mice")
-        data = Loader(path)
+        data = Loader(path, res_dir=RES_DIR)
         config = Timeline(path)
         times = config.get_time_from_epoch("1 dark")
         t_start = times[-1] - 3600/3*2
@@ -2084,7 +2277,7 @@ class TestPrepareBinnedRegistrations(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         path = os.path.join(data_path, "weird_short_3_mice")
-        cls.data = Loader(path)
+        cls.data = Loader(path, res_dir=RES_DIR)
         cls.config = Timeline(path)
         cls.out_all = uf.get_registrations_bins(cls.data,
                                                 cls.config,
@@ -1,5 +1,7 @@
 # SPDX-License-Identifier: LGPL-2.1-or-later
 from __future__ import print_function, division, absolute_import
+import shutil
+import tempfile
 import random
 import unittest
 import os
@@ -11,6 +13,14 @@ from pyEcoHAB import sample_data, data_path
 from pyEcoHAB import SetupConfig
 
 
+TMP_DIR = tempfile.mkdtemp()
+RES_DIR = os.path.join(TMP_DIR, "Results")
+
+
+def tearDownModule():
+    shutil.rmtree(TMP_DIR)
+
+
 try:
     basestring
 except NameError:
@@ -325,7 +335,7 @@ class TestIntervalGeneration(unittest.TestCase):
 class TestExecution(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
-        cls.data = Loader(sample_data)
+        cls.data = Loader(sample_data, res_dir=RES_DIR)
         cls.config = Timeline(sample_data)
         cls.uneven = Timeline(data_path, "uneven_phases.txt")
 
@@ -343,8 +353,7 @@ class TestExecution(unittest.TestCase):
     def test_ALL(self):
         fol.get_dynamic_interactions(self.data, self.config, 1,
                                      binsize="ALL",
-                                     res_dir=os.path.join(self.data.path,
-                                                          "Resu2"),
+                                     res_dir=os.path.join(TMP_DIR, "Resu2"),
                                      save_distributions=True,
                                      save_figures=True,
                                      return_median=True, delimiter=";",
@@ -354,8 +363,7 @@ class TestExecution(unittest.TestCase):
     def test_short_2(self):
         fol.get_dynamic_interactions(self.data, self.config, 1,
                                      binsize=4800,
-                                     res_dir=os.path.join(self.data.path,
-                                                          "Resu2"),
+                                     res_dir=os.path.join(TMP_DIR, "Resu2"),
 
                                      save_distributions=True,
                                      save_figures=True,